@@ -0,0 +1,64 @@
+"""Compare ASCII and binary REAL,64 fetches from the E4980A.
+
+Runs AgilentSpectrometer.measure_list against the simulated E4980A from
+lcd_simulators, which builds its reply in whichever format :FORM:DATA
+selected and is decoded with the same pyvisa routines used by a real
+resource. Latency is switched off, so CPU time is the host side cost of a
+fetch (plus the simulator building the reply, the same for every run of a
+format). The time the meter spends formatting and the bus spends transferring
+the reply aren't modelled, the reply size in bytes shows what the link has
+to carry.
+
+    python benchmarks/bench_data_transfer.py --points 1 51 201 --repeats 50
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# runnable from a checkout without installing the package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from lcdielectrics.lcd_instruments import AgilentSpectrometer  # noqa: E402
+from lcdielectrics.lcd_scpi import ScpiCache  # noqa: E402
+from lcdielectrics.lcd_simulators import SimulatedE4980A  # noqa: E402
+
+
+class BenchSpectrometer(AgilentSpectrometer):
+    def initialise(self, address: str) -> None:
+        self.spectrometer = SimulatedE4980A(latency_scale=0.0, seed=0)
+        self.scpi = ScpiCache(self.spectrometer)
+        self.reset_and_clear()
+
+
+def bench(data_format: str, n_points: int, repeats: int) -> tuple[int, float]:
+    # bytes in one reply and CPU time (s) per fetch
+    spectrometer = BenchSpectrometer("SIM", data_format=data_format)
+    freq_list = np.logspace(np.log10(20), np.log10(2e6), n_points)
+    spectrometer.set_freq_list(freq_list)
+
+    cpu_start = time.process_time()
+    for _ in range(repeats):
+        spectrometer.measure_list("CPD", n_points)
+    cpu = (time.process_time() - cpu_start) / repeats
+    return len(spectrometer.spectrometer.fetch()), cpu
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, nargs="+", default=[1, 51, 201])
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'format':>8} {'bytes':>10} {'cpu (ms)':>12}")
+    for n_points in args.points:
+        for data_format in ["ASCII", "REAL"]:
+            n_bytes, cpu = bench(data_format, n_points, args.repeats)
+            print(f"{n_points:>8} {data_format:>8} {n_bytes:>10} {cpu * 1e3:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
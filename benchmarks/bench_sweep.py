@@ -0,0 +1,342 @@
+"""End-to-end sweep benchmark against the simulated instruments.
+
+Starts each run with start_measurement and lets the MeasurementSequencer
+thread drive it while handle_measurement_status is called as the GUI loop
+does (with a DearPyGui context but no viewport), for each of the four
+OutputType layouts. For every run it reports points per hour, time per
+point, how much of that was instrument time versus software overhead, the
+time spent in make_excel and the JSON dump (on the export worker thread),
+and peak memory. The simulated instruments wait out their modelled latency
+and measurement time (--latency-scale 0 skips the waits and only times the
+software). Results are saved to benchmarks/results (not tracked by git) or
+--results-dir, so runs from different versions can be compared.
+
+    python benchmarks/bench_sweep.py --size small
+    python benchmarks/bench_sweep.py --size large --max-points 0
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import dearpygui.dearpygui as dpg
+import numpy as np
+import psutil
+
+# runnable from a checkout without installing the package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import lcdielectrics.lcd_export as lcd_export  # noqa: E402
+import lcdielectrics.lcd_queue as lcd_queue  # noqa: E402
+import lcdielectrics.lcd_sequencer as lcd_sequencer  # noqa: E402
+import lcdielectrics.lcd_utils as lcd_utils  # noqa: E402
+from lcdielectrics.lcd_dataclasses import (  # noqa: E402
+    OutputType,
+    Status,
+    lcd_instruments,
+    lcd_state,
+)
+from lcdielectrics.lcd_simulators import (  # noqa: E402
+    SimulatedAgilentSpectrometer,
+    SimulatedLinkamHotstage,
+    SimulatedRig,
+    set_simulated_rig,
+)
+from lcdielectrics.lcd_ui import lcd_ui  # noqa: E402
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# (temperatures, frequencies, voltages) for each layout and size
+SIZES = {
+    "small": {
+        OutputType.SINGLE_VOLT_FREQ: (10, 1, 1),
+        OutputType.SINGLE_VOLT: (3, 20, 1),
+        OutputType.SINGLE_FREQ: (3, 1, 20),
+        OutputType.MULTI_VOLT_FREQ: (2, 10, 5),
+    },
+    "medium": {
+        OutputType.SINGLE_VOLT_FREQ: (50, 1, 1),
+        OutputType.SINGLE_VOLT: (10, 50, 1),
+        OutputType.SINGLE_FREQ: (10, 1, 50),
+        OutputType.MULTI_VOLT_FREQ: (5, 20, 10),
+    },
+    "large": {
+        OutputType.SINGLE_VOLT_FREQ: (100, 1, 1),
+        OutputType.SINGLE_VOLT: (100, 100, 1),
+        OutputType.SINGLE_FREQ: (100, 1, 50),
+        OutputType.MULTI_VOLT_FREQ: (100, 100, 50),
+    },
+}
+
+
+class Timed:
+    # wraps a function and accumulates the time spent in it
+    def __init__(self, func) -> None:
+        self.func = func
+        self.calls = 0
+        self.total = 0.0
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.total += time.perf_counter() - start
+            self.calls += 1
+
+
+class TimedJson:
+    def __init__(self) -> None:
+        self.dump = Timed(json.dump)
+
+    def __getattr__(self, name):
+        return getattr(json, name)
+
+
+class PeakMemory:
+    # samples the process RSS in a background thread
+    def __init__(self, interval: float = 0.01) -> None:
+        self.process = psutil.Process()
+        self.interval = interval
+        self.baseline = self.process.memory_info().rss
+        self.peak = self.baseline
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self) -> None:
+        while self.running:
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def stop(self) -> int:
+        self.running = False
+        self.thread.join()
+        return self.peak - self.baseline
+
+
+def set_list(list_handle, values) -> None:
+    dpg.configure_item(
+        list_handle, items=[f"{i + 1}:\t{x}" for i, x in enumerate(values)]
+    )
+
+
+def run_case(
+    frontend: lcd_ui,
+    instruments: lcd_instruments,
+    rig: SimulatedRig,
+    output_type: OutputType,
+    shape: tuple[int, int, int],
+    output_dir: Path,
+    list_sweep: bool,
+) -> dict:
+    n_T, n_f, n_V = shape
+    set_list(frontend.temperature_list.list_handle, list(range(30, 30 + n_T)))
+    set_list(
+        frontend.freq_list.list_handle,
+        [round(x, 3) for x in np.logspace(np.log10(20), np.log10(2e6), n_f)]
+        if n_f > 1
+        else [1000.0],
+    )
+    set_list(
+        frontend.volt_list.list_handle,
+        [round(x, 3) for x in np.linspace(0.1, 10, n_V)] if n_V > 1 else [1.0],
+    )
+    dpg.set_value(frontend.output_file_path, str(output_dir / f"{output_type.name}.json"))
+    dpg.set_value(frontend.list_sweep, list_sweep)
+
+    state = lcd_state()
+    state.linkam_connection_status = "Reading"
+    sequencer = lcd_sequencer.MeasurementSequencer(state, instruments)
+    sequencer.watch_temperature()
+    measurement_queue = lcd_queue.MeasurementQueue(sequencer)
+    state.linkam_action = instruments.linkam.wait_for_reading()[1]
+
+    excel = Timed(lcd_export.make_excel)
+    timed_json = TimedJson()
+    lcd_export.make_excel = excel
+    lcd_export.json = timed_json
+
+    busy_start = rig.agilent.busy_time
+    memory = PeakMemory()
+    phase_time = {"temperature": 0.0, "acquisition": 0.0}
+    start = time.perf_counter()
+    try:
+        lcd_utils.start_measurement(
+            state, frontend, instruments, sequencer, measurement_queue
+        )
+        while state.measurement_status == Status.IDLE:
+            time.sleep(1e-4)
+        last = time.perf_counter()
+        while state.measurement_status != Status.IDLE:
+            status = state.measurement_status
+            lcd_utils.handle_measurement_status(
+                state, frontend, instruments, measurement_queue
+            )
+            time.sleep(1e-3)
+            now = time.perf_counter()
+            if status in (Status.TEMPERATURE_STABILISED, Status.COLLECTING_DATA):
+                phase_time["acquisition"] += now - last
+            else:
+                phase_time["temperature"] += now - last
+            last = now
+    finally:
+        sequencer.shutdown()
+        lcd_export.make_excel = excel.func
+        lcd_export.json = json
+    total = time.perf_counter() - start
+    peak_memory = memory.stop()
+
+    n_points = n_T * n_f * n_V
+    # busy_time is the nominal instrument time, only latency_scale of it was
+    # actually spent waiting.
+    agilent_busy = rig.agilent.busy_time - busy_start
+    agilent_wait = agilent_busy * rig.agilent.latency_scale
+    acquisition = phase_time["acquisition"]
+    return {
+        "output_type": output_type.name,
+        "shape": list(shape),
+        "points": n_points,
+        "list_sweep": list_sweep,
+        "total_time": total,
+        "points_per_hour": n_points / total * 3600,
+        "temperature_time": phase_time["temperature"],
+        "acquisition_time": acquisition,
+        "time_per_point": acquisition / n_points,
+        "instrument_time_per_point": agilent_wait / n_points,
+        "overhead_per_point": max(acquisition - agilent_wait, 0.0) / n_points,
+        "nominal_instrument_time_per_point": agilent_busy / n_points,
+        "make_excel_time": excel.total,
+        "make_excel_calls": excel.calls,
+        "json_dump_time": timed_json.dump.total,
+        "json_dump_calls": timed_json.dump.calls,
+        "export_requests": sequencer.exporter.submitted,
+        "peak_memory_mb": peak_memory / 2**20,
+    }
+
+
+def package_version() -> str:
+    try:
+        package = version("lcdielectrics")
+    except PackageNotFoundError:
+        package = "unknown"
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return f"{package}+{commit}" if commit else package
+
+
+def compare_with_previous(results: list[dict], size: str, results_dir: Path) -> None:
+    previous_files = sorted(results_dir.glob(f"bench_sweep-{size}-*.json"))
+    if len(previous_files) < 2:
+        return
+    with open(previous_files[-2]) as f:
+        previous = json.load(f)
+    previous_runs = {
+        (r["output_type"], r["list_sweep"]): r for r in previous["results"]
+    }
+    print(f"\nChange in time per point since {previous['version']}:")
+    for run in results:
+        old = previous_runs.get((run["output_type"], run["list_sweep"]))
+        if old is None or old["shape"] != run["shape"]:
+            continue
+        change = (run["time_per_point"] / old["time_per_point"] - 1) * 100
+        print(f"{run['output_type']:>18} {change:+8.1f} %")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=20000,
+        help="skip layouts with more points than this (0 for no limit)",
+    )
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="scale of the simulated instrument latency (0 measures software only)",
+    )
+    parser.add_argument(
+        "--results-dir",
+        type=Path,
+        default=RESULTS_DIR,
+        help="where results are saved and compared with earlier runs",
+    )
+    parser.add_argument("--list-sweep", action="store_true")
+    args = parser.parse_args()
+
+    dpg.create_context()
+    frontend = lcd_ui()
+    dpg.set_value(frontend.delay_time, 0.0)
+    dpg.set_value(frontend.stab_time, 0.0)
+    dpg.set_value(frontend.T_rate, 50.0)
+
+    rig = SimulatedRig(time_scale=1000.0, latency_scale=args.latency_scale)
+    set_simulated_rig(rig)
+    instruments = lcd_instruments()
+    instruments.linkam = SimulatedLinkamHotstage("SIM::LINKAM::INSTR")
+    instruments.linkam.poll_interval_active = 0.01
+    instruments.agilent = SimulatedAgilentSpectrometer("SIM::E4980A::INSTR")
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for output_type, shape in SIZES[args.size].items():
+            n_points = shape[0] * shape[1] * shape[2]
+            if args.max_points and n_points > args.max_points:
+                print(f"Skipping {output_type.name} {shape} ({n_points} points)")
+                continue
+            run = run_case(
+                frontend,
+                instruments,
+                rig,
+                output_type,
+                shape,
+                Path(output_dir),
+                args.list_sweep,
+            )
+            results.append(run)
+            print(
+                f"{run['output_type']:>18} {str(tuple(shape)):>15}"
+                f" {run['points_per_hour']:>12.0f} pts/h"
+                f" {run['time_per_point'] * 1e3:>9.2f} ms/pt"
+                f" (overhead {run['overhead_per_point'] * 1e3:.2f} ms)"
+                f" excel {run['make_excel_time']:.2f} s"
+                f" json {run['json_dump_time']:.2f} s"
+                f" peak {run['peak_memory_mb']:.1f} MB"
+            )
+
+    instruments.linkam.close()
+    dpg.destroy_context()
+
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    record = {
+        "version": package_version(),
+        "timestamp": stamp,
+        "size": args.size,
+        "latency_scale": args.latency_scale,
+        "results": results,
+    }
+    with open(args.results_dir / f"bench_sweep-{args.size}-{stamp}.json", "w") as f:
+        json.dump(record, f, indent=4)
+    compare_with_previous(results, args.size, args.results_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Overshoot-aware approach to a setpoint. The stage follows the Linkam's
+# ramped reference with a lag: during a ramp at rate r it trails by r tau, and
+# when the ramp stops (or slows to r') it carries on past the reference by
+# about beta (r - r') tau before ringing down. "Predictive" makes a large step
+# as a fast ramp (at T_rate) to a near-target point short of the setpoint,
+# then a slow ramp (approach_rate) over the last
+#
+#   beta r_fast tau + r_slow tau + NEAR_MARGIN
+#
+# so the fast ramp's overshoot is spent before the setpoint. Steps shorter
+# than that are made in one ramp, at the fastest rate expected to overshoot
+# by no more than NEAR_MARGIN. tau and beta are learned from the temperature
+# log of every approach and kept in RESPONSE_FILE.
+
+APPROACH_MODES = ("Direct", "Predictive")
+RESPONSE_FILE = "thermal_response.json"
+NEAR_MARGIN = 0.2  # C
+# weight of each new approach in the running estimates
+LEARNING_RATE = 0.3
+# a ramp is only learned from once it has run this many lag times
+MIN_RAMP_LAGS = 3.0
+# an overshoot is only learned from if the lag was at least this far (C),
+# below it the reading resolution (0.1 C) dominates
+MIN_LAG_DISTANCE = 0.5
+
+# a ramp is (start time on the T_log_time clock, reference at the start,
+# setpoint, rate in C/min)
+Ramp = tuple[float, float, float, float]
+
+
+def reference_path(ramps: list[Ramp], t: np.ndarray) -> np.ndarray:
+    # the Linkam's reference at times t, NaN before the first ramp
+    ref = np.full(len(t), np.nan)
+    for i, (t0, start, setpoint, rate) in enumerate(ramps):
+        t_end = ramps[i + 1][0] if i + 1 < len(ramps) else np.inf
+        selected = (t >= t0) & (t < t_end)
+        distance = np.minimum(rate / 60 * (t[selected] - t0), abs(setpoint - start))
+        ref[selected] = start + np.sign(setpoint - start) * distance
+    return ref
+
+
+def reference_at(ramps: list[Ramp], t: float, reading: float) -> float:
+    # where a new ramp starts from: the end of the ramp before it, or the
+    # stage temperature if it is the first
+    if not ramps:
+        return reading
+    return float(reference_path(ramps, np.array([t]))[0])
+
+
+class ThermalResponse:
+    def __init__(self, tau: float = 30.0, beta: float = 0.5, approaches: int = 0):
+        # tau in s, beta dimensionless, approaches is how many were learned from
+        self.tau = tau
+        self.beta = beta
+        self.approaches = approaches
+
+    @classmethod
+    def from_dict(cls, response: dict) -> "ThermalResponse":
+        return cls(response["tau"], response["beta"], response["approaches"])
+
+    @classmethod
+    def load(cls, path: str = RESPONSE_FILE) -> "ThermalResponse":
+        # the defaults until the stage has been learned
+        if not Path(path).exists():
+            return cls()
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self) -> dict:
+        return {"tau": self.tau, "beta": self.beta, "approaches": self.approaches}
+
+    def save(self, path: str = RESPONSE_FILE) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def near_distance(self, fast_rate: float, slow_rate: float) -> float:
+        return (self.beta * fast_rate + slow_rate) / 60 * self.tau + NEAR_MARGIN
+
+    def plan(
+        self, start_T: float, T: float, fast_rate: float, slow_rate: float
+    ) -> list[tuple[float, float]]:
+        # the (setpoint, rate) ramps to go from start_T to T
+        if slow_rate >= fast_rate:
+            return [(T, fast_rate)]
+        distance = self.near_distance(fast_rate, slow_rate)
+        if abs(T - start_T) <= distance:
+            # the lag, and so the overshoot, can't be more than the step
+            if self.beta * abs(T - start_T) <= NEAR_MARGIN:
+                return [(T, fast_rate)]
+            rate = NEAR_MARGIN * 60 / max(self.beta * self.tau, 1e-9)
+            return [(T, round(float(np.clip(rate, slow_rate, fast_rate)), 2))]
+        near_T = round(float(T - np.sign(T - start_T) * distance), 1)
+        return [(near_T, fast_rate), (T, slow_rate)]
+
+    def learn(self, ramps: list[Ramp], times, temperatures) -> bool:
+        # Update tau and beta from the log of an approach made of ramps. tau
+        # is the median lag during the fastest ramp, beta the furthest the
+        # stage went past the reference once that ramp ended. Returns
+        # whether anything was learned.
+        n = min(len(times), len(temperatures))
+        t = np.asarray(times[:n], dtype=float)
+        T = np.asarray(temperatures[:n], dtype=float)
+        if not ramps or n == 0:
+            return False
+        selected = t >= ramps[0][0]
+        t, T = t[selected], T[selected]
+        ref = reference_path(ramps, t)
+
+        i = max(range(len(ramps)), key=lambda i: ramps[i][3])
+        t0, start, setpoint, rate = ramps[i]
+        speed = rate / 60
+        direction = np.sign(setpoint - start)
+        if speed <= 0 or direction == 0:
+            return False
+        t_stop = t0 + abs(setpoint - start) / speed
+        # a slower ramp after it takes up part of the overshoot
+        next_speed = 0.0
+        if i + 1 < len(ramps):
+            t_stop = min(t_stop, ramps[i + 1][0])
+            next_speed = ramps[i + 1][3] / 60
+
+        learned = False
+        if t_stop - t0 >= MIN_RAMP_LAGS * self.tau:
+            # past the initial transient
+            ramping = (t >= t0 + 2 * self.tau) & (t < t_stop)
+            if ramping.sum() >= 3:
+                tau = float(np.median(direction * (ref - T)[ramping] / speed))
+                if tau > 0:
+                    self.tau += LEARNING_RATE * (tau - self.tau)
+                    learned = True
+        after = t >= t_stop
+        lag = (speed - next_speed) * self.tau
+        if learned and lag >= MIN_LAG_DISTANCE and after.any():
+            overshoot = max(float((direction * (T - ref))[after].max()), 0.0)
+            beta = overshoot / lag
+            self.beta += LEARNING_RATE * (beta - self.beta)
+        self.approaches += learned
+        return learned
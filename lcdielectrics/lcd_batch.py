@@ -0,0 +1,153 @@
+import argparse
+import json
+import sys
+import time
+from dataclasses import fields
+
+from lcdielectrics.lcd_dataclasses import (
+    lcd_instruments,
+    lcd_state,
+    measurement_settings,
+)
+from lcdielectrics.lcd_discovery import load_known_addresses
+from lcdielectrics.lcd_instruments import (
+    AgilentSpectrometer,
+    LinkamHotstage,
+    Oscilloscope,
+)
+from lcdielectrics.lcd_queue import JobStatus, MeasurementQueue
+from lcdielectrics.lcd_sequencer import MeasurementSequencer, describe_status
+from lcdielectrics.lcd_simulators import (
+    SimulatedAgilentSpectrometer,
+    SimulatedLinkamHotstage,
+    SimulatedOscilloscope,
+    is_simulated,
+)
+
+# Runs .meas setup files (from "Save Measurement Setup") without the GUI:
+#
+#   python -m lcdielectrics.lcd_batch overnight.meas cv.meas
+#
+# Nothing here imports dearpygui or tkinter. Instrument addresses default to
+# the ones last connected in the GUI (address.dat). The setups are run as a
+# MeasurementQueue, so temperatures they share are only visited once.
+
+LIST_KEYS = ("freq_list", "volt_list", "temperature_list")
+
+
+def list_item_values(items: list) -> list[float]:
+    # list box items look like "3:\t1000.0"
+    return [float(str(item).split("\t")[-1]) for item in items]
+
+
+def read_setup_file(path: str) -> measurement_settings:
+    with open(path, "r") as f:
+        setup = json.load(f)
+    settings = measurement_settings()
+    for setting in fields(measurement_settings):
+        if setting.name not in setup:
+            continue
+        value = setup[setting.name]
+        if setting.name in LIST_KEYS:
+            value = list_item_values(value)
+        elif setting.type in (int, float, str):
+            # combo boxes save their value as a string, e.g. bias_level
+            value = setting.type(value)
+        setattr(settings, setting.name, value)
+    return settings
+
+
+def connect_instruments(addresses: dict[str, str]) -> lcd_instruments:
+    # addresses has "linkam", "agilent" and optionally "oscilloscope"
+    instruments = lcd_instruments()
+    for role in ("linkam", "agilent"):
+        if not addresses.get(role):
+            raise ValueError(f"No address for the {role}")
+    address = addresses["linkam"]
+    if is_simulated(address):
+        instruments.linkam = SimulatedLinkamHotstage(address)
+    else:
+        instruments.linkam = LinkamHotstage(address)
+    instruments.linkam.current_temperature()
+    address = addresses["agilent"]
+    if is_simulated(address):
+        instruments.agilent = SimulatedAgilentSpectrometer(address)
+    else:
+        instruments.agilent = AgilentSpectrometer(address)
+    address = addresses.get("oscilloscope")
+    if address:
+        if is_simulated(address):
+            instruments.oscilloscope = SimulatedOscilloscope(address)
+        else:
+            instruments.oscilloscope = Oscilloscope(address)
+    return instruments
+
+
+def run_queue(
+    measurement_queue: MeasurementQueue, state: lcd_state, poll_interval: float = 1.0
+) -> bool:
+    # run the queue until it drains, printing each change of status. Returns
+    # whether every job was measured completely.
+    measurement_queue.run()
+    shown = None
+    while not measurement_queue.wait(poll_interval):
+        status = describe_status(state)
+        if status != shown:
+            print(time.strftime("%H:%M:%S"), status, flush=True)
+            shown = status
+    return all(job.status == JobStatus.DONE for job in measurement_queue.jobs())
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run .meas measurement setups without the GUI."
+    )
+    parser.add_argument("setups", nargs="+", help=".meas files, run in order")
+    parser.add_argument("--output", help="output file, if running a single setup")
+    parser.add_argument(
+        "--resume", action="store_true", help="carry on interrupted runs"
+    )
+    parser.add_argument("--linkam")
+    parser.add_argument("--agilent")
+    parser.add_argument("--oscilloscope")
+    args = parser.parse_args(argv)
+    if args.output and len(args.setups) > 1:
+        parser.error("--output needs a single setup")
+
+    addresses = load_known_addresses()
+    for role in ("linkam", "agilent", "oscilloscope"):
+        if getattr(args, role):
+            addresses[role] = getattr(args, role)
+    setups = [read_setup_file(path) for path in args.setups]
+
+    instruments = connect_instruments(addresses)
+    state = lcd_state()
+    sequencer = MeasurementSequencer(state, instruments)
+    sequencer.watch_temperature()
+    measurement_queue = MeasurementQueue(sequencer)
+    paths = {}
+    for path, settings in zip(args.setups, setups):
+        if args.output:
+            settings.output_file_path = args.output
+        settings.resume = settings.resume or args.resume
+        paths[measurement_queue.add(settings)] = path
+        print(f"Queued {path} -> {settings.output_file_path}", flush=True)
+    try:
+        completed = run_queue(measurement_queue, state)
+        for job in measurement_queue.jobs():
+            if job.status != JobStatus.DONE:
+                print(f"{paths[job.id]} didn't complete", flush=True)
+    except KeyboardInterrupt:
+        # stop the stage and write out what was measured
+        measurement_queue.stop()
+        measurement_queue.wait()
+        sequencer.wait()
+        completed = False
+    finally:
+        sequencer.shutdown()
+        instruments.linkam.close()
+    return 0 if completed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
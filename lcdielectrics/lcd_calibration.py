@@ -0,0 +1,103 @@
+import json
+from pathlib import Path
+
+import numpy as np
+
+from lcdielectrics.lcd_impedance import PERMITTIVITY_QUANTITIES
+from lcdielectrics.lcd_results import ResultsCube
+
+# An empty cell measures Cp_empty(f) = C0(f) + C_stray, where C_stray is the
+# capacitance of the leads and fixture in parallel with the cell. With the
+# cell filled,
+#
+#   eps'  = (Cp - C_stray) / C0
+#   eps'' = G / (omega C0) = Cp D / C0
+#
+# The stray capacitance has no loss, so it only comes off eps'.
+
+
+def calibration_path(output_file_path: str) -> str:
+    # the calibration used for a run is saved next to its outputs
+    return str(Path(output_file_path).with_suffix(".cal.json"))
+
+
+class EmptyCellCalibration:
+    def __init__(
+        self, freq: list[float], C_empty: list[float], C_stray: float = 0.0
+    ) -> None:
+        # freq in Hz, C_empty and C_stray in F
+        order = np.argsort(freq)
+        self.freq = np.asarray(freq, dtype=float)[order]
+        self.C_empty = np.asarray(C_empty, dtype=float)[order]
+        self.C_stray = C_stray
+        # C0 interpolated onto each frequency list it has been asked for
+        self._C0_cache: dict[bytes, np.ndarray] = {}
+
+    @classmethod
+    def constant(cls, C0: float, C_stray: float = 0.0) -> "EmptyCellCalibration":
+        # a frequency independent C0, e.g. from the cell's area and gap
+        return cls([1.0], [C0 + C_stray], C_stray)
+
+    @classmethod
+    def from_dict(cls, calibration: dict) -> "EmptyCellCalibration":
+        return cls(
+            calibration["freq"], calibration["C_empty"], calibration["C_stray"]
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "EmptyCellCalibration":
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self) -> dict:
+        return {
+            "freq": self.freq.tolist(),
+            "C_empty": self.C_empty.tolist(),
+            "C_stray": self.C_stray,
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def C0(self, freq) -> np.ndarray:
+        # C0 at the given frequencies, interpolated in log(f) and held
+        # constant outside the calibrated range
+        freq = np.asarray(freq, dtype=float)
+        key = freq.tobytes()
+        C0 = self._C0_cache.get(key)
+        if C0 is None:
+            C0 = np.interp(np.log(freq), np.log(self.freq), self.C_empty) - self.C_stray
+            self._C0_cache[key] = C0
+        return C0
+
+    def permittivity(
+        self, freq, Cp, D, freq_index=slice(None)
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # C0 is interpolated onto freq (e.g. the whole frequency list, so it is
+        # only done once) then indexed with freq_index to line up with Cp and D
+        C0 = self.C0(freq)[freq_index]
+        Cp = np.asarray(Cp, dtype=float)
+        return (Cp - self.C_stray) / C0, Cp * np.asarray(D, dtype=float) / C0
+
+    def apply(self, cube: ResultsCube) -> ResultsCube:
+        # A cube with eps' and eps'' added, computed for every point at once.
+        # The other arrays are shared with the original cube.
+        C0 = self.C0(cube.freq)[None, :, None]
+        Cp = cube["Cp"]
+        data = dict(cube.data)
+        data[PERMITTIVITY_QUANTITIES[0]] = (Cp - self.C_stray) / C0
+        data[PERMITTIVITY_QUANTITIES[1]] = Cp * cube["D"] / C0
+        return ResultsCube.from_arrays(
+            cube.T, cube.freq, cube.volt, data, cube.measured
+        )
+
+
+def record_empty_cell(
+    agilent, freq_list: list[float], voltage: float, C_stray: float = 0.0
+) -> EmptyCellCalibration:
+    # sweep the empty cell over the frequency list with the :LIST table
+    agilent.set_voltage(voltage)
+    cpd = agilent.sweep_freq_list("CPD", freq_list)
+    agilent.finish_list_sweep()
+    return EmptyCellCalibration(freq_list, cpd[:, 0], C_stray)
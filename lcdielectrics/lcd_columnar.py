@@ -0,0 +1,115 @@
+import os
+import shutil
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+# Every point as one row, the same whatever the sweep layout.
+INDEX_COLUMNS = ["T_step", "freq_step", "volt_step"]
+COORDINATE_COLUMNS = ["T", "freq", "volt", "bias", "time", "T_linkam"]
+
+
+def columnar_path(output_file_path: str) -> str:
+    return str(Path(output_file_path).with_suffix(".npz"))
+
+
+def parts_dir(path: str) -> Path:
+    return Path(str(path) + ".parts")
+
+
+class ColumnarWriter:
+    # Streams rows into compressed .npz files. During a run each chunk of rows
+    # is its own "<file>.parts/00000.npz", written under a temporary name and
+    # renamed into place, so a crash never leaves a half written chunk. A
+    # chunk is written once it has chunk_rows rows, or with the first row
+    # appended flush_interval seconds after the last chunk, so a crash only
+    # loses the last few seconds of points (the JSONL log from lcd_store has
+    # them all, and resuming rewrites this file from it). close() joins the
+    # chunks into "<file>" and removes the parts. load_columns() reads either.
+    chunk_rows = 1000
+    flush_interval = 5.0  # s
+
+    def __init__(self, path: str, quantities: list[str]) -> None:
+        self.path = path
+        self.columns = INDEX_COLUMNS + COORDINATE_COLUMNS + list(quantities)
+        self.rows: list[list] = []
+        self.chunks = 0
+        self.last_write = time.monotonic()
+        self.lock = threading.Lock()
+
+    def create(self) -> None:
+        with self.lock:
+            self.rows = []
+            self.chunks = 0
+            self.last_write = time.monotonic()
+            shutil.rmtree(parts_dir(self.path), ignore_errors=True)
+            parts_dir(self.path).mkdir(parents=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def append(self, row: dict) -> None:
+        # row holds a value for every column, missing ones are written as NaN
+        with self.lock:
+            self.rows.append([row.get(column, np.nan) for column in self.columns])
+            if (
+                len(self.rows) >= self.chunk_rows
+                or time.monotonic() - self.last_write >= self.flush_interval
+            ):
+                self._write_chunk()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._write_chunk()
+
+    def close(self) -> None:
+        # write the rows left and join all the chunks into one file, so loading
+        # a finished run reads a single array per column. The parts are only
+        # removed once the joined file is in place.
+        with self.lock:
+            self._write_chunk()
+            if not parts_dir(self.path).is_dir():
+                return
+            write_chunk(self.path, load_columns(self.path))
+            shutil.rmtree(parts_dir(self.path), ignore_errors=True)
+
+    def _write_chunk(self) -> None:
+        if not self.rows:
+            return
+        block = np.array(self.rows, dtype=float)
+        self.rows = []
+        columns = {}
+        for i, column in enumerate(self.columns):
+            columns[column] = block[:, i]
+            if column in INDEX_COLUMNS:
+                columns[column] = columns[column].astype(np.int32)
+        write_chunk(parts_dir(self.path) / f"{self.chunks:05d}.npz", columns)
+        self.chunks += 1
+        self.last_write = time.monotonic()
+
+
+def write_chunk(path, columns: dict[str, np.ndarray]) -> None:
+    # a complete file or nothing: written aside, then renamed over path
+    temporary = str(path) + ".tmp"
+    with zipfile.ZipFile(temporary, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for column, values in columns.items():
+            with archive.open(f"{column}.npy", "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, values, allow_pickle=False)
+    os.replace(temporary, path)
+
+
+def load_columns(path: str) -> dict[str, np.ndarray]:
+    # {column: array} with one entry per measured point, in measurement order.
+    # Reads the chunks of a run that is still going (or crashed) if there are
+    # any, otherwise the joined file.
+    files = [path]
+    if parts_dir(path).is_dir():
+        files = sorted(parts_dir(path).glob("[0-9]*.npz"))
+    chunks: dict[str, list[np.ndarray]] = {}
+    for file in files:
+        with np.load(file) as archive:
+            for column in archive.files:
+                chunks.setdefault(column, []).append(archive[column])
+    return {column: np.concatenate(parts) for column, parts in chunks.items()}
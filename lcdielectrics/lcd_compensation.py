@@ -0,0 +1,134 @@
+import hashlib
+import re
+from pathlib import Path
+
+import numpy as np
+
+# Open/short/load compensation of the fixture and leads. Each standard is
+# swept over the frequency list as R + jX, and a measured impedance Zm is
+# corrected with
+#
+#   open/short:       Z = (Zm - Zs) / (1 - (Zm - Zs) / Zo)
+#   open/short/load:  Z = Zstd (Zo - Zl)(Zm - Zs) / ((Zl - Zs)(Zo - Zm))
+#
+# where Zo, Zs and Zl are the measured open, short and load and Zstd is the
+# load's known value. Tables are cached in COMPENSATION_DIR per fixture and
+# frequency list, so they only need measuring again if the fixture changes.
+
+COMPENSATION_DIR = "compensation"
+STANDARDS = ("open", "short", "load")
+
+
+def compensation_path(
+    fixture: str, freq_list: list[float], directory: str = COMPENSATION_DIR
+) -> Path:
+    freqs = np.asarray(freq_list, dtype=float).tobytes()
+    name = re.sub(r"[^\w\-]", "_", fixture) or "fixture"
+    return Path(directory) / f"{name}-{hashlib.sha1(freqs).hexdigest()[:12]}.npz"
+
+
+def cpd_to_impedance(freq, Cp, D) -> np.ndarray:
+    # Y = G + jB with B = w Cp and G = B D
+    B = 2 * np.pi * np.asarray(freq, dtype=float) * np.asarray(Cp, dtype=float)
+    return 1 / (B * (np.asarray(D, dtype=float) + 1j))
+
+
+def impedance_to_cpd(freq, Z) -> tuple[np.ndarray, np.ndarray]:
+    Y = 1 / Z
+    return Y.imag / (2 * np.pi * np.asarray(freq, dtype=float)), Y.real / Y.imag
+
+
+class CompensationTable:
+    # Complex impedances (ohm) of each standard at freq, NaN until measured.
+    # load_standard is the load's true impedance.
+    def __init__(self, freq: list[float]) -> None:
+        self.freq = np.asarray(freq, dtype=float)
+        self.open = np.full(len(self.freq), np.nan, dtype=complex)
+        self.short = np.full(len(self.freq), np.nan, dtype=complex)
+        self.load = np.full(len(self.freq), np.nan, dtype=complex)
+        self.load_standard = np.full(len(self.freq), np.nan, dtype=complex)
+
+    @classmethod
+    def load_file(cls, path: str | Path) -> "CompensationTable":
+        with np.load(path) as f:
+            table = cls(f["freq"])
+            for name in STANDARDS + ("load_standard",):
+                setattr(table, name, f[name])
+        return table
+
+    @classmethod
+    def cached(
+        cls, fixture: str, freq_list: list[float], directory: str = COMPENSATION_DIR
+    ) -> "CompensationTable | None":
+        path = compensation_path(fixture, freq_list, directory)
+        if not path.exists():
+            return None
+        return cls.load_file(path)
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            freq=self.freq,
+            open=self.open,
+            short=self.short,
+            load=self.load,
+            load_standard=self.load_standard,
+        )
+
+    def has(self, standard: str) -> bool:
+        return bool(np.isfinite(getattr(self, standard)).all())
+
+    def correct(self, Zm, freq_index=slice(None)) -> np.ndarray:
+        # Zm lines up with self.freq[freq_index]. Without open and short
+        # tables the impedance is returned unchanged.
+        Zm = np.asarray(Zm, dtype=complex)
+        if not (self.has("open") and self.has("short")):
+            return Zm
+        Zo = self.open[freq_index]
+        Zs = self.short[freq_index]
+        if not self.has("load"):
+            return (Zm - Zs) / (1 - (Zm - Zs) / Zo)
+        Zl = self.load[freq_index]
+        return (
+            self.load_standard[freq_index]
+            * (Zo - Zl)
+            * (Zm - Zs)
+            / ((Zl - Zs) * (Zo - Zm))
+        )
+
+    def correct_cpd(
+        self, Cp, D, freq_index=slice(None)
+    ) -> tuple[np.ndarray, np.ndarray]:
+        freq = self.freq[freq_index]
+        Z = self.correct(cpd_to_impedance(freq, Cp, D), freq_index)
+        return impedance_to_cpd(freq, Z)
+
+
+def measure_standard(
+    agilent,
+    standard: str,
+    fixture: str,
+    freq_list: list[float],
+    voltage: float,
+    load_Cp: float = 0.0,
+    load_D: float = 0.0,
+    directory: str = COMPENSATION_DIR,
+) -> CompensationTable:
+    # Sweep one standard (connected to the fixture) over the frequency list
+    # and save it into the fixture's cached table. The load's true value is
+    # given as Cp (F) and D.
+    path = compensation_path(fixture, freq_list, directory)
+    if path.exists():
+        table = CompensationTable.load_file(path)
+    else:
+        table = CompensationTable(freq_list)
+    agilent.set_voltage(voltage)
+    rx = agilent.sweep_freq_list("RX", freq_list)
+    agilent.finish_list_sweep()
+    setattr(table, standard, rx[:, 0] + 1j * rx[:, 1])
+    if standard == "load":
+        table.load_standard = cpd_to_impedance(table.freq, load_Cp, load_D)
+    table.save(path)
+    return table
@@ -1,7 +1,16 @@
 from dataclasses import dataclass, field
-from lcdielectrics.lcd_instruments import LinkamHotstage, AgilentSpectrometer
+from lcdielectrics.lcd_instruments import (
+    LinkamHotstage,
+    AgilentSpectrometer,
+    Oscilloscope,
+)
+from lcdielectrics.lcd_calibration import EmptyCellCalibration
+from lcdielectrics.lcd_columnar import ColumnarWriter
+from lcdielectrics.lcd_compensation import CompensationTable
+from lcdielectrics.lcd_results import ResultsCube
+from lcdielectrics.lcd_store import ResultsStore
 from enum import Enum
-from pyvisa.resources import Resource
+from typing import Sequence
 
 
 class OutputType(Enum):
@@ -41,25 +50,94 @@ class variable_list:
     range_selector: range_selector_window
 
 
+@dataclass
+class measurement_settings:
+    # Everything a run needs from the GUI, captured when it starts. Field names
+    # match the keys used in .meas setup files.
+    freq_list: list = field(default_factory=list)
+    volt_list: list = field(default_factory=list)
+    temperature_list: list = field(default_factory=list)
+    delay_time: float = 0.5
+    meas_time_mode: str = "SHOR"
+    averaging_factor: int = 1
+    bias_level: float = 0.0
+    output_file_path: str = "results.json"
+    list_sweep: bool = False
+    # constant C0, used if there is no calibration file
+    empty_cell_capacitance: float = 0.0  # pF
+    stray_capacitance: float = 0.0  # pF
+    # empty cell sweep saved by EmptyCellCalibration.save
+    calibration_file: str = ""
+    # relaxation model fitted to each temperature as it finishes, see
+    # lcd_fitting.MODELS ("None" for no fitting)
+    fit_model: str = "None"
+    fit_conductivity: bool = False
+    # "Off", "Software" (cached open/short/load tables, see lcd_compensation)
+    # or "Instrument" (the E4980A's own spot corrections)
+    compensation: str = "Off"
+    fixture: str = "default"
+    # the load standard, used for load compensation if load_Cp isn't 0
+    load_Cp: float = 0.0  # pF
+    load_D: float = 0.0
+    data_format: str = "ASCII"
+    T_rate: float = 10.0
+    stab_time: float = 1.0
+    # "Fixed" waits stab_time, "Adaptive" judges the temperature log (see
+    # lcd_stability)
+    stability_mode: str = "Fixed"
+    stability_window: float = 30.0  # s
+    stability_slope: float = 0.05  # C/min
+    stability_std: float = 0.05  # C
+    stability_min_wait: float = 10.0  # s
+    stability_max_wait: float = 600.0  # s
+    # "Direct" ramps straight to each setpoint at T_rate, "Predictive" finishes
+    # large steps at approach_rate (see lcd_approach)
+    approach_mode: str = "Direct"
+    approach_rate: float = 2.0  # C/min
+    # see lcd_temperature_plan. T_order is the visit order as indices into
+    # temperature_list, planned when the run starts if empty.
+    temperature_order: str = "As listed"
+    T_approach: str = "Any"
+    T_order: list = field(default_factory=list)
+    num_averages: int = 5
+    scope_waveform_format: str = "WORD"
+    scope_hardware_averaging: bool = False
+    # carry on from the last point in the output's record log
+    resume: bool = False
+
+
 @dataclass
 class lcd_state:
-    resultsDict: dict = field(default_factory=dict)
+    results: ResultsCube | None = None
+    store: ResultsStore | None = None
+    columnar: ColumnarWriter | None = None
     measurement_status: Status = Status.IDLE
     t_stable_start: float = 0
+    settings: measurement_settings = field(default_factory=measurement_settings)
     voltage_list_mode: bool = False
+    calibration: EmptyCellCalibration | None = None
+    # software compensation applied to every point, None for none
+    compensation: CompensationTable | None = None
     spectrometer_running: bool = True
     linkam_connection_status: str = "Disconnected"
     agilent_connection_status: str = "Disconnected"
     oscilloscope_connection_status: str = "Disconnected"
     scope_run_number: int = 1 
+    scope_columns: int = 0
     linkam_action: str = "Idle"
     linkam_temperature: float = 25.0
     T_list: list = field(default_factory=list)
     freq_list: list = field(default_factory=list)
     voltage_list: list = field(default_factory=list)
-    xdata: list = field(default_factory=list)
-    ydata: list = field(default_factory=list)
+    xdata: Sequence = field(default_factory=list)
+    ydata: Sequence = field(default_factory=list)
+    results_x_label: str = "voltage (V)"
+    results_y_label: str = "C_p"
+    plot_updated: bool = False
     averages: list = field(default_factory=list)
+    # temperatures are visited in T_order, T_step = T_order[T_position]
+    T_order: list = field(default_factory=list)
+    T_position: int = 0
     T_step: int = 0
     freq_step: int = 0
     volt_step: int = 0
@@ -71,4 +149,4 @@ class lcd_state:
 class lcd_instruments:
     linkam: LinkamHotstage | None = None
     agilent: AgilentSpectrometer | None = None
-    oscilloscope: Resource | None = None
\ No newline at end of file
+    oscilloscope: Oscilloscope | None = None
@@ -0,0 +1,198 @@
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pyvisa
+
+from lcdielectrics.lcd_instruments import get_resource_manager
+from lcdielectrics.lcd_simulators import SIMULATED_ADDRESSES, simulation_enabled
+
+ROLES = ("linkam", "agilent", "oscilloscope")
+ADDRESS_FILE = "address.dat"
+
+# mDNS services advertised by LAN instruments.
+LAN_SERVICES = ["_lxi._tcp.local.", "_vxi-11._tcp.local.", "_scpi-raw._tcp.local."]
+
+LINKAM_STATUS_BYTES = {1, 16, 17, 32, 33, 48, 49}
+
+
+def load_known_addresses(path: str = ADDRESS_FILE) -> dict[str, str]:
+    try:
+        with open(path, "r") as f:
+            contents = f.read().strip()
+    except OSError:
+        return {}
+    try:
+        addresses = json.loads(contents)
+    except json.JSONDecodeError:
+        # older versions only stored the Linkam address as plain text
+        return {"linkam": contents} if contents else {}
+    return {role: addresses[role] for role in ROLES if addresses.get(role)}
+
+
+def remember_address(role: str, address: str, path: str = ADDRESS_FILE) -> None:
+    addresses = load_known_addresses(path)
+    addresses[role] = address
+    with open(path, "w") as f:
+        json.dump(addresses, f, indent=4)
+
+
+def identify_role(idn: str) -> str | None:
+    idn = idn.upper()
+    if "E4980" in idn:
+        return "agilent"
+    if any(model in idn for model in ["DSO", "MSO", "OSCILLOSCOPE"]):
+        return "oscilloscope"
+    return None
+
+
+def probe_linkam(address: str, timeout: float) -> bool:
+    link = get_resource_manager().open_resource(address)
+    try:
+        link.baud_rate = 19200  # type: ignore
+        link.read_termination = "\r"  # type: ignore
+        link.write_termination = "\r"  # type: ignore
+        link.timeout = int(timeout * 1000)
+        link.write("T")  # type: ignore
+        reply = link.read_raw()  # type: ignore
+        int(reply[6:10], 16)
+        return reply[0] in LINKAM_STATUS_BYTES
+    except (pyvisa.errors.VisaIOError, ValueError, IndexError):
+        return False
+    finally:
+        link.close()
+
+
+def probe_idn(address: str, timeout: float) -> str | None:
+    resource = get_resource_manager().open_resource(address)
+    try:
+        resource.read_termination = "\n"  # type: ignore
+        resource.write_termination = "\n"  # type: ignore
+        resource.timeout = int(timeout * 1000)
+        return resource.query("*IDN?").strip()  # type: ignore
+    except (pyvisa.errors.VisaIOError, UnicodeDecodeError):
+        return None
+    finally:
+        resource.close()
+
+
+def probe(address: str, timeout: float) -> tuple[str, str | None, str]:
+    # returns (address, role, identity)
+    for role, simulated in SIMULATED_ADDRESSES.items():
+        if address == simulated:
+            return address, role, "simulated"
+    try:
+        if address.startswith("ASRL"):
+            if probe_linkam(address, timeout):
+                return address, "linkam", "Linkam T95"
+            return address, None, ""
+        idn = probe_idn(address, timeout)
+    except (pyvisa.errors.VisaIOError, OSError, ValueError):
+        return address, None, ""
+    if idn is None:
+        return address, None, ""
+    return address, identify_role(idn), idn
+
+
+def browse_lan(timeout: float) -> list[str]:
+    try:
+        from zeroconf import ServiceBrowser, Zeroconf
+    except ImportError:
+        return []
+
+    addresses: set[str] = set()
+    lock = threading.Lock()
+
+    class Listener:
+        def add_service(self, zc, service_type, name):
+            info = zc.get_service_info(service_type, name, int(timeout * 1000))
+            if info is None:
+                return
+            for raw_address in info.addresses:
+                ip = socket.inet_ntoa(raw_address) if len(raw_address) == 4 else None
+                if ip is None:
+                    continue
+                with lock:
+                    if service_type.startswith("_scpi-raw"):
+                        addresses.add(f"TCPIP0::{ip}::{info.port}::SOCKET")
+                    else:
+                        addresses.add(f"TCPIP0::{ip}::inst0::INSTR")
+
+        def update_service(self, zc, service_type, name):
+            pass
+
+        def remove_service(self, zc, service_type, name):
+            pass
+
+    zc = Zeroconf()
+    try:
+        ServiceBrowser(zc, LAN_SERVICES, Listener())
+        threading.Event().wait(timeout)
+    finally:
+        zc.close()
+    return sorted(addresses)
+
+
+def list_local_resources() -> list[str]:
+    resources = [
+        x
+        for x in get_resource_manager().list_resources()
+        if x.startswith(("ASRL", "USB", "TCPIP"))
+    ]
+    if simulation_enabled():
+        resources += list(SIMULATED_ADDRESSES.values())
+    return resources
+
+
+def probe_all(
+    addresses: list[str], timeout: float = 0.5, max_workers: int = 16
+) -> dict[str, tuple[str | None, str]]:
+    # Probe every address at once, returns {address: (role, identity)}.
+    if not addresses:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(addresses))) as pool:
+        results = pool.map(lambda address: probe(address, timeout), addresses)
+    return {address: (role, idn) for address, role, idn in results}
+
+
+def assign_roles(probed: dict[str, tuple[str | None, str]]) -> dict[str, str]:
+    roles: dict[str, str] = {}
+    for address, (role, _) in probed.items():
+        if role is not None and role not in roles:
+            roles[role] = address
+    return roles
+
+
+def reconnect_known(
+    timeout: float = 0.3, path: str = ADDRESS_FILE
+) -> dict[str, str]:
+    # Only probe the cached addresses, so a known rig is found in well
+    # under a second. Returns {role: address} for the ones that answered.
+    known = load_known_addresses(path)
+    probed = probe_all(list(set(known.values())), timeout)
+    return {
+        role: address
+        for role, address in known.items()
+        if probed.get(address, (None, ""))[0] == role
+    }
+
+
+def discover_instruments(
+    timeout: float = 0.5,
+    include_lan: bool = True,
+    lan_timeout: float = 1.0,
+    exclude: tuple[str, ...] = (),
+) -> tuple[list[str], dict[str, str]]:
+    # Returns every resource found and the {role: address} assignment.
+    # Resources in exclude (e.g. already connected ones) are listed but not
+    # probed. LAN browsing runs while the local resources are probed.
+    with ThreadPoolExecutor(max_workers=1) as lan_pool:
+        lan = lan_pool.submit(browse_lan, lan_timeout) if include_lan else None
+        resources = list_local_resources()
+        probed = probe_all([x for x in resources if x not in exclude], timeout)
+        if lan is not None:
+            lan_resources = [x for x in lan.result() if x not in resources]
+            probed.update(probe_all(lan_resources, timeout))
+            resources += lan_resources
+    return resources, assign_roles(probed)
@@ -1,78 +1,144 @@
+import re
+
+import numpy as np
 import xlsxwriter
 from lcdielectrics.lcd_dataclasses import OutputType
+from lcdielectrics.lcd_freedericksz import CV_COLUMNS, CV_SHEET, cv_analysis
+from lcdielectrics.lcd_results import ResultsCube
+
+# Excel's limits, less a little room for the block headings.
+MAX_ROWS = 1_048_576 - 8
+MAX_COLUMNS = 16_384
+MAX_SHEET_NAME = 31
+
+
+def sheet_name(name: str) -> str:
+    # characters Excel doesn't allow in sheet names
+    return re.sub(r"[\[\]:*?/\\]", "_", name)[:MAX_SHEET_NAME]
+
+
+class SpillingSheet:
+    # A worksheet that moves on to "<name> (2)", "<name> (3)"... when the next
+    # block of rows would pass Excel's row limit. In constant_memory mode rows
+    # have to be written in order, so everything goes through write_row and a
+    # row can't be filled in again once the next one is started. Rows are one
+    # point each with a column per quantity, so only the row limit can be
+    # reached; a row wider than Excel's column limit is refused up front.
+    def __init__(self, workbook, name: str, widths: list[int]) -> None:
+        if len(widths) > MAX_COLUMNS:
+            raise ValueError(
+                f"{name}: {len(widths)} columns, Excel allows {MAX_COLUMNS}"
+            )
+        self.workbook = workbook
+        self.name = name
+        self.widths = widths
+        self.part = 0
+        self.new_sheet()
+
+    def new_sheet(self) -> None:
+        self.part += 1
+        name = self.name if self.part == 1 else f"{self.name} ({self.part})"
+        if len(name) > MAX_SHEET_NAME:
+            suffix = f" ({self.part})"
+            name = self.name[: MAX_SHEET_NAME - len(suffix)] + suffix
+        self.worksheet = self.workbook.add_worksheet(name=name)
+        for i, width in enumerate(self.widths):
+            self.worksheet.set_column(i, i, width)
+        self.row = 0
+
+    def reserve(self, n_rows: int) -> None:
+        if self.row > 0 and self.row + n_rows > MAX_ROWS:
+            self.new_sheet()
 
+    def write_row(self, values: list) -> None:
+        self.worksheet.write_row(self.row, 0, values)
+        self.row += 1
 
-def make_excel(results: dict, output: str, output_type: OutputType) -> None:
-    workbook = xlsxwriter.Workbook(output.split(".json")[0] + ".xlsx")
+    def write_rows(self, block: np.ndarray) -> None:
+        # block holds one row per spreadsheet row, split if it doesn't fit
+        while len(block):
+            if self.row >= MAX_ROWS:
+                self.new_sheet()
+            n = min(len(block), MAX_ROWS - self.row)
+            for values in block[:n].tolist():
+                self.worksheet.write_row(self.row, 0, values)
+                self.row += 1
+            block = block[n:]
+
+
+def column_widths(headings: list[str]) -> list[int]:
+    # sized from the headings and numbers printed with Excel's General format
+    return [max(len(str(heading)) + 2, 12) for heading in headings]
+
+
+def make_excel(results: ResultsCube, output: str, output_type: OutputType) -> None:
+    workbook = xlsxwriter.Workbook(
+        output.split(".json")[0] + ".xlsx",
+        {"nan_inf_to_errors": True, "constant_memory": True},
+    )
+    quantities = results.quantities
+    data = results.data
+    measured = results.measured
+    T_measured = np.nonzero(measured.any(axis=(1, 2)))[0]
 
     if output_type == OutputType.SINGLE_VOLT_FREQ:
-        worksheet = workbook.add_worksheet(name="Multi T")
-        worksheet.write(0, 0, "Temperature (C)")
-        worksheet.write(0, 1, "Frequency (Hz)")
-
-    for t, T in enumerate(results.keys()):
-        if output_type == OutputType.SINGLE_VOLT:
-            worksheet = workbook.add_worksheet(
-                name=str(f"{T.split(':')[0]} - {T.split(':')[1]}")
+        headings = ["Temperature (C)", "Frequency (Hz)", "Voltage (V)"] + quantities
+        sheet = SpillingSheet(workbook, "Multi T", column_widths(headings))
+        sheet.write_row(headings)
+        t = np.nonzero(measured[:, 0, 0])[0]
+        block = np.column_stack(
+            [
+                results.T[t],
+                np.full(len(t), results.freq[0]),
+                np.full(len(t), results.volt[0]),
+            ]
+            + [data[q][t, 0, 0] for q in quantities]
+        )
+        sheet.write_rows(block)
+
+    elif output_type == OutputType.SINGLE_VOLT:
+        headings = ["Freq (Hz)"] + quantities
+        widths = column_widths(headings)
+        for t in T_measured:
+            sheet = SpillingSheet(
+                workbook, sheet_name(f"{t + 1} - {results.T[t]}"), widths
+            )
+            sheet.write_row(["Voltage (V)", results.volt[0]])
+            sheet.write_row(headings)
+            f = np.nonzero(measured[t, :, 0])[0]
+            block = np.column_stack(
+                [results.freq[f]] + [data[q][t, f, 0] for q in quantities]
             )
-            for i, freq in enumerate(results[T].keys()):
-                col_headings = list(results[T][freq].keys())
-                col_headings.remove("volt")
-                volt = results[T][freq]["volt"][0]
-                worksheet.write(0, 0, "Voltage (V)")
-                worksheet.write(0, 1, float(volt))
-                worksheet.write(1, 0, "Freq (Hz)")
-                worksheet.write_row(1, 1, col_headings)
-
-                worksheet.write(2 + i, 0, freq)
-                for j, heading in enumerate(col_headings):
-                    worksheet.write_row(i + 2, j + 1, results[T][freq][heading])
-
-            worksheet.autofit()
-        elif output_type == OutputType.SINGLE_FREQ:
-            worksheet = workbook.add_worksheet(
-                name=str(f"{T.split(':')[0]} - {T.split(':')[1]}")
+            sheet.write_rows(block)
+
+    else:
+        # SINGLE_FREQ and MULTI_VOLT_FREQ: a block of voltage rows per frequency
+        headings = ["volt"] + quantities
+        widths = column_widths(headings)
+        for t in T_measured:
+            sheet = SpillingSheet(
+                workbook, sheet_name(f"{t + 1} - {results.T[t]}"), widths
             )
-            for i, freq in enumerate(results[T].keys()):
-                col_headings = list(results[T][freq].keys())
-                start_row = len(results[T][freq][col_headings[0]]) + 3
-                worksheet.write(start_row * i, 0, "Frequency (Hz): ")
-                worksheet.write(start_row * i, 1, float(freq.split(":")[1]))
-                worksheet.write_row((start_row) * i + 1, 0, col_headings)
-
-                for j, heading in enumerate(col_headings):
-                    worksheet.write_column(
-                        start_row * i + 2, j, results[T][freq][heading]
-                    )
-
-            worksheet.autofit()
-        elif output_type == OutputType.SINGLE_VOLT_FREQ:
-            freq = list(results[T].keys())[0]
-            col_headings = list(results[T][freq].keys())
-            worksheet.write_row(0, 2, col_headings)
-            worksheet.write(t + 1, 0, float(T.split(":")[1]))
-            worksheet.write(t + 1, 1, float(freq.split(":")[1]))
-            for i, heading in enumerate(col_headings):
-                worksheet.write(t + 1, 2 + i, results[T][freq][heading][0])
-
-            worksheet.write(0, 3, "Voltage (V)")
-
-            worksheet.autofit()
-        elif output_type == OutputType.MULTI_VOLT_FREQ:
-            worksheet = workbook.add_worksheet(
-                name=str(f"{T.split(':')[0]} - {T.split(':')[1]}")
+            for f in np.nonzero(measured[t].any(axis=1))[0]:
+                mask = measured[t, f]
+                block = np.column_stack(
+                    [results.volt[mask]] + [data[q][t, f, mask] for q in quantities]
+                )
+                sheet.reserve(len(block) + 3)
+                sheet.write_row(["Frequency (Hz): ", results.freq[f]])
+                sheet.write_row(headings)
+                sheet.write_rows(block)
+                sheet.row += 1
+
+        # threshold, permittivities and elastic constants of every C-V curve
+        analysis = cv_analysis(results)
+        if analysis is not None:
+            headings = [heading for _, heading in CV_COLUMNS]
+            sheet = SpillingSheet(workbook, CV_SHEET, column_widths(headings))
+            sheet.write_row(headings)
+            t, f = np.nonzero(measured.any(axis=2))
+            sheet.write_rows(
+                np.column_stack([analysis[key][t, f] for key, _ in CV_COLUMNS])
             )
-            for i, freq in enumerate(results[T].keys()):
-                col_headings = list(results[T][freq].keys())
-                start_row = len(results[T][freq][col_headings[0]]) + 3
-                worksheet.write(start_row * i, 0, "Frequency (Hz): ")
-                worksheet.write(start_row * i, 1, float(freq.split(":")[1]))
-                worksheet.write_row((start_row) * i + 1, 0, col_headings)
-
-                for j, heading in enumerate(col_headings):
-                    worksheet.write_column(
-                        start_row * i + 2, j, results[T][freq][heading]
-                    )
-            worksheet.autofit()
 
     workbook.close()
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+
+from lcdielectrics.lcd_calibration import EmptyCellCalibration
+from lcdielectrics.lcd_dataclasses import OutputType
+from lcdielectrics.lcd_excel_writer import make_excel
+from lcdielectrics.lcd_results import ResultsCube
+
+
+def write_files(
+    cube: ResultsCube,
+    output_file_path: str,
+    output_type: OutputType,
+    calibration: EmptyCellCalibration | None = None,
+) -> None:
+    if calibration is not None:
+        # permittivities are worked out for the whole cube at export time
+        cube = calibration.apply(cube)
+    make_excel(cube, output_file_path, output_type)
+
+    with open(output_file_path, "w") as write_file:
+        json.dump(cube.to_dict(), write_file, indent=4)
+
+
+class ExportWorker:
+    # Rebuilds the JSON and xlsx outputs on its own thread. Requests are
+    # coalesced, so a burst of updates turns into one export, and
+    # exports are at least min_interval apart unless one is forced (end of a
+    # temperature or of the run).
+    min_interval = 10.0
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.pending: tuple | None = None
+        self.force = False
+        self.exporting = False
+        self.running = True
+        # requests submitted since the last export started
+        self.queue_depth = 0
+        self.submitted = 0
+        self.exports = 0
+        # time.time() of the last finished export, None before the first
+        self.last_export_time: float | None = None
+        self.last_export_duration = 0.0
+        self.last_error: Exception | None = None
+        self._last_start = 0.0
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(
+        self,
+        results: ResultsCube,
+        output_file_path: str,
+        output_type: OutputType,
+        force: bool = False,
+        calibration: EmptyCellCalibration | None = None,
+    ) -> None:
+        # The worker reads the cube when it exports. Points in a cube are
+        # never changed once written, so it doesn't need to be copied.
+        with self.condition:
+            self.pending = (results, output_file_path, output_type, calibration)
+            self.force = self.force or force
+            self.queue_depth += 1
+            self.submitted += 1
+            self.condition.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        # export anything pending now and wait for it, returns False on timeout
+        with self.condition:
+            if self.pending is not None:
+                self.force = True
+                self.condition.notify_all()
+            return self.condition.wait_for(
+                lambda: self.pending is None and not self.exporting, timeout
+            )
+
+    def stop(self) -> None:
+        self.flush()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while True:
+                    if not self.running:
+                        return
+                    if self.pending is not None:
+                        wait = self._last_start + self.min_interval - time.monotonic()
+                        if self.force or wait <= 0:
+                            break
+                        self.condition.wait(wait)
+                    else:
+                        self.condition.wait()
+                results, output_file_path, output_type, calibration = self.pending
+                self.pending = None
+                self.force = False
+                self.queue_depth = 0
+                self.exporting = True
+
+            self._last_start = time.monotonic()
+            try:
+                write_files(results, output_file_path, output_type, calibration)
+            except Exception as e:
+                # e.g. the workbook is open in Excel, the next export retries
+                print("Export failed: ", e)
+                self.last_error = e
+            else:
+                self.last_error = None
+                self.last_export_time = time.time()
+                self.exports += 1
+            self.last_export_duration = time.monotonic() - self._last_start
+
+            with self.condition:
+                self.exporting = False
+                self.condition.notify_all()
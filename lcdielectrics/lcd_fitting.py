@@ -0,0 +1,378 @@
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from lcdielectrics.lcd_calibration import EmptyCellCalibration
+from lcdielectrics.lcd_impedance import PERMITTIVITY_QUANTITIES
+from lcdielectrics.lcd_results import ResultsCube
+
+# Relaxation models fitted to the spectrum at each temperature and voltage:
+#
+#   eps*(w) = eps_inf + delta_eps / (1 + (i w tau)^alpha)^beta - i sigma / (eps0 w)
+#
+# Havriliak-Negami (HN) has 0 < alpha, beta <= 1, Cole-Cole has beta = 1 and
+# Debye has alpha = beta = 1. The last term is dc conductivity and is only
+# included if asked for. Without a calibration the complex capacitance
+# C* = Cp - i Cp D is fitted instead, so eps_inf and delta_eps come out in F
+# and sigma is the dc conductance in S.
+#
+# Internally a fit works on the spectrum divided by its median magnitude,
+# with the parameter vector
+#
+#   [eps_inf, log10 delta_eps, log10 tau, alpha, beta, log10 (sigma / eps0)]
+
+EPS0 = 8.8541878128e-12
+# model: (alpha free, beta free)
+MODELS = {"Debye": (False, False), "Cole-Cole": (True, False), "HN": (True, True)}
+PARAMETERS = ["eps_inf", "delta_eps", "tau", "alpha", "beta", "sigma"]
+
+
+def fit_path(output_file_path: str) -> str:
+    return str(Path(output_file_path).with_suffix(".fit.json"))
+
+
+def relaxation(p: np.ndarray, omega: np.ndarray, conductivity: bool) -> np.ndarray:
+    # p has shape (..., 6), the result (..., len(omega))
+    p = p[..., None]
+    eps = p[..., 0, :] + 10 ** p[..., 1, :] / (
+        1 + (1j * omega * 10 ** p[..., 2, :]) ** p[..., 3, :]
+    ) ** p[..., 4, :]
+    if conductivity:
+        eps = eps - 1j * 10 ** p[..., 5, :] / omega
+    return eps
+
+
+def free_parameters(model: str, conductivity: bool) -> np.ndarray:
+    alpha, beta = MODELS[model]
+    return np.array([True, True, True, alpha, beta, conductivity])
+
+
+def initial_guess(omega: np.ndarray, eps: np.ndarray, model: str) -> np.ndarray:
+    # a rough guess from the shape of the (normalised) spectrum
+    order = np.argsort(omega)
+    omega, eps = omega[order], eps[order]
+    eps_inf = eps.real[-1]
+    delta = max(eps.real.max() - eps_inf, 1e-3)
+    # tau from where eps' is halfway down, which conductivity doesn't move
+    halfway = np.argmin(np.abs(eps.real - (eps_inf + delta / 2)))
+    tau = 1 / omega[halfway]
+    # at the lowest frequency the loss is at most all conductivity
+    kappa = max(-eps.imag[0] * omega[0] / 2, 1e-12)
+    alpha, beta = MODELS[model]
+    return np.array(
+        [
+            eps_inf,
+            np.log10(delta),
+            np.log10(tau),
+            0.9 if alpha else 1.0,
+            0.9 if beta else 1.0,
+            np.log10(kappa),
+        ]
+    )
+
+
+def parameter_bounds(omega: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # tau can sit a few decades outside the measured range
+    log_tau = -np.log10(omega)
+    lower = np.array([-np.inf, -6, log_tau.min() - 3, 0.01, 0.01, -15])
+    upper = np.array([np.inf, 6, log_tau.max() + 3, 1, 1, 15])
+    return lower, upper
+
+
+def levenberg_marquardt(
+    residuals,
+    p0: np.ndarray,
+    free: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    max_iterations: int = 200,
+    tolerance: float = 1e-10,
+) -> tuple[np.ndarray, float, int, bool]:
+    # Minimise sum(residuals(p)**2) over the free parameters. residuals takes
+    # a stack of parameter vectors (k, n) and returns (k, m), so the finite
+    # difference Jacobian is a single call. Returns (p, cost, iterations, converged).
+    p = np.clip(p0, lower, upper)
+    index = np.nonzero(free)[0]
+    r = residuals(p[None])[0]
+    cost = r @ r
+    damping = 1e-3
+    for iteration in range(1, max_iterations + 1):
+        h = 1e-7 * np.maximum(1.0, np.abs(p[index]))
+        trial = np.repeat(p[None], len(index), axis=0)
+        trial[np.arange(len(index)), index] += h
+        J = (residuals(trial) - r) / h[:, None]
+        A = J @ J.T
+        g = J @ r
+        while True:
+            try:
+                step = np.linalg.solve(A + damping * np.diag(np.diag(A) + 1e-12), -g)
+            except np.linalg.LinAlgError:
+                step = np.zeros(len(index))
+            new = p.copy()
+            new[index] += step
+            new = np.clip(new, lower, upper)
+            r_new = residuals(new[None])[0]
+            cost_new = r_new @ r_new
+            if np.isfinite(cost_new) and cost_new < cost:
+                break
+            damping *= 10
+            if damping > 1e12:
+                # no step downhill, we're at the minimum
+                return p, cost, iteration, True
+        improvement = cost - cost_new
+        p, r, cost = new, r_new, cost_new
+        damping = max(damping / 10, 1e-12)
+        if improvement <= tolerance * max(cost, 1e-30):
+            return p, cost, iteration, True
+    return p, cost, max_iterations, False
+
+
+def fit_spectrum(
+    freq: np.ndarray,
+    eps: np.ndarray,
+    model: str = "HN",
+    conductivity: bool = False,
+    guess: dict | None = None,
+) -> dict | None:
+    # Fit one spectrum, eps = eps' - i eps''. guess is an earlier fit (e.g.
+    # from the temperature before) to start from. None if there are fewer
+    # points than free parameters.
+    free = free_parameters(model, conductivity)
+    keep = np.isfinite(freq) & np.isfinite(eps)
+    freq, eps = freq[keep], eps[keep]
+    if len(freq) < 3 or 2 * len(freq) <= free.sum():
+        return None
+    omega = 2 * np.pi * freq
+    scale = np.median(np.abs(eps))
+    target = eps / scale
+    weight = 1 / np.abs(target)
+
+    if guess is None:
+        p0 = initial_guess(omega, target, model)
+    else:
+        p0 = np.array(
+            [
+                guess["eps_inf"] / scale,
+                np.log10(guess["delta_eps"] / scale),
+                np.log10(guess["tau"]),
+                guess["alpha"],
+                guess["beta"],
+                np.log10(
+                    max(guess["sigma"], 1e-300)
+                    / (EPS0 if guess["permittivity"] else 1.0)
+                    / scale
+                ),
+            ]
+        )
+        p0[3:5] = np.where(free[3:5], p0[3:5], 1.0)
+        if not conductivity:
+            p0[5] = initial_guess(omega, target, model)[5]
+    lower, upper = parameter_bounds(omega)
+
+    def residuals(p: np.ndarray) -> np.ndarray:
+        # relative residuals of the real and imaginary parts
+        difference = (relaxation(p, omega, conductivity) - target) * weight
+        return np.concatenate([difference.real, difference.imag], axis=-1)
+
+    p, cost, iterations, converged = levenberg_marquardt(
+        residuals, p0, free, lower, upper
+    )
+    dof = max(2 * len(freq) - free.sum(), 1)
+    return {
+        "eps_inf": p[0] * scale,
+        "delta_eps": 10 ** p[1] * scale,
+        "tau": 10 ** p[2],
+        "alpha": p[3],
+        "beta": p[4],
+        "sigma": 10 ** p[5] * scale if conductivity else 0.0,
+        "chi2": cost / dof,
+        "iterations": iterations,
+        "converged": converged,
+    }
+
+
+def spectrum(
+    cube: ResultsCube,
+    T_step: int,
+    volt_step: int,
+    calibration: EmptyCellCalibration | None = None,
+) -> tuple[np.ndarray, np.ndarray, bool]:
+    # (freq, eps' - i eps'', is permittivity) at one temperature and voltage,
+    # NaN where a point hasn't been measured
+    measured = cube.measured[T_step, :, volt_step]
+    Cp = np.where(measured, cube["Cp"][T_step, :, volt_step], np.nan)
+    D = cube["D"][T_step, :, volt_step]
+    if calibration is not None:
+        real, imag = calibration.permittivity(cube.freq, Cp, D)
+        return cube.freq, real - 1j * imag, True
+    if PERMITTIVITY_QUANTITIES[0] in cube.quantities:
+        real = cube[PERMITTIVITY_QUANTITIES[0]][T_step, :, volt_step]
+        imag = cube[PERMITTIVITY_QUANTITIES[1]][T_step, :, volt_step]
+        return cube.freq, np.where(np.isnan(Cp), np.nan, real - 1j * imag), True
+    return cube.freq, Cp - 1j * Cp * D, False
+
+
+def fit_series(
+    freq: np.ndarray,
+    spectra: list[np.ndarray],
+    permittivity: bool,
+    model: str,
+    conductivity: bool,
+    guess: dict | None = None,
+) -> list[dict | None]:
+    # fit spectra in temperature order, each starting from the fit before
+    fits = []
+    for eps in spectra:
+        fit = fit_spectrum(freq, eps, model, conductivity, guess)
+        if fit is not None:
+            if permittivity:
+                fit["sigma"] *= EPS0
+            fit["permittivity"] = permittivity
+            guess = fit
+        fits.append(fit)
+    return fits
+
+
+def fit_cube(
+    cube: ResultsCube,
+    model: str = "HN",
+    conductivity: bool = False,
+    calibration: EmptyCellCalibration | None = None,
+    workers: int | None = None,
+) -> list[dict]:
+    # Fit every temperature and voltage of a cube. Each voltage's temperatures
+    # are split into one contiguous run per worker process, so every fit but
+    # the first in a run starts from its neighbour's result.
+    workers = workers or os.cpu_count() or 1
+    nT, _, nV = cube.shape
+    tasks = []
+    for v in range(nV):
+        spectra = [spectrum(cube, t, v, calibration) for t in range(nT)]
+        permittivity = spectra[0][2]
+        for steps in np.array_split(np.arange(nT), min(workers, nT)):
+            if len(steps):
+                series = [spectra[t][1] for t in steps]
+                tasks.append(
+                    (v, steps, (cube.freq, series, permittivity, model, conductivity))
+                )
+
+    if workers == 1 or len(tasks) == 1:
+        results = [fit_series(*args) for _, _, args in tasks]
+    else:
+        with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+            futures = [pool.submit(fit_series, *args) for _, _, args in tasks]
+            results = [future.result() for future in futures]
+
+    fits = []
+    for (v, steps, _), series in zip(tasks, results):
+        for t, fit in zip(steps, series):
+            if fit is not None:
+                fits.append(labelled_fit(cube, t, v, model, conductivity, fit))
+    fits.sort(key=lambda fit: (fit["T_step"], fit["volt_step"]))
+    return fits
+
+
+def labelled_fit(
+    cube: ResultsCube,
+    T_step: int,
+    volt_step: int,
+    model: str,
+    conductivity: bool,
+    fit: dict,
+) -> dict:
+    # a fit with where it was measured, as plain JSON-able values
+    return {
+        "T_step": int(T_step),
+        "volt_step": int(volt_step),
+        "T": cube.T[T_step].item(),
+        "volt": cube.volt[volt_step].item(),
+        "model": model,
+        "conductivity": conductivity,
+        **{
+            key: value.item() if isinstance(value, np.generic) else value
+            for key, value in fit.items()
+        },
+    }
+
+
+def write_fits(path: str, fits: list[dict]) -> None:
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(fits, f, indent=4)
+    os.replace(temporary, path)
+
+
+class FitWorker:
+    # Fits each temperature on its own thread as soon as the sequencer has
+    # finished it, starting from the fit at the temperature before, and
+    # rewrites the .fit.json after each one. A fit takes milliseconds, so a
+    # thread keeps up with the sweep without the start up cost of a process.
+    def __init__(self) -> None:
+        self.requests: queue.Queue = queue.Queue()
+        self.fits: list[dict] = []
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def begin(
+        self,
+        output_file_path: str,
+        model: str,
+        conductivity: bool,
+        calibration: EmptyCellCalibration | None,
+    ) -> None:
+        self.requests.put(
+            ("begin", (fit_path(output_file_path), model, conductivity, calibration))
+        )
+
+    def submit(self, results: ResultsCube, T_step: int) -> None:
+        # the cube is only read at T_step, which is finished and won't change
+        self.requests.put(("fit", (results, T_step)))
+
+    def flush(self) -> None:
+        self.requests.join()
+
+    def stop(self) -> None:
+        self.requests.put(("stop", None))
+        self.thread.join()
+
+    def _run(self) -> None:
+        path = model = calibration = None
+        conductivity = False
+        previous: dict[int, dict] = {}
+        while True:
+            request, data = self.requests.get()
+            try:
+                if request == "stop":
+                    return
+                elif request == "begin":
+                    path, model, conductivity, calibration = data
+                    previous = {}
+                    self.fits = []
+                elif request == "fit":
+                    cube, t = data
+                    for v in range(cube.shape[2]):
+                        freq, eps, permittivity = spectrum(cube, t, v, calibration)
+                        fit = fit_series(
+                            freq,
+                            [eps],
+                            permittivity,
+                            model,
+                            conductivity,
+                            previous.get(v),
+                        )[0]
+                        if fit is not None:
+                            previous[v] = fit
+                            self.fits.append(
+                                labelled_fit(cube, t, v, model, conductivity, fit)
+                            )
+                    write_fits(path, self.fits)
+            except Exception as e:
+                print("Fit failed: ", e)
+            finally:
+                self.requests.task_done()
@@ -0,0 +1,118 @@
+import numpy as np
+
+from lcdielectrics.lcd_impedance import PERMITTIVITY_QUANTITIES
+from lcdielectrics.lcd_results import ResultsCube
+
+# Splay Freedericksz analysis of the C-V curves of a planar cell with
+# positive dielectric anisotropy, for every temperature and frequency at once.
+#
+# Below the threshold Vth the director doesn't move and eps = eps_perp. Just
+# above it the capacitance rises linearly,
+#
+#   C / C_perp = 1 + 2 gamma (V / Vth - 1) / (1 + kappa + gamma)
+#
+# with gamma = eps_par / eps_perp - 1 and kappa = K33 / K11 - 1, and at high
+# voltage eps -> eps_par - a / V. Vth = pi sqrt(K11 / (eps0 delta_eps)).
+#
+# Without a calibration the same is done on Cp, so eps_perp, eps_par and
+# delta_eps are capacitances (F) and only K33/K11 can be found.
+
+EPS0 = 8.8541878128e-12
+CV_SHEET = "C-V Analysis"
+# (key, workbook heading)
+CV_COLUMNS = [
+    ("T", "Temperature (C)"),
+    ("freq", "Frequency (Hz)"),
+    ("Vth", "Vth (V)"),
+    ("eps_perp", "eps_perp"),
+    ("eps_par", "eps_par"),
+    ("delta_eps", "delta_eps"),
+    ("K11", "K11 (N)"),
+    ("K33", "K33 (N)"),
+    ("K33/K11", "K33/K11"),
+]
+# points within this fraction of the full rise of the lowest are the baseline
+BASELINE_TOLERANCE = 0.01
+# the part of the rise (as a fraction of the full rise) fitted for the threshold
+THRESHOLD_WINDOW = (0.02, 0.3)
+# eps_par is extrapolated from voltages above this multiple of Vth (or the
+# three highest voltages, if there are fewer than that)
+HIGH_VOLTAGE = 3.0
+
+
+def line_fit(
+    x: np.ndarray, y: np.ndarray, mask: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    # least squares y = a + b x along the last axis over the masked points,
+    # NaN where fewer than two points are selected
+    mask = mask & np.isfinite(y)
+    x = np.broadcast_to(x, y.shape)
+    y = np.where(mask, y, 0.0)
+    n = mask.sum(axis=-1)
+    sx = np.where(mask, x, 0.0).sum(axis=-1)
+    sy = y.sum(axis=-1)
+    sxx = np.where(mask, x * x, 0.0).sum(axis=-1)
+    sxy = np.where(mask, x * y, 0.0).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        a = (sy - b * sx) / n
+    b = np.where(n >= 2, b, np.nan)
+    return np.where(n >= 2, a, np.nan), b
+
+
+def freedericksz(
+    volt: np.ndarray, eps: np.ndarray, permittivity: bool = True
+) -> dict[str, np.ndarray]:
+    # volt is the (nV,) increasing rms voltages and eps the (..., nV) curves,
+    # NaN where not measured. Returns an array per CV_COLUMNS key but T and freq.
+    lowest = np.fmin.reduce(eps, axis=-1, keepdims=True)
+    highest = np.fmax.reduce(eps, axis=-1, keepdims=True)
+    baseline = eps <= lowest + BASELINE_TOLERANCE * (highest - lowest)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eps_perp = np.where(baseline, eps, 0.0).sum(axis=-1) / baseline.sum(axis=-1)
+        rise = (eps - eps_perp[..., None]) / (highest - eps_perp[..., None])
+
+        # the line through the start of the rise crosses C / C_perp = 1 at Vth
+        rising = rise > THRESHOLD_WINDOW[0]
+        window = rising & (rise < THRESHOLD_WINDOW[1])
+        # on a coarse voltage list, the first two points off the baseline
+        first_two = rising & (np.cumsum(rising, axis=-1) <= 2)
+        window = np.where(window.sum(axis=-1, keepdims=True) >= 2, window, first_two)
+        a, slope = line_fit(volt, eps / eps_perp[..., None], window)
+        Vth = (1 - a) / slope
+
+        lowest_high = np.fmin(HIGH_VOLTAGE * Vth, volt[max(len(volt) - 3, 0)])
+        high = volt >= lowest_high[..., None]
+        eps_par = line_fit(1 / volt, eps, high)[0]
+
+        gamma = eps_par / eps_perp - 1
+        K_ratio = 2 * gamma / (slope * Vth) - gamma
+        delta_eps = eps_par - eps_perp
+        if permittivity:
+            K11 = EPS0 * delta_eps * Vth**2 / np.pi**2
+        else:
+            K11 = np.full_like(Vth, np.nan)
+    return {
+        "Vth": Vth,
+        "eps_perp": eps_perp,
+        "eps_par": eps_par,
+        "delta_eps": delta_eps,
+        "K11": K11,
+        "K33": K11 * K_ratio,
+        "K33/K11": K_ratio,
+    }
+
+
+def cv_analysis(cube: ResultsCube) -> dict[str, np.ndarray] | None:
+    # Every C-V curve of a cube, as (nT, nf) arrays keyed as CV_COLUMNS. Uses
+    # eps' if the cube has it (e.g. after EmptyCellCalibration.apply), otherwise
+    # Cp. None if there are too few voltages for a curve.
+    if len(cube.volt) < 4:
+        return None
+    permittivity = PERMITTIVITY_QUANTITIES[0] in cube.quantities
+    values = cube[PERMITTIVITY_QUANTITIES[0] if permittivity else "Cp"]
+    order = np.argsort(np.abs(cube.volt))
+    eps = np.where(cube.measured, values, np.nan)[..., order]
+    analysis = freedericksz(np.abs(cube.volt)[order], eps, permittivity)
+    analysis["T"], analysis["freq"] = np.meshgrid(cube.T, cube.freq, indexing="ij")
+    return analysis
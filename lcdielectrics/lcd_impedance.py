@@ -0,0 +1,34 @@
+import numpy as np
+
+# Quantities derived from a single Cp-D measurement, in the order they are
+# stored in the results. Permittivities come from the empty cell calibration
+# (see lcd_calibration).
+IMPEDANCE_QUANTITIES = ["G", "B", "|Z|", "theta", "Cs", "Rs"]
+PERMITTIVITY_QUANTITIES = ["eps'", "eps''"]
+
+
+def derived_quantity_names() -> list[str]:
+    return list(IMPEDANCE_QUANTITIES)
+
+
+def derive_quantities(freq, Cp, D) -> dict[str, np.ndarray]:
+    # Convert parallel capacitance and dissipation factor into the other
+    # impedance representations. freq, Cp and D may be scalars or arrays that
+    # broadcast together.
+    freq = np.asarray(freq, dtype=float)
+    Cp = np.asarray(Cp, dtype=float)
+    D = np.asarray(D, dtype=float)
+
+    omega = 2 * np.pi * freq
+    # Y = G + jB for the parallel equivalent circuit.
+    B = omega * Cp
+    G = B * D
+    Y_squared = G**2 + B**2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        Z = 1 / np.sqrt(Y_squared)
+        # series equivalent circuit of the same impedance.
+        Cs = Cp * (1 + D**2)
+        Rs = G / Y_squared
+    theta = -np.degrees(np.arctan2(B, G))
+
+    return {"G": G, "B": B, "|Z|": Z, "theta": theta, "Cs": Cs, "Rs": Rs}
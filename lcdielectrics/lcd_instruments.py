@@ -1,16 +1,76 @@
-from typing import Any
+from typing import Any, Callable
+import itertools
+import numpy as np
 import pyvisa
+import pyvisa.util
+import queue
 import threading
+import time
+
+from lcdielectrics.lcd_scpi import ScpiCache
+
+# The E4980A list sweep table holds at most 201 points.
+LIST_MAX_POINTS = 201
+# It has the same number of spot correction frequencies.
+MAX_SPOTS = 201
+
+
+_resource_manager: pyvisa.ResourceManager | None = None
+_resource_manager_lock = threading.Lock()
+
+
+def get_resource_manager() -> pyvisa.ResourceManager:
+    # One ResourceManager is shared by every instrument and by discovery.
+    global _resource_manager
+    with _resource_manager_lock:
+        if _resource_manager is None:
+            _resource_manager = pyvisa.ResourceManager()
+        return _resource_manager
+
+
+# Priorities for the Linkam I/O worker, lower numbers run first. Polling only
+# happens when nothing else is queued.
+PRIORITY_CONTROL = 0
+PRIORITY_QUERY = 1
+
+
+class LinkamCommand:
+    def __init__(self, func: Callable[[], Any]) -> None:
+        self.func = func
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Exception | None = None
 
 
 class LinkamHotstage:
+    # Poll intervals (s) used by the I/O worker. Polling is fast while ramping
+    # and for settle_window seconds after reaching the setpoint, slower while
+    # holding after that and slowest while idle. Read errors back off up to
+    # max_backoff. Commands that haven't run after command_timeout seconds
+    # raise TimeoutError.
+    poll_interval_active = 0.1
+    poll_interval_holding = 0.5
+    poll_interval_idle = 1.0
+    settle_window = 60.0
+    max_backoff = 2.0
+    command_timeout = 30.0
+
     def __init__(self, address: str) -> None:
         self.address = address
-        self.lock = threading.Lock()
+        self.setpoint: float | None = None
+        self.latest_reading: tuple[float, str] = (0.0, "Dunno")
+        self.reading_count = 0
+        self.error_count = 0
+        self.holding_since: float | None = None
+        self.new_reading = threading.Condition()
+        self.queue: queue.PriorityQueue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.worker: threading.Thread | None = None
         self.initialise_linkam()
+        self.start_worker()
 
     def initialise_linkam(self) -> None:
-        rm = pyvisa.ResourceManager()
+        rm = get_resource_manager()
 
         self.link = rm.open_resource(self.address)
         self.init = False
@@ -23,7 +83,7 @@ class LinkamHotstage:
         self.link.timeout = 3000
 
         try:
-            self.current_temperature()
+            self._read_temperature()
             print("Linkam Connected!")
 
         except pyvisa.errors.VisaIOError:
@@ -32,37 +92,148 @@ class LinkamHotstage:
                 (make sure it is switched on)"
             )
 
-    def set_temperature(self, T: float, rate: float = 20.0) -> None:
-        if self.init:
-            with self.lock:
-                self.link.write(f"R1{int(rate*100)}")  # type: ignore
-                self.link.read()  # type: ignore
-                self.link.write(f"L1{int(T*10)}")  # type: ignore
-                self.link.read()  # type: ignore
+    def start_worker(self) -> None:
+        # The worker is the only thread that touches the serial port.
+        self.worker = threading.Thread(target=self._run_worker)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def _check_worker(self, worker: threading.Thread) -> None:
+        if not worker.is_alive():
+            raise RuntimeError("The Linkam I/O worker has stopped")
+
+    def _submit(self, priority: int, func: Callable[[], Any]) -> Any:
+        worker = self.worker
+        if worker is None or threading.current_thread() is worker:
+            return func()
+        self._check_worker(worker)
+        command = LinkamCommand(func)
+        self.queue.put((priority, next(self.sequence), command))
+        deadline = time.monotonic() + self.command_timeout
+        while not command.done.wait(0.1):
+            self._check_worker(worker)
+            if time.monotonic() > deadline:
+                raise TimeoutError("The Linkam didn't answer in time")
+        if command.error is not None:
+            raise command.error
+        return command.result
+
+    def _run_worker(self) -> None:
+        next_poll = time.monotonic()
+        while True:
+            try:
+                _, _, command = self.queue.get(
+                    timeout=max(0.0, next_poll - time.monotonic())
+                )
+            except queue.Empty:
+                self._poll()
+                next_poll = time.monotonic() + self.poll_interval()
+                continue
+
+            if command is None:
+                break
+            try:
+                command.result = command.func()
+            except Exception as e:
+                command.error = e
+            command.done.set()
+
+    def _poll(self) -> None:
+        # anything going wrong with a reading (e.g. a short reply) counts as a
+        # read error, the worker has to keep running
+        try:
+            reading = self._read_temperature()
+        except Exception:
+            reading = None
+
+        if reading is None:
+            self.error_count += 1
+            return
+
+        self.error_count = 0
+        temperature, status = reading
+        if (
+            status == "Holding"
+            and self.setpoint is not None
+            and abs(temperature - self.setpoint) <= 0.5
+        ):
+            if self.holding_since is None:
+                self.holding_since = time.monotonic()
         else:
-            with self.lock:
-                self.link.write(f"R1{int(rate*100)}")  # type: ignore
-                self.link.read()  # type: ignore
-                self.link.write(f"L1{int(T*10)}")  # type: ignore
-                self.link.read()  # type: ignore
-                self.link.write("S")  # type: ignore
-                self.link.read()
+            self.holding_since = None
+        with self.new_reading:
+            self.latest_reading = reading
+            self.reading_count += 1
+            self.new_reading.notify_all()
+
+    def poll_interval(self) -> float:
+        if self.error_count:
+            return min(
+                self.max_backoff, self.poll_interval_active * 2**self.error_count
+            )
+        status = self.latest_reading[1]
+        if status == "Stopped" or self.setpoint is None:
+            return self.poll_interval_idle
+        elif self.holding_since is None:
+            # ramping towards the setpoint
+            return self.poll_interval_active
+        elif time.monotonic() - self.holding_since < self.settle_window:
+            # stabilising at the setpoint
+            return self.poll_interval_active
+        return self.poll_interval_holding
+
+    def wait_for_reading(self, timeout: float | None = None) -> tuple[float, str]:
+        # block until the worker has polled a new valid reading, raises
+        # TimeoutError if there wasn't one within timeout
+        worker = self.worker
+        if worker is not None:
+            self._check_worker(worker)
+        with self.new_reading:
+            count = self.reading_count
+            if not self.new_reading.wait_for(
+                lambda: self.reading_count != count, timeout=timeout
+            ):
+                raise TimeoutError("No new Linkam reading")
+            return self.latest_reading
 
-                self.init = True
+    def set_temperature(self, T: float, rate: float = 20.0) -> None:
+        self._submit(PRIORITY_CONTROL, lambda: self._set_temperature(T, rate))
+
+    def _set_temperature(self, T: float, rate: float) -> None:
+        self.link.write(f"R1{int(rate*100)}")  # type: ignore
+        self.link.read()  # type: ignore
+        self.link.write(f"L1{int(T*10)}")  # type: ignore
+        self.link.read()  # type: ignore
+        if not self.init:
+            self.link.write("S")  # type: ignore
+            self.link.read()
+
+            self.init = True
+        self.setpoint = T
+        # the settle window starts again once the new setpoint is reached
+        self.holding_since = None
 
     def stop(self) -> None:
-        with self.lock:
-            self.link.write("E")  # type: ignore
-            self.link.read()  # type: ignore
-            self.init = False
+        self._submit(PRIORITY_CONTROL, self._stop)
+
+    def _stop(self) -> None:
+        self.link.write("E")  # type: ignore
+        self.link.read()  # type: ignore
+        self.init = False
+        self.setpoint = None
 
     def current_temperature(self) -> tuple[float, str]:
-        with self.lock:
-            try:
-                self.link.write("T")  # type: ignore
-                raw_string = self.link.read_raw()  # type: ignore
-            except UnicodeDecodeError:
-                return 0.0, 0.0
+        reading = self._submit(PRIORITY_QUERY, self._read_temperature)
+        if reading is None:
+            return 0.0, 0.0
+        return reading
+
+    def _read_temperature(self) -> tuple[float, str] | None:
+        try:
+            self.link.write("T")  # type: ignore
+            raw_string = self.link.read_raw()  # type: ignore
+        except UnicodeDecodeError:
+            return None
         status_byte = int(raw_string[0])
 
         if status_byte == 1:
@@ -78,20 +249,26 @@ class LinkamHotstage:
         try:
             temperature = int(raw_string[6:10], 16) / 10.0
         except ValueError:
-            return 0.0, 0.0
+            return None
         return temperature, status
 
     def close(self):
+        if self.worker is not None:
+            self.queue.put((PRIORITY_CONTROL, next(self.sequence), None))
+            self.worker.join()
+            self.worker = None
         self.link.close()
 
 
 class AgilentSpectrometer:
-    def __init__(self, address: str) -> None:
+    def __init__(self, address: str, data_format: str = "ASCII") -> None:
         self.address = address
+        # "ASCII" or "REAL" (binary REAL,64)
+        self.data_format = data_format
         self.initialise(self.address)
 
     def initialise(self, address: str) -> None:
-        rm = pyvisa.ResourceManager()
+        rm = get_resource_manager()
         self.spectrometer = rm.open_resource(
             address
         )  # if no USB attached, this just connects to whatever first instrument is...
@@ -101,72 +278,288 @@ class AgilentSpectrometer:
         # set timeout to long enough that the machine doesn't loose
         # connection during measurement.
         self.spectrometer.timeout = None
+        self.scpi = ScpiCache(self.spectrometer)
         # self.spectrometer.query("*IDN?")
         try:
-            self.spectrometer.write("*IDN?")
-            self.spectrometer_id = self.spectrometer.read()  # type: ignore
+            self.spectrometer_id = self.scpi.query("*IDN?")
             print(self.spectrometer_id)
             self.reset_and_clear()
 
         except pyvisa.errors.VisaIOError:
             print("Could not connect to E4980A. Check address is correct.")
 
+    def batch(self):
+        # commands sent inside this context go out as one bus transaction
+        return self.scpi.batch()
+
     def reset_and_clear(self) -> None:
-        self.spectrometer.write("*RST; *CLS")  # type:ignore # reset and clear buffer
-        self.spectrometer.write(":DISP:ENAB")  # type:ignore # enable display and update
-        self.spectrometer.write(  # type: ignore
-            ":INIT:CONT"
-        )  # type: ignore # automatically perform continuous measurements
-        self.spectrometer.write(":TRIG:SOUR EXT")  # type: ignore
-        self.set_voltage(0)
+        with self.batch():
+            self.scpi.write("*RST;*CLS")  # reset and clear buffer
+            # *RST puts every setting back to its default
+            self.scpi.invalidate()
+            self.scpi.write(":DISP:ENAB")  # enable display and update
+            # automatically perform continuous measurements
+            self.scpi.write(":INIT:CONT")
+            self.scpi.set(":TRIG:SOUR", "EXT")
+            self.set_voltage(0)
+            # *RST puts the data format back to ASCII
+            self.set_data_format(self.data_format)
+
+    def set_data_format(self, data_format: str) -> None:
+        with self.batch():
+            if data_format == "REAL":
+                self.scpi.set(":FORM:DATA", "REAL,64")
+                self.scpi.set(":FORM:BORD", "NORM")  # big endian
+            else:
+                self.scpi.set(":FORM:DATA", "ASC")
+        self.data_format = data_format
+
+    def read_values(self) -> np.ndarray:
+        if self.data_format != "REAL":
+            return self.spectrometer.read_ascii_values(container=np.array)  # type: ignore
+        try:
+            return self.spectrometer.read_binary_values(  # type: ignore
+                datatype="d", is_big_endian=True, container=np.array
+            )
+        except (pyvisa.errors.VisaIOError, ValueError) as e:
+            print("Binary read failed, reading the point again as ASCII: ", e)
+        # Drop whatever is left of the binary block. FETC? returns the last
+        # result again without re-triggering, so this point can be read back
+        # as ASCII before going back to REAL for the next one.
+        self.spectrometer.clear()  # type: ignore
+        with self.batch():
+            self.scpi.set(":FORM:DATA", "ASC")
+            self.scpi.write(":FETC?")
+        try:
+            return self.spectrometer.read_ascii_values(container=np.array)  # type: ignore
+        finally:
+            self.set_data_format("REAL")
+
+    def fetch(self) -> np.ndarray:
+        # the lock keeps other threads off the bus until the reply is read
+        with self.scpi.lock:
+            self.scpi.write(":FETC?")  # request data acquisition
+            return self.read_values()
 
     def set_frequency(self, freq: float) -> None:
-        self.spectrometer.write(f":FREQ {freq}")
+        self.scpi.set(":FREQ", freq)
 
     def set_freq_list(self, freq_list: Any) -> None:
-        self.spectrometer.write(":DISP:PAGE LIST")  # type: ignore
-        self.spectrometer.write(":LIST:MODE SEQ")  # type: ignore
-
-        freq_str = str(freq_list)
-        freq_str = freq_str.split("[")[1].split("]")[0]
+        freq_str = ",".join(str(float(x)) for x in freq_list)
 
-        self.spectrometer.write(":LIST:FREQ ", freq_str)  # type: ignore
+        with self.batch():
+            self.scpi.set(":DISP:PAGE", "LIST")
+            self.scpi.set(":LIST:MODE", "SEQ")
+            # the table holds one parameter type at a time
+            self.scpi.invalidate(":LIST:VOLT")
+            # an unchanged table is not uploaded again
+            self.scpi.set(":LIST:FREQ", freq_str)
 
     def set_volt_list(self, volt_list: Any) -> None:
-        self.spectrometer.write(":DISP:PAGE LIST")  # type: ignore
-        self.spectrometer.write(":LIST:MODE SEQ")  # type: ignore
-
-        volt_str = str(volt_list)
-        volt_str = volt_str.split("[")[1].split("]")[0]
-
-        self.spectrometer.write(":LIST:VOLT ", volt_str)  # type: ignore
+        volt_str = ",".join(str(float(x)) for x in volt_list)
+
+        with self.batch():
+            self.scpi.set(":DISP:PAGE", "LIST")
+            self.scpi.set(":LIST:MODE", "SEQ")
+            self.scpi.invalidate(":LIST:FREQ")
+            self.scpi.set(":LIST:VOLT", volt_str)
+
+    def set_list_step_delay(self, delay: float) -> None:
+        self.scpi.set(":TRIG:TDEL", delay)
+
+    def finish_list_sweep(self) -> None:
+        # go back to single point measurements on the meas page, leaving the
+        # table in place in case the same list is swept again.
+        with self.batch():
+            self.scpi.set(":DISP:PAGE", "MEAS")
+            self.set_list_step_delay(0)
+
+    def clear_list(self) -> None:
+        with self.batch():
+            self.scpi.write(":LIST:CLE:ALL")
+            self.scpi.invalidate(":LIST:FREQ", ":LIST:VOLT")
+            self.finish_list_sweep()
+
+    def measure_list(self, func: str, n_points: int) -> np.ndarray:
+        with self.scpi.lock:
+            with self.batch():
+                self.scpi.set(":FUNC:IMP", func)
+                # in SEQ mode a single trigger sweeps the whole list table.
+                self.scpi.write(":TRIG:IMM")
+                self.scpi.write(":FETC?")
+            # each point is returned as [val1, val2, data_status, comparator]
+            return self.read_values().reshape(n_points, -1)[:, :3]
+
+    def sweep_freq_list(self, func: str, freq_list: Any) -> np.ndarray:
+        chunks = []
+        for i in range(0, len(freq_list), LIST_MAX_POINTS):
+            chunk = freq_list[i : i + LIST_MAX_POINTS]
+            self.set_freq_list(chunk)
+            chunks.append(self.measure_list(func, len(chunk)))
+        return np.concatenate(chunks)
+
+    def sweep_volt_list(self, func: str, volt_list: Any) -> np.ndarray:
+        chunks = []
+        for i in range(0, len(volt_list), LIST_MAX_POINTS):
+            chunk = volt_list[i : i + LIST_MAX_POINTS]
+            self.set_volt_list(chunk)
+            chunks.append(self.measure_list(func, len(chunk)))
+        return np.concatenate(chunks)
 
     def set_voltage(self, volt: float) -> None:
-        self.spectrometer.write(f":VOLT {volt}")  # type: ignore
+        self.scpi.set(":VOLT", volt)
 
     def set_func(self, func: str, auto: bool = True) -> None:
-        self.spectrometer.write(f":FUNC:IMP {func}")  # type: ignore
-        if auto:
-            self.spectrometer.write(":FUNC:IMP:RANG:AUTO ON")  # type: ignore
+        with self.batch():
+            self.scpi.set(":FUNC:IMP", func)
+            if auto:
+                self.scpi.set(":FUNC:IMP:RANG:AUTO", "ON")
 
     def set_aperture_mode(self, mode: str, av_factor: int) -> None:
-        self.spectrometer.write(f":APER {mode},{av_factor}")  # type: ignore
+        self.scpi.set(":APER", f"{mode},{av_factor}")
 
-    def measure(self, func: str) -> list[float]:
+    def measure(self, func: str) -> np.ndarray:
         # self.spectrometer.write(":INIT")
-        self.spectrometer.write(f":FUNC:IMP {func}")  # type: ignore
-        self.spectrometer.write(":TRIG:IMM")  # type: ignore
-        self.spectrometer.write(":FETC?")  # type: ignore # request data acquisition
-        # get data as [val1, val2, data_status].
-        # For CP-D func, this is [Cp, D, data_status]
-        return self.spectrometer.read_ascii_values()  # type: ignore
+        # unchanged settings are skipped, so this is usually one transaction
+        with self.scpi.lock:
+            with self.batch():
+                self.scpi.set(":FUNC:IMP", func)
+                self.scpi.write(":TRIG:IMM")
+                self.scpi.write(":FETC?")  # request data acquisition
+            # get data as [val1, val2, data_status].
+            # For CP-D func, this is [Cp, D, data_status]
+            return self.read_values()
+
+    def measure_spot_correction(
+        self,
+        standard: str,
+        freq_list: Any,
+        load_Cp: float = 0.0,
+        load_D: float = 0.0,
+    ) -> None:
+        # Have the E4980A measure an open, short or load correction itself at
+        # each frequency of the list (one spot per frequency). It keeps the
+        # data in non-volatile memory.
+        if len(freq_list) > MAX_SPOTS:
+            raise ValueError(f"The E4980A only has {MAX_SPOTS} correction spots")
+        command = {"open": "OPEN", "short": "SHOR", "load": "LOAD"}[standard]
+        with self.scpi.lock:
+            with self.batch():
+                if standard == "load":
+                    self.scpi.set(":CORR:LOAD:TYPE", "CPD")
+                for n, freq in enumerate(freq_list, start=1):
+                    self.scpi.set(f":CORR:SPOT{n}:FREQ", float(freq))
+                    self.scpi.set(f":CORR:SPOT{n}:STAT", "ON")
+                    if standard == "load":
+                        self.scpi.set(
+                            f":CORR:SPOT{n}:LOAD:STAN", f"{load_Cp},{load_D}"
+                        )
+                    self.scpi.write(f":CORR:SPOT{n}:{command}")
+            # corrections take a while, wait for them to finish
+            self.scpi.query("*OPC?")
+
+    def enable_corrections(
+        self, freq_list: Any, open: bool, short: bool, load: bool
+    ) -> None:
+        # use the instrument's spot corrections at the frequencies of the list
+        if len(freq_list) > MAX_SPOTS:
+            raise ValueError(f"The E4980A only has {MAX_SPOTS} correction spots")
+        state = {True: "ON", False: "OFF"}
+        with self.batch():
+            for n, freq in enumerate(freq_list, start=1):
+                self.scpi.set(f":CORR:SPOT{n}:FREQ", float(freq))
+                self.scpi.set(f":CORR:SPOT{n}:STAT", "ON")
+            self.scpi.set(":CORR:OPEN:STAT", state[open])
+            self.scpi.set(":CORR:SHOR:STAT", state[short])
+            self.scpi.set(":CORR:LOAD:STAT", state[load])
 
     def set_DC_bias(self, voltage: float) -> None:
-        self.spectrometer.write(f":BIAS:VOLT {voltage}")  # type: ignore
-        self.spectrometer.write(":BIAS:STATE ON")  # type: ignore
+        with self.batch():
+            self.scpi.set(":BIAS:VOLT", voltage)
+            self.scpi.set(":BIAS:STATE", "ON")
 
     def turn_off_DC_bias(self) -> None:
-        self.spectrometer.write(":BIAS:STATE OFF")  # type: ignore
+        self.scpi.set(":BIAS:STATE", "OFF")
 
     def close(self):
         self.spectrometer.close()
+
+
+class Oscilloscope:
+    def __init__(self, address: str, waveform_format: str = "ASCII") -> None:
+        self.address = address
+        # "ASCII", "BYTE" or "WORD"
+        self.waveform_format = waveform_format
+        # number of acquisitions averaged on the scope, 1 for normal acquisition
+        self.hardware_averages = 1
+        self.y_increment = 1.0
+        self.y_origin = 0.0
+        self.y_reference = 0.0
+        self.initialise(self.address)
+
+    def initialise(self, address: str) -> None:
+        rm = get_resource_manager()
+        self.scope = rm.open_resource(address)
+        self.scpi = ScpiCache(self.scope)
+        self.setup(self.waveform_format, self.hardware_averages)
+
+    def setup(self, waveform_format: str, hardware_averages: int = 1) -> None:
+        # Everything here only needs to be sent once, not after every
+        # acquisition. Settings that are already in place are skipped.
+        commands_sent = self.scpi.commands_sent
+        with self.scpi.batch():
+            self.scpi.set(":WAVeform:SOURce", "CHANnel1")
+            self.scpi.set(":TIMebase:DELay", 0)
+            self.scpi.set(":WAVeform:FORMat", waveform_format)
+            if waveform_format != "ASCII":
+                self.scpi.set(":WAVeform:BYTeorder", "LSBFirst")
+                self.scpi.set(":WAVeform:UNSigned", 1)
+            if hardware_averages > 1:
+                self.scpi.set(":ACQuire:TYPE", "AVERage")
+                self.scpi.set(":ACQuire:COUNt", hardware_averages)
+            else:
+                self.scpi.set(":ACQuire:TYPE", "NORMal")
+        self.waveform_format = waveform_format
+        self.hardware_averages = hardware_averages
+        # the scaling of binary waveforms only changes with these settings
+        if waveform_format != "ASCII" and self.scpi.commands_sent != commands_sent:
+            self.read_preamble()
+
+    def read_preamble(self) -> None:
+        # format, type, points, count, xinc, xorigin, xref, yinc, yorigin, yref
+        preamble = [
+            float(x) for x in self.scpi.query(":WAVeform:PREamble?").split(",")
+        ]
+        self.y_increment = preamble[7]
+        self.y_origin = preamble[8]
+        self.y_reference = preamble[9]
+
+    def digitize(self) -> None:
+        self.scpi.write(":DIGitize CHANnel1")
+
+    def read_waveform(self) -> np.ndarray:
+        if self.waveform_format == "ASCII":
+            data = self.scpi.query(":WAV:DATA?")
+            # the first value carries the block header
+            return np.array([float(x) for x in data.strip().split(",")[1:]])
+
+        with self.scpi.lock:
+            self.scpi.write(":WAV:DATA?")
+            self.scpi.flush()
+            raw = self.scope.read_raw()  # type: ignore
+        offset, data_length = pyvisa.util.parse_ieee_block_header(raw)
+        dtype = "<u2" if self.waveform_format == "WORD" else "u1"
+        codes = np.frombuffer(
+            raw, dtype=dtype, count=data_length // np.dtype(dtype).itemsize, offset=offset
+        )
+        return (codes - self.y_reference) * self.y_increment + self.y_origin
+
+    def mean_voltage(self) -> float:
+        # digitize and read back in one transaction
+        with self.scpi.batch():
+            self.digitize()
+            waveform = self.read_waveform()
+        return float(np.mean(waveform))
+
+    def close(self):
+        self.scope.close()
@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+
+import numpy as np
+
+from lcdielectrics.lcd_columnar import INDEX_COLUMNS, load_columns
+from lcdielectrics.lcd_freedericksz import CV_SHEET
+from lcdielectrics.lcd_results import ResultsCube
+from lcdielectrics.lcd_store import read_records
+
+# Reads any of the outputs of a run back into a ResultsCube:
+#
+#   cube = load_results("results.json", T=slice(30, 60), freq=[1000.0])
+#   cube["Cp"][t, f, v], cube.T, cube.freq, cube.volt
+#
+# The first load of a file parses it and keeps the arrays in a sidecar
+# "<file>.lcdcache" directory. Later loads memory map those arrays, so only
+# the selected temperatures and frequencies are read.
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".lcdcache"
+
+
+def load_results(
+    path: str,
+    T=None,
+    freq=None,
+    use_cache: bool = True,
+) -> ResultsCube:
+    # T and freq pick a subset: a value, a list of values, or slice(lo, hi)
+    # for an inclusive range of values. None keeps everything.
+    cube = None
+    if use_cache:
+        cube = read_cache(path)
+    if cube is None:
+        cube = parse_results(path)
+        if use_cache:
+            write_cache(path, cube)
+            # None if the cache couldn't be written, keep the parsed cube
+            cube = read_cache(path) or cube
+    return cube.select(select_index(cube.T, T), select_index(cube.freq, freq))
+
+
+def parse_results(path: str) -> ResultsCube:
+    suffix = Path(path).suffix.lower()
+    if suffix == ".json":
+        with open(path, "r") as f:
+            return cube_from_dict(json.load(f))
+    elif suffix == ".jsonl":
+        header, points = read_records(path)
+        if header is None:
+            raise ValueError(f"{path} has no run header")
+        return ResultsCube.from_records(header, points)
+    elif suffix == ".npz":
+        return cube_from_columns(load_columns(path))
+    elif suffix == ".xlsx":
+        return cube_from_workbook(path)
+    raise ValueError(f"Don't know how to load {path}")
+
+
+def select_index(values: np.ndarray, selection):
+    if selection is None:
+        return slice(None)
+    if isinstance(selection, slice):
+        lo = -np.inf if selection.start is None else selection.start
+        hi = np.inf if selection.stop is None else selection.stop
+        return np.nonzero((values >= lo) & (values <= hi))[0]
+    wanted = np.atleast_1d(np.asarray(selection, dtype=float))
+    return np.nonzero(np.isclose(values[:, None], wanted[None, :]).any(axis=1))[0]
+
+
+def key_value(key: str) -> float:
+    # "3: 45.0" -> 45.0
+    return float(key.split(":", 1)[1])
+
+
+class CubeBuilder:
+    # collects points with coordinates in order of first appearance
+    def __init__(self) -> None:
+        self.T: list[float] = []
+        self.freq: list[float] = []
+        self.volt: list[float] = []
+        self.volt_index: dict[float, int] = {}
+        self.points: list[tuple[int, int, int, dict]] = []
+        self.quantities: list[str] = []
+
+    def add_T(self, T: float) -> int:
+        # temperatures can repeat (e.g. heating then cooling), so always new
+        self.T.append(T)
+        return len(self.T) - 1
+
+    def freq_index(self, freq: float) -> int:
+        if freq not in self.freq:
+            self.freq.append(freq)
+        return self.freq.index(freq)
+
+    def add_point(self, t: int, f: int, volt: float, values: dict) -> None:
+        if volt not in self.volt_index:
+            self.volt_index[volt] = len(self.volt)
+            self.volt.append(volt)
+        for quantity in values:
+            if quantity not in self.quantities:
+                self.quantities.append(quantity)
+        self.points.append((t, f, self.volt_index[volt], values))
+
+    def build(self) -> ResultsCube:
+        cube = ResultsCube(self.T, self.freq, self.volt, self.quantities)
+        for t, f, v, values in self.points:
+            cube.set_point(t, f, v, values)
+        return cube
+
+
+def cube_from_dict(results: dict) -> ResultsCube:
+    # the {"1: 25.0": {"1: 20.0": {"volt": [...], "Cp": [...]}}} JSON layout
+    builder = CubeBuilder()
+    for T_key, T_dict in results.items():
+        t = builder.add_T(key_value(T_key))
+        for freq_key, entry in T_dict.items():
+            f = builder.freq_index(key_value(freq_key))
+            quantities = [q for q in entry if q != "volt"]
+            for i, volt in enumerate(entry["volt"]):
+                builder.add_point(
+                    t,
+                    f,
+                    float(volt),
+                    {q: float_or_nan(entry[q][i]) for q in quantities},
+                )
+    return builder.build()
+
+
+def cube_from_columns(columns: dict[str, np.ndarray]) -> ResultsCube:
+    # the one-row-per-point .npz from lcd_columnar
+    quantities = [
+        c
+        for c in columns
+        if c not in INDEX_COLUMNS + ["T", "freq", "volt", "bias", "time", "T_linkam"]
+    ]
+    shape = tuple(int(columns[c].max()) + 1 for c in INDEX_COLUMNS)
+    coordinates = []
+    for index, name, n in zip(INDEX_COLUMNS, ["T", "freq", "volt"], shape):
+        values = np.full(n, np.nan)
+        values[columns[index]] = columns[name]
+        coordinates.append(values)
+    index = tuple(columns[c] for c in INDEX_COLUMNS)
+    data = {}
+    for quantity in quantities:
+        data[quantity] = np.full(shape, np.nan)
+        data[quantity][index] = columns[quantity]
+    measured = np.zeros(shape, dtype=bool)
+    measured[index] = True
+    return ResultsCube.from_arrays(*coordinates, data, measured)
+
+
+def coordinate(value) -> float:
+    # older workbooks wrote frequencies as "n: f" keys
+    if isinstance(value, str):
+        return key_value(value)
+    return float(value)
+
+
+def float_or_nan(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def read_sheets(path: str) -> list[tuple[str, list[list]]]:
+    # [(sheet name, rows)] from an xlsx, with only what make_excel writes:
+    # numbers, strings and error cells (NaN)
+    ns = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+    rel_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+    with zipfile.ZipFile(path) as archive:
+        shared = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            root = ElementTree.fromstring(archive.read("xl/sharedStrings.xml"))
+            shared = ["".join(si.itertext()) for si in root.findall("m:si", ns)]
+        rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        sheets = []
+        for sheet in workbook.find("m:sheets", ns):
+            target = targets[sheet.get(rel_ns)].lstrip("/")
+            if not target.startswith("xl/"):
+                target = "xl/" + target
+            root = ElementTree.fromstring(archive.read(target))
+            rows = []
+            for row in root.iter(f"{{{ns['m']}}}row"):
+                values: list = []
+                for cell in row.findall("m:c", ns):
+                    column = column_number(cell.get("r"))
+                    values += [None] * (column - len(values))
+                    values.append(cell_value(cell, shared, ns))
+                index = int(row.get("r")) - 1
+                rows += [[] for _ in range(index - len(rows))]
+                rows.append(values)
+            sheets.append((sheet.get("name"), rows))
+    return sheets
+
+
+def column_number(reference: str) -> int:
+    letters = re.match(r"[A-Z]+", reference).group()
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number - 1
+
+
+def cell_value(cell, shared: list[str], ns: dict):
+    kind = cell.get("t")
+    if kind == "inlineStr":
+        return "".join(cell.find("m:is", ns).itertext())
+    value = cell.find("m:v", ns)
+    if value is None:
+        return None
+    if kind == "s":
+        return shared[int(value.text)]
+    if kind in ("str", "e"):
+        return value.text if kind == "str" else np.nan
+    return float(value.text)
+
+
+def cube_from_workbook(path: str) -> ResultsCube:
+    # the layouts written by lcd_excel_writer.make_excel. Spilled sheets
+    # ("<name> (2)") carry on from the sheet before them, possibly part way
+    # through a block.
+    builder = CubeBuilder()
+    t = f = volt = None
+    headings: list = []
+    single_volt = False
+    for name, rows in read_sheets(path):
+        rows = [row for row in rows if any(x is not None for x in row)]
+        if not rows:
+            continue
+        spilled = re.search(r" \(\d+\)$", name) is not None
+        if name.startswith(CV_SHEET):
+            # results of the analysis, not measurements
+            continue
+        if name.startswith("Multi T"):
+            # Temperature (C), Frequency (Hz), Voltage (V), quantities...
+            if not spilled:
+                headings = rows[0][3:]
+                rows = rows[1:]
+            for row in rows:
+                t = builder.add_T(row[0])
+                f = builder.freq_index(row[1])
+                builder.add_point(t, f, row[2], dict(zip(headings, row[3:])))
+            continue
+        if not spilled:
+            t = builder.add_T(key_value(name.replace(" - ", ":", 1)))
+            single_volt = rows[0][0] == "Voltage (V)"
+            f = None
+            headings = []
+            if single_volt:
+                volt = rows[0][1]
+                headings = rows[1][1:]
+                rows = rows[2:]
+        if single_volt:
+            # Freq (Hz), quantities... per row
+            for row in rows:
+                f = builder.freq_index(coordinate(row[0]))
+                builder.add_point(t, f, volt, dict(zip(headings, row[1:])))
+            continue
+        # blocks of "Frequency (Hz): " f, headings, then one row per voltage
+        for row in rows:
+            if row[0] == "Frequency (Hz): ":
+                f = builder.freq_index(row[1])
+            elif row[0] == "volt":
+                headings = row[1:]
+            else:
+                builder.add_point(t, f, row[0], dict(zip(headings, row[1:])))
+    return builder.build()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_dir(path: str) -> Path:
+    return Path(str(path) + CACHE_SUFFIX)
+
+
+def read_cache(path: str) -> ResultsCube | None:
+    # The cache is used if the file's size and mtime match. If only the mtime
+    # changed (e.g. copied to another disk) the contents are hashed instead.
+    directory = cache_dir(path)
+    try:
+        with open(directory / "meta.json", "r") as f:
+            meta = json.load(f)
+        stat = os.stat(path)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if meta.get("version") != CACHE_VERSION or meta["size"] != stat.st_size:
+        return None
+    if meta["mtime"] != stat.st_mtime_ns:
+        if meta["sha1"] != file_hash(path):
+            return None
+        meta["mtime"] = stat.st_mtime_ns
+        try:
+            with open(directory / "meta.json", "w") as f:
+                json.dump(meta, f)
+        except OSError:
+            # read only, the hash is checked again next time
+            pass
+
+    def array(name: str) -> np.ndarray:
+        return np.load(directory / f"{name}.npy", mmap_mode="r")
+
+    data = {q: array(f"q{i}") for i, q in enumerate(meta["quantities"])}
+    return ResultsCube.from_arrays(
+        array("T"), array("freq"), array("volt"), data, array("measured")
+    )
+
+
+def write_cache(path: str, cube: ResultsCube) -> None:
+    directory = cache_dir(path)
+    temporary = Path(str(directory) + ".tmp")
+    shutil.rmtree(temporary, ignore_errors=True)
+    try:
+        # no file yet for the .npz of a run that is still going
+        stat = os.stat(path)
+        temporary.mkdir()
+    except OSError:
+        # e.g. a read only folder, just don't cache
+        return
+    meta = {
+        "version": CACHE_VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha1": file_hash(path),
+        "quantities": cube.quantities,
+    }
+    np.save(temporary / "T.npy", cube.T)
+    np.save(temporary / "freq.npy", cube.freq)
+    np.save(temporary / "volt.npy", cube.volt)
+    np.save(temporary / "measured.npy", cube.measured)
+    # quantity names like |Z| aren't valid file names everywhere
+    for i, quantity in enumerate(cube.quantities):
+        np.save(temporary / f"q{i}.npy", cube.data[quantity])
+    with open(temporary / "meta.json", "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.replace(temporary, directory)
+    except OSError:
+        # on Windows the old cache can't be removed while another load still
+        # has its arrays memory mapped. Keep using the parsed results.
+        shutil.rmtree(temporary, ignore_errors=True)
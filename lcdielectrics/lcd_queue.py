@@ -0,0 +1,208 @@
+import threading
+from dataclasses import dataclass, replace
+from enum import Enum
+
+from lcdielectrics.lcd_dataclasses import measurement_settings
+from lcdielectrics.lcd_sequencer import MeasurementSequencer
+from lcdielectrics.lcd_temperature_plan import plan_run, setpoints
+
+# A queue of measurement setups run one after another on the same stage.
+# Where jobs share temperatures they are interleaved, so the stage goes to
+# (and stabilises at) each setpoint once and every job waiting for it is
+# measured there before moving on.
+#
+# Each job visits its temperatures in the order planned when it is added
+# (see lcd_temperature_plan), starting from where the job before it ends. It
+# is run in segments with MeasurementSequencer.start(..., last_T_position),
+# which stops after that temperature with the stage still holding. The next
+# segment of the job carries on from its record log, as a resumed run would.
+# Jobs can be added, removed and reordered while the queue runs, the visits
+# are planned again before each segment.
+
+
+class JobStatus(Enum):
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    DONE = "Done"
+    FAILED = "Failed"
+
+
+@dataclass
+class measurement_job:
+    settings: measurement_settings
+    id: int
+    # the visit order, as indices into the job's temperature list
+    order: list[int]
+    # the first position in order not yet measured
+    next_position: int = 0
+    # once a job has been started its later runs carry on from its record log
+    started: bool = False
+    status: JobStatus = JobStatus.QUEUED
+
+
+@dataclass
+class temperature_visit:
+    T: float
+    # (job, position in its order) of every job measured at this visit, in
+    # queue order
+    steps: list[tuple[measurement_job, int]]
+
+
+def plan_visits(
+    jobs: list[measurement_job], current_T: float | None = None
+) -> list[temperature_visit]:
+    # Greedily merge the remaining temperatures of each job, in queue order.
+    # Each temperature joins the first visit to the same setpoint after the
+    # job's previous one, or is added at the end, so every job still runs
+    # through its own list in order. A job waiting at current_T (where the
+    # stage is holding) is measured there first.
+    visits = [temperature_visit(current_T, [])]
+    for job in jobs:
+        if job.status not in (JobStatus.QUEUED, JobStatus.RUNNING):
+            continue
+        position = -1
+        T_list = setpoints(job.settings)
+        for T_position in range(job.next_position, len(job.order)):
+            T = T_list[job.order[T_position]]
+            for i in range(position + 1, len(visits)):
+                if visits[i].T == T and all(
+                    other is not job for other, _ in visits[i].steps
+                ):
+                    break
+            else:
+                visits.append(temperature_visit(T, []))
+                i = len(visits) - 1
+            visits[i].steps.append((job, T_position))
+            position = i
+    return [visit for visit in visits if visit.steps]
+
+
+def next_segment(
+    visits: list[temperature_visit],
+) -> tuple[measurement_job, int] | None:
+    # The first job at the first visit, run up to (and including) the
+    # position returned. Following visits only that job is waiting for are
+    # run in the same segment.
+    if not visits:
+        return None
+    job, last_T_position = visits[0].steps[0]
+    if len(visits[0].steps) > 1:
+        return job, last_T_position
+    for visit in visits[1:]:
+        if len(visit.steps) > 1 or visit.steps[0][0] is not job:
+            break
+        last_T_position = visit.steps[0][1]
+    return job, last_T_position
+
+
+class MeasurementQueue:
+    def __init__(self, sequencer: MeasurementSequencer) -> None:
+        self.sequencer = sequencer
+        self.lock = threading.Lock()
+        self._jobs: list[measurement_job] = []
+        self._next_id = 0
+        self.running = False
+        self.stopping = False
+        self.thread: threading.Thread | None = None
+
+    def add(self, settings: measurement_settings) -> int:
+        with self.lock:
+            # planned from where the job before it will leave the stage
+            start_T = self.sequencer.state.linkam_temperature
+            for job in reversed(self._jobs):
+                if job.order:
+                    start_T = setpoints(job.settings)[job.order[-1]]
+                    break
+            order = plan_run(settings, start_T)[0]
+            job = measurement_job(settings, self._next_id, order)
+            self._next_id += 1
+            self._jobs.append(job)
+        return job.id
+
+    def remove(self, job_id: int) -> bool:
+        # a job can't be removed while it is being measured
+        with self.lock:
+            for job in self._jobs:
+                if job.id == job_id and job.status != JobStatus.RUNNING:
+                    self._jobs.remove(job)
+                    return True
+        return False
+
+    def move(self, job_id: int, index: int) -> None:
+        with self.lock:
+            for job in self._jobs:
+                if job.id == job_id:
+                    self._jobs.remove(job)
+                    self._jobs.insert(max(0, index), job)
+                    return
+
+    def jobs(self) -> list[measurement_job]:
+        with self.lock:
+            return list(self._jobs)
+
+    def run(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self) -> None:
+        # stops the current job, leaving it (and the rest) queued
+        with self.lock:
+            self.stopping = True
+            self.sequencer.stop()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        # block until the queue has drained or been stopped. False on timeout.
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return not self.running
+
+    def _run(self) -> None:
+        state = self.sequencer.state
+        try:
+            while True:
+                with self.lock:
+                    # started under the lock, so a stop() is always queued
+                    # after the start it is meant for
+                    current_T = self.sequencer.stable_T
+                    segment = next_segment(plan_visits(self._jobs, current_T))
+                    if self.stopping or segment is None:
+                        break
+                    job, last_T_position = segment
+                    job.status = JobStatus.RUNNING
+                    settings = replace(
+                        job.settings,
+                        resume=job.settings.resume or job.started,
+                        T_order=job.order,
+                    )
+                    job.started = True
+                    previous = state.results
+                    self.sequencer.start(settings, last_T_position)
+                self.sequencer.wait()
+                # a run that failed to start leaves the last job's results
+                results = state.results
+                measured = results is not previous and bool(
+                    results.measured[job.order[: last_T_position + 1]].all()
+                )
+                with self.lock:
+                    if measured:
+                        job.next_position = last_T_position + 1
+                        if job.next_position >= len(job.order):
+                            job.status = JobStatus.DONE
+                        else:
+                            job.status = JobStatus.QUEUED
+                    elif self.stopping:
+                        job.status = JobStatus.QUEUED
+                    else:
+                        # carry on with the other jobs
+                        job.status = JobStatus.FAILED
+        finally:
+            # the stage was left holding between segments
+            if not self.stopping:
+                self.sequencer.stop()
+                self.sequencer.wait()
+            self.running = False
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+class ResultsCube:
+    # One float array per quantity with shape (nT, nf, nV), indexed by
+    # (T_step, freq_step, volt_step) and NaN until the point is measured.
+    # measured marks the points written so far, since a measured value can
+    # itself be NaN (e.g. a failed scope read). Points are written once and
+    # never changed, so other threads can read a cube that is being filled.
+    def __init__(
+        self,
+        T_list: list[float],
+        freq_list: list[float],
+        voltage_list: list[float],
+        quantities: list[str],
+    ) -> None:
+        self.T = np.asarray(T_list, dtype=float)
+        self.freq = np.asarray(freq_list, dtype=float)
+        self.volt = np.asarray(voltage_list, dtype=float)
+        self.shape = (len(self.T), len(self.freq), len(self.volt))
+        self.quantities = list(quantities)
+        self.data = {q: np.full(self.shape, np.nan) for q in self.quantities}
+        self.measured = np.zeros(self.shape, dtype=bool)
+
+    @classmethod
+    def from_records(cls, header: dict, points: list[dict]) -> "ResultsCube":
+        # fill a cube from the records of a lcd_store.ResultsStore log
+        cube = cls(
+            header["T_list"],
+            header["freq_list"],
+            header["voltage_list"],
+            [c for c in header["columns"] if c != "volt"],
+        )
+        for point in points:
+            cube.set_point(
+                point["T_step"], point["freq_step"], point["volt_step"], point["values"]
+            )
+        return cube
+
+    @classmethod
+    def from_arrays(
+        cls,
+        T: np.ndarray,
+        freq: np.ndarray,
+        volt: np.ndarray,
+        data: dict[str, np.ndarray],
+        measured: np.ndarray,
+    ) -> "ResultsCube":
+        # wrap existing arrays (e.g. memory mapped ones) without copying them
+        cube = cls.__new__(cls)
+        cube.T, cube.freq, cube.volt = T, freq, volt
+        cube.shape = (len(T), len(freq), len(volt))
+        cube.quantities = list(data)
+        cube.data = data
+        cube.measured = measured
+        return cube
+
+    def select(self, T_index=slice(None), freq_index=slice(None)) -> "ResultsCube":
+        # a cube holding only the given temperature and frequency indices
+        return ResultsCube.from_arrays(
+            self.T[T_index],
+            self.freq[freq_index],
+            self.volt,
+            {q: self.data[q][T_index][:, freq_index] for q in self.quantities},
+            self.measured[T_index][:, freq_index],
+        )
+
+    def __getitem__(self, quantity: str) -> np.ndarray:
+        return self.data[quantity]
+
+    def set_point(
+        self, T_step: int, freq_step: int, volt_step: int, values: dict
+    ) -> None:
+        index = (T_step, freq_step, volt_step)
+        for quantity, value in values.items():
+            self.data[quantity][index] = value
+        # set last, so a reader never sees a point flagged before its values
+        self.measured[index] = True
+
+    def T_key(self, T_step: int) -> str:
+        return f"{T_step + 1}: {self.T[T_step].item()}"
+
+    def freq_key(self, freq_step: int) -> str:
+        return f"{freq_step + 1}: {self.freq[freq_step].item()}"
+
+    def to_dict(self) -> dict:
+        # The {"1: 25.0": {"1: 20.0": {"volt": [...], "Cp": [...]}}} layout of
+        # the JSON output, with only the points measured so far.
+        results: dict = {}
+        measured = self.measured.copy()
+        for t, f in zip(*np.nonzero(measured.any(axis=2))):
+            mask = measured[t, f]
+            entry = {"volt": self.volt[mask].tolist()}
+            for quantity in self.quantities:
+                values = self.data[quantity][t, f, mask]
+                entry[quantity] = values.tolist()
+                if np.isnan(values).any():
+                    # null rather than NaN, which isn't valid JSON
+                    entry[quantity] = [
+                        None if np.isnan(x) else x for x in entry[quantity]
+                    ]
+            results.setdefault(self.T_key(t), {})[self.freq_key(f)] = entry
+        return results
@@ -0,0 +1,107 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class ScpiCache:
+    # Sits between an instrument class and its pyvisa resource. Settings sent
+    # with set() are remembered so repeats are skipped, and commands written
+    # inside batch() are joined with ';' into a single bus transaction. A
+    # setting is only remembered once the write carrying it has been sent; if
+    # the write fails the instrument's value is unknown, so it is forgotten.
+    #
+    # An instrument is driven from several threads (the sequencer, acquisition
+    # and calibration), so everything here holds lock, as does a whole batch()
+    # and the write and read of a query(). Hold it around any other write
+    # followed by a read of the resource.
+    def __init__(self, resource: Any) -> None:
+        self.resource = resource
+        self.lock = threading.RLock()
+        self.settings: dict[str, str] = {}
+        self.pending: list[str] = []
+        # settings in pending, cached once they are sent
+        self.pending_settings: dict[str, str] = {}
+        self.batch_depth = 0
+        # bus transactions actually sent and the commands they carried
+        self.writes_sent = 0
+        self.commands_sent = 0
+        # settings that matched the cached value and were not sent
+        self.writes_skipped = 0
+        # commands that rode along in another command's transaction
+        self.writes_coalesced = 0
+
+    @property
+    def writes_saved(self) -> int:
+        return self.writes_skipped + self.writes_coalesced
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "writes_sent": self.writes_sent,
+            "commands_sent": self.commands_sent,
+            "writes_skipped": self.writes_skipped,
+            "writes_coalesced": self.writes_coalesced,
+            "writes_saved": self.writes_saved,
+        }
+
+    def set(self, header: str, value: Any) -> None:
+        value = str(value)
+        with self.lock:
+            current = self.pending_settings.get(header, self.settings.get(header))
+            if current == value:
+                self.writes_skipped += 1
+                return
+            self.pending_settings[header] = value
+            self.write(f"{header} {value}")
+
+    def invalidate(self, *headers: str) -> None:
+        # forget cached settings, all of them if no headers are given
+        # (e.g. after *RST or a reconnect).
+        with self.lock:
+            if not headers:
+                self.settings.clear()
+                self.pending_settings.clear()
+            for header in headers:
+                self.settings.pop(header, None)
+                self.pending_settings.pop(header, None)
+
+    def write(self, command: str) -> None:
+        with self.lock:
+            self.pending.append(command)
+            if self.batch_depth == 0:
+                self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.pending:
+                return
+            commands = self.pending
+            settings = self.pending_settings
+            self.pending = []
+            self.pending_settings = {}
+            try:
+                self.resource.write(";".join(commands))
+            except Exception:
+                for header in settings:
+                    self.settings.pop(header, None)
+                raise
+            self.settings.update(settings)
+            self.writes_sent += 1
+            self.commands_sent += len(commands)
+            self.writes_coalesced += len(commands) - 1
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        with self.lock:
+            self.batch_depth += 1
+            try:
+                yield
+            finally:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.flush()
+
+    def query(self, command: str) -> str:
+        with self.lock:
+            self.write(command)
+            self.flush()
+            return self.resource.read()
@@ -0,0 +1,844 @@
+import bisect
+import queue
+import threading
+import time
+from dataclasses import asdict
+
+import numpy as np
+
+from lcdielectrics.lcd_dataclasses import (
+    OutputType,
+    Status,
+    lcd_instruments,
+    lcd_state,
+    measurement_settings,
+)
+from lcdielectrics.lcd_approach import Ramp, ThermalResponse, reference_at
+from lcdielectrics.lcd_calibration import EmptyCellCalibration, calibration_path
+from lcdielectrics.lcd_columnar import ColumnarWriter, columnar_path
+from lcdielectrics.lcd_compensation import CompensationTable
+from lcdielectrics.lcd_export import ExportWorker, write_files
+from lcdielectrics.lcd_fitting import MODELS, FitWorker
+from lcdielectrics.lcd_impedance import derive_quantities, derived_quantity_names
+from lcdielectrics.lcd_results import ResultsCube
+from lcdielectrics.lcd_stability import check_stability, stability_deadline
+from lcdielectrics.lcd_store import ResultsStore, next_step, read_records, store_path
+from lcdielectrics.lcd_temperature_plan import approach_waypoint, plan_run, setpoints
+
+# Nothing in here touches the GUI. The sequencer owns the measurement state
+# machine and runs it on its own thread, the GUI only reads lcd_state.
+
+# Distance from the setpoint (C) at which the stage counts as arrived.
+TEMPERATURE_TOLERANCE = 0.1
+# how much of the temperature log (s) is kept, which bounds the stability
+# window and the approach the stage's response is learned from
+T_LOG_DURATION = 3600.0
+# longest wait (s) for a Linkam reading before checking the watcher should
+# still be running
+READING_TIMEOUT = 10.0
+
+
+class MeasurementSequencer:
+    # Events are ("start", (settings, last_T_position)), ("stop", None),
+    # ("temperature", None), ("measurement_complete", next_status) and
+    # ("shutdown", None). Timers
+    # (e.g. the end of stabilisation) are handled by waking up from the event
+    # queue at wake_time.
+    def __init__(self, state: lcd_state, instruments: lcd_instruments) -> None:
+        self.state = state
+        self.instruments = instruments
+        self.events: queue.Queue = queue.Queue()
+        self.wake_time: float | None = None
+        # A run started with last_T_position ends once the temperature at that
+        # position of its T_order is done, and leaves the stage holding (see
+        # lcd_queue).
+        self.last_T_position: int | None = None
+        # the setpoint the stage has been stabilised at, while it holds there
+        self.stable_T: float | None = None
+        # where the stage is going first to approach the setpoint from the
+        # required side, see lcd_temperature_plan
+        self.waypoint: float | None = None
+        # the ramps of the current approach, and the slow one still to come
+        # after a predictive approach's fast ramp (see lcd_approach)
+        self.ramps: list[Ramp] = []
+        self.final_ramp: tuple[float, float] | None = None
+        # Linkam readings logged so far, and the count when the last ramp was
+        # sent. A reading in flight when a ramp is sent still carries the
+        # status from before it, so only the second one after is sure to be
+        # newer.
+        self.readings = 0
+        self.ramp_reading = 0
+        self.response = ThermalResponse.load()
+        self.running = True
+        # set while idle, cleared by start() until that run has ended
+        self.done = threading.Event()
+        self.done.set()
+        self.exporter = ExportWorker()
+        self.fitter = FitWorker()
+        self.temperature_thread: threading.Thread | None = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def notify(self, event: str, data=None) -> None:
+        self.events.put((event, data))
+
+    def start(
+        self, settings: measurement_settings, last_T_position: int | None = None
+    ) -> None:
+        self.done.clear()
+        self.notify("start", (settings, last_T_position))
+
+    def wait(self, timeout: float | None = None) -> bool:
+        # block until the last run started has finished, been stopped or
+        # failed to start. False on timeout.
+        return self.done.wait(timeout)
+
+    def stop(self) -> None:
+        self.notify("stop")
+
+    def shutdown(self) -> None:
+        # the temperature watcher exits after its next reading
+        self.running = False
+        self.notify("shutdown")
+        self.thread.join()
+        self.exporter.stop()
+        self.fitter.stop()
+
+    def watch_temperature(self) -> None:
+        # start logging the Linkam readings once it is connected
+        if self.temperature_thread is None:
+            self.temperature_thread = threading.Thread(target=self._watch_temperature)
+            self.temperature_thread.daemon = True
+            self.temperature_thread.start()
+
+    def _watch_temperature(self) -> None:
+        # The Linkam I/O worker sets the polling rate, so just wait for each new
+        # reading and log it against the time it arrived.
+        state = self.state
+        log_start = time.monotonic()
+        while self.running:
+            try:
+                temperature, status = self.instruments.linkam.wait_for_reading(
+                    READING_TIMEOUT
+                )
+            except TimeoutError:
+                continue
+            except RuntimeError as e:
+                # the Linkam's I/O worker died, a reconnect starts a new watcher
+                print("Lost the Linkam: ", e)
+                state.linkam_connection_status = "Lost"
+                self.temperature_thread = None
+                self.stop()
+                return
+            state.linkam_temperature = temperature
+            state.T_log_time.append(time.monotonic() - log_start)
+            state.T_log_T.append(temperature)
+
+            # trimmed a minute at a time rather than on every reading
+            if state.T_log_time[-1] - state.T_log_time[0] > T_LOG_DURATION + 60:
+                keep = bisect.bisect_left(
+                    state.T_log_time, state.T_log_time[-1] - T_LOG_DURATION
+                )
+                state.T_log_T = state.T_log_T[keep:]
+                state.T_log_time = state.T_log_time[keep:]
+
+            state.linkam_action = status
+            self.readings += 1
+            self.notify("temperature")
+
+    def _run(self) -> None:
+        while True:
+            timeout = None
+            if self.wake_time is not None:
+                timeout = max(0.0, self.wake_time - time.monotonic())
+            try:
+                event, data = self.events.get(timeout=timeout)
+            except queue.Empty:
+                event, data = "timer", None
+
+            if event == "shutdown":
+                return
+            try:
+                self._handle(event, data)
+            except Exception as e:
+                print("Measurement stopped after an error: ", e)
+                self._stop()
+            # not while a start is still queued behind this event
+            if self.state.measurement_status == Status.IDLE and self.events.empty():
+                self.done.set()
+
+    def _handle(self, event: str, data) -> None:
+        state = self.state
+        if event == "start":
+            if state.measurement_status == Status.IDLE:
+                settings, self.last_T_position = data
+                begin_measurement(state, self.instruments, settings)
+                if (
+                    state.measurement_status != Status.IDLE
+                    and settings.fit_model in MODELS
+                ):
+                    self.fitter.begin(
+                        settings.output_file_path,
+                        settings.fit_model,
+                        settings.fit_conductivity,
+                        state.calibration,
+                    )
+                    # temperatures finished before a resume
+                    for T_step in state.T_order[: state.T_position]:
+                        self.fitter.submit(state.results, T_step)
+        elif event == "stop":
+            self._stop()
+            return
+        elif event == "measurement_complete":
+            if state.measurement_status == Status.COLLECTING_DATA:
+                state.measurement_status = data
+                self.export(
+                    force=data in (Status.SET_TEMPERATURE, Status.FINISHED)
+                )
+                if data == Status.SET_TEMPERATURE:
+                    self.fit(state.T_order[state.T_position - 1])
+                elif data == Status.FINISHED:
+                    self.fit(state.T_step)
+                if (
+                    data == Status.SET_TEMPERATURE
+                    and self.last_T_position is not None
+                    and state.T_position > self.last_T_position
+                ):
+                    self._pause()
+                    return
+        self._advance()
+
+    def export(self, force: bool = False) -> None:
+        # ask the export worker to rebuild the outputs, at most every
+        # ExportWorker.min_interval seconds, or straight away if forced.
+        state = self.state
+        if force:
+            state.columnar.flush()
+        self.exporter.submit(
+            state.results,
+            state.settings.output_file_path,
+            output_type(state.voltage_list, state.freq_list),
+            force,
+            state.calibration,
+        )
+
+    def fit(self, T_step: int) -> None:
+        # fit the spectra of a finished temperature
+        if self.state.settings.fit_model in MODELS:
+            self.fitter.submit(self.state.results, T_step)
+
+    def log_stability(self, decision: dict) -> None:
+        state = self.state
+        T = state.T_list[state.T_step]
+        state.store.append_stability(
+            {"T_step": state.T_step, "T": T, "time": time.time(), **decision}
+        )
+        print(
+            f"Stable at {T} C after {decision['waited']:.0f} s "
+            f"({decision['reason']})"
+        )
+
+    def _ramp(self, setpoint: float, rate: float) -> None:
+        state = self.state
+        t = state.T_log_time[-1] if state.T_log_time else 0.0
+        start = reference_at(self.ramps, t, state.linkam_temperature)
+        self.ramps.append((t, start, setpoint, rate))
+        self.instruments.linkam.set_temperature(setpoint, rate)
+        self.ramp_reading = self.readings
+
+    def learn_response(self) -> None:
+        # learn the stage's lag and overshoot from the approach just finished,
+        # kept for later runs if they are being used
+        state = self.state
+        learned = self.response.learn(self.ramps, state.T_log_time, state.T_log_T)
+        self.ramps = []
+        if learned and state.settings.approach_mode == "Predictive":
+            self.response.save()
+
+    def _pause(self) -> None:
+        # end a run at last_T_position with the stage still holding, a later run
+        # carries on from the record log
+        self.state.store.close()
+        self.state.columnar.close()
+        self.exporter.flush()
+        self.state.measurement_status = Status.IDLE
+
+    def _stop(self) -> None:
+        self.wake_time = None
+        self.stable_T = None
+        self.waypoint = None
+        self.final_ramp = None
+        if self.state.measurement_status != Status.IDLE:
+            # write whatever the stopped run measured
+            self.state.store.close()
+            self.state.columnar.close()
+            self.export(force=True)
+            self.exporter.flush()
+        self.state.measurement_status = Status.IDLE
+        if self.instruments.linkam:
+            try:
+                self.instruments.linkam.stop()
+            except (RuntimeError, TimeoutError) as e:
+                print("Could not stop the Linkam: ", e)
+        if self.instruments.agilent:
+            self.instruments.agilent.reset_and_clear()
+
+    def _advance(self) -> None:
+        # run the state machine until it has to wait for something
+        state = self.state
+        settings = state.settings
+        while True:
+            status = state.measurement_status
+            if status == Status.SET_TEMPERATURE:
+                if not (
+                    state.linkam_action == "Stopped" or state.linkam_action == "Holding"
+                ):
+                    return
+                T = state.T_list[state.T_step]
+                if (
+                    self.stable_T == T
+                    and abs(state.linkam_temperature - T) < TEMPERATURE_TOLERANCE
+                ):
+                    # e.g. the run before finished at this temperature
+                    state.measurement_status = Status.TEMPERATURE_STABILISED
+                    continue
+                self.stable_T = None
+                self.ramps = []
+                self.waypoint = approach_waypoint(
+                    T, state.linkam_temperature, settings.T_approach
+                )
+                if self.waypoint is not None:
+                    self._ramp(self.waypoint, settings.T_rate)
+                elif settings.approach_mode == "Predictive":
+                    ramps = self.response.plan(
+                        state.linkam_temperature,
+                        T,
+                        settings.T_rate,
+                        settings.approach_rate,
+                    )
+                    self._ramp(*ramps[0])
+                    self.final_ramp = ramps[1] if len(ramps) > 1 else None
+                else:
+                    self._ramp(T, settings.T_rate)
+                state.measurement_status = Status.GOING_TO_TEMPERATURE
+                # the Holding status that got here is from before the ramp
+                return
+
+            elif status == Status.GOING_TO_TEMPERATURE:
+                if self.final_ramp is not None:
+                    # the fast ramp stops short of the setpoint, carry on slowly
+                    # as soon as the reference gets there
+                    if (
+                        state.linkam_action != "Holding"
+                        or self.readings < self.ramp_reading + 2
+                    ):
+                        return
+                    self._ramp(*self.final_ramp)
+                    self.final_ramp = None
+                    return
+                target = state.T_list[state.T_step]
+                if self.waypoint is not None:
+                    target = self.waypoint
+                if abs(state.linkam_temperature - target) >= TEMPERATURE_TOLERANCE:
+                    return
+                if self.waypoint is not None:
+                    # now go to the setpoint itself
+                    self.waypoint = None
+                    state.measurement_status = Status.SET_TEMPERATURE
+                    continue
+                state.t_stable_start = time.monotonic()
+                state.measurement_status = Status.STABILISING_TEMPERATURE
+
+            elif status == Status.STABILISING_TEMPERATURE:
+                waited = time.monotonic() - state.t_stable_start
+                decision = check_stability(
+                    state.T_log_time,
+                    state.T_log_T,
+                    waited,
+                    settings,
+                    state.T_list[state.T_step],
+                    TEMPERATURE_TOLERANCE,
+                )
+                if decision is None:
+                    self.wake_time = state.t_stable_start + stability_deadline(
+                        waited, settings
+                    )
+                    return
+                self.wake_time = None
+                self.log_stability(decision)
+                self.learn_response()
+                self.stable_T = state.T_list[state.T_step]
+                state.measurement_status = Status.TEMPERATURE_STABILISED
+
+            elif status == Status.TEMPERATURE_STABILISED:
+                state.measurement_status = Status.COLLECTING_DATA
+                self._start_acquisition()
+                return
+
+            elif status == Status.FINISHED:
+                # the outputs were sent for export at the end of the last temperature
+                state.store.close()
+                state.columnar.close()
+                self.exporter.flush()
+                if self.last_T_position is None:
+                    self.instruments.linkam.stop()
+                    self.stable_T = None
+
+                self.instruments.agilent.reset_and_clear()
+
+                state.measurement_status = Status.IDLE
+                return
+
+            else:
+                # IDLE or COLLECTING_DATA, wait for the next event
+                return
+
+    def _start_acquisition(self) -> None:
+        state = self.state
+        instruments = self.instruments
+        if state.settings.list_sweep and not instruments.oscilloscope:
+            target = run_list_experiment
+        else:
+            # only settings that changed since the last point are sent
+            with instruments.agilent.batch():
+                instruments.agilent.set_frequency(state.freq_list[state.freq_step])
+
+                instruments.agilent.set_voltage(state.voltage_list[state.volt_step])
+            target = run_experiment
+
+        thread = threading.Thread(target=self._acquire, args=(target,))
+        thread.daemon = True
+        thread.start()
+
+    def _acquire(self, target) -> None:
+        try:
+            next_status = target(self.instruments, self.state)
+        except Exception as e:
+            print("Measurement failed: ", e)
+            self.stop()
+            return
+        self.notify("measurement_complete", next_status)
+
+
+def describe_status(state: lcd_state) -> str:
+    status = state.measurement_status
+    if status == Status.IDLE:
+        return "Idle"
+    T = state.T_list[state.T_step]
+    if status == Status.SET_TEMPERATURE:
+        return f"Setting temperature to {T} C"
+    elif status == Status.GOING_TO_TEMPERATURE:
+        return f"Going to {T} C"
+    elif status == Status.STABILISING_TEMPERATURE:
+        current_wait = time.monotonic() - state.t_stable_start
+        settings = state.settings
+        if settings.stability_mode == "Adaptive":
+            return (
+                f"Stabilising temperature for {current_wait:.2f}s "
+                f"(min {settings.stability_min_wait}s, max {settings.stability_max_wait}s)"
+            )
+        return f"Stabilising temperature for {current_wait:.2f}/{settings.stab_time}s"
+    elif status == Status.FINISHED:
+        return "Finished"
+    instrument = "Spectrometer" if state.spectrometer_running else "Oscilloscope"
+    return f"{instrument}: f = {state.freq_list[state.freq_step]:.2f}, V = {state.voltage_list[state.volt_step]}"
+
+
+def begin_measurement(
+    state: lcd_state, instruments: lcd_instruments, settings: measurement_settings
+) -> None:
+    state.settings = settings
+    state.freq_list = [float(x) for x in settings.freq_list]
+    state.voltage_list = [float(x) for x in settings.volt_list]
+    state.T_list = setpoints(settings)
+    state.T_order = [int(i) for i in plan_run(settings, state.linkam_temperature)[0]]
+    if sorted(state.T_order) != list(range(len(state.T_list))):
+        raise ValueError("The temperature order must visit every temperature once")
+    if (
+        settings.stability_mode == "Adaptive"
+        and settings.stability_window > T_LOG_DURATION
+    ):
+        raise ValueError(
+            f"The stability window can be at most {T_LOG_DURATION:.0f} s, "
+            "the length of the temperature log"
+        )
+
+    instruments.agilent.set_aperture_mode(
+        settings.meas_time_mode, settings.averaging_factor
+    )
+
+    instruments.agilent.set_data_format(settings.data_format)
+
+    bias = settings.bias_level
+    if bias == 1.5 or 2:
+        instruments.agilent.set_DC_bias(float(bias))
+
+    state.T_position = 0
+    state.T_step = state.T_order[0]
+    state.freq_step = 0
+    state.volt_step = 0
+
+    if instruments.oscilloscope:
+        # with hardware averaging one digitize returns the average of N
+        # acquisitions, so there is a single transmission column.
+        if settings.scope_hardware_averaging:
+            hardware_averages = settings.num_averages
+            state.scope_columns = 1
+        else:
+            hardware_averages = 1
+            state.scope_columns = settings.num_averages
+        instruments.oscilloscope.setup(
+            settings.scope_waveform_format, hardware_averages
+        )
+    else:
+        state.scope_columns = 0
+    state.compensation = setup_compensation(instruments, settings, state.freq_list)
+    # empty cell capacitance is entered in pF
+    state.calibration = load_calibration(settings)
+    if state.calibration is not None:
+        state.calibration.save(calibration_path(settings.output_file_path))
+
+    header = {
+        "settings": asdict(settings),
+        "T_list": state.T_list,
+        "T_order": state.T_order,
+        "freq_list": state.freq_list,
+        "voltage_list": state.voltage_list,
+        "columns": result_columns(state),
+        "calibration": state.calibration and state.calibration.to_dict(),
+    }
+    state.store = ResultsStore(store_path(settings.output_file_path))
+    state.columnar = ColumnarWriter(
+        columnar_path(settings.output_file_path),
+        [c for c in header["columns"] if c != "volt"],
+    )
+    state.columnar.create()
+    state.xdata = []
+    state.ydata = []
+    if settings.resume:
+        if not resume_measurement(state, header):
+            return
+    else:
+        state.results = ResultsCube(
+            state.T_list,
+            state.freq_list,
+            state.voltage_list,
+            [c for c in header["columns"] if c != "volt"],
+        )
+        state.store.create(header)
+
+    state.measurement_status = Status.SET_TEMPERATURE
+
+
+def load_calibration(settings: measurement_settings) -> EmptyCellCalibration | None:
+    # capacitances are entered in pF
+    C_stray = settings.stray_capacitance * 1e-12
+    if settings.calibration_file:
+        calibration = EmptyCellCalibration.load(settings.calibration_file)
+        calibration.C_stray = C_stray
+        return calibration
+    if settings.empty_cell_capacitance:
+        return EmptyCellCalibration.constant(
+            settings.empty_cell_capacitance * 1e-12, C_stray
+        )
+    return None
+
+
+def setup_compensation(
+    instruments: lcd_instruments,
+    settings: measurement_settings,
+    freq_list: list[float],
+) -> CompensationTable | None:
+    # returns the table to correct points with in software, if any
+    load = bool(settings.load_Cp)
+    if settings.compensation == "Software":
+        table = CompensationTable.cached(settings.fixture, freq_list)
+        if table is None or not (table.has("open") and table.has("short")):
+            raise ValueError(
+                f"No open and short compensation for {settings.fixture} "
+                "at these frequencies"
+            )
+        return table
+    elif settings.compensation == "Instrument":
+        instruments.agilent.enable_corrections(freq_list, True, True, load)
+    return None
+
+
+def compensate(state: lcd_state, cpd: np.ndarray, freq_index) -> np.ndarray:
+    # cpd is one [Cp, D, status] row or a row per point of a sweep, at the
+    # frequencies freq_list[freq_index]. Corrected as a single array operation.
+    if state.compensation is None:
+        return cpd
+    cpd = np.array(cpd, dtype=float)
+    cpd[..., 0], cpd[..., 1] = state.compensation.correct_cpd(
+        cpd[..., 0], cpd[..., 1], freq_index
+    )
+    return cpd
+
+
+def resume_measurement(state: lcd_state, header: dict) -> bool:
+    # Reload the points already in the record log and move the steps on to the
+    # first one missing. Returns False if there is nothing left to measure.
+    old_header, points = read_records(state.store.path)
+    if old_header is None or any(
+        old_header[key] != header[key]
+        for key in ["T_list", "freq_list", "voltage_list", "columns"]
+    ):
+        raise ValueError(
+            f"{state.store.path} is not a log of the same measurement, can't resume"
+        )
+    # carry on in the order the run was started in, wherever the stage is now
+    state.T_order = old_header.get("T_order") or list(range(len(state.T_list)))
+    state.results = ResultsCube.from_records(old_header, points)
+    # the columnar file may be missing the last points before a crash, so it
+    # is rewritten from the log
+    for point in points:
+        state.columnar.append(columnar_row(state, point))
+    state.columnar.flush()
+    step = next_step(old_header, points)
+    if step is None:
+        print("Measurement already complete, rebuilding outputs")
+        state.columnar.close()
+        write_outputs(state)
+        return False
+    state.T_position, state.freq_step, state.volt_step = step
+    state.T_step = state.T_order[state.T_position]
+    state.store.reopen()
+    return True
+
+
+def run_experiment(instruments: lcd_instruments, state: lcd_state) -> Status | None:
+    result = dict()
+    time.sleep(state.settings.delay_time)
+    result["CPD"] = compensate(
+        state, instruments.agilent.measure("CPD"), state.freq_step
+    )
+    # G, B and the other representations follow from Cp, D and the frequency,
+    # so only one trigger is needed per point.
+    result["derived"] = derive_quantities(
+        state.freq_list[state.freq_step],
+        result["CPD"][0],
+        result["CPD"][1],
+    )
+
+    if state.scope_columns:
+        state.spectrometer_running = False
+        result["averages"] = get_data_from_scope(instruments, state)
+        state.spectrometer_running = True
+
+    return get_result(result, state, instruments)
+
+
+def run_list_experiment(
+    instruments: lcd_instruments, state: lcd_state
+) -> Status | None:
+    # Upload the remaining sweep to the :LIST table and fetch every point with
+    # one trigger. With a single voltage the whole frequency list is swept at
+    # that voltage, otherwise the voltage list is swept at the current frequency.
+    agilent = instruments.agilent
+    agilent.set_list_step_delay(state.settings.delay_time)
+    if len(state.voltage_list) == 1:
+        agilent.set_voltage(state.voltage_list[0])
+        sweep = state.freq_list[state.freq_step :]
+        freqs = sweep
+        freq_index = slice(state.freq_step, None)
+        cpd = agilent.sweep_freq_list("CPD", sweep)
+    else:
+        agilent.set_frequency(state.freq_list[state.freq_step])
+        sweep = state.voltage_list[state.volt_step :]
+        freqs = state.freq_list[state.freq_step]
+        freq_index = state.freq_step
+        cpd = agilent.sweep_volt_list("CPD", sweep)
+    agilent.finish_list_sweep()
+    cpd = compensate(state, cpd, freq_index)
+
+    derived = derive_quantities(freqs, cpd[:, 0], cpd[:, 1])
+    results = [
+        {"CPD": cpd[i], "derived": {k: v[i] for k, v in derived.items()}}
+        for i in range(len(sweep))
+    ]
+    return get_list_result(results, state, instruments)
+
+
+def get_data_from_scope(instruments: lcd_instruments, state: lcd_state):
+    scope = instruments.oscilloscope
+    total = []
+    for i in range(state.scope_columns):
+        print(
+            f"Measuring {i + 1}/{state.scope_columns} f = {state.freq_list[state.freq_step]:.2f}, V = {state.voltage_list[state.volt_step]} "
+        )
+        # a failed read is written as null
+        average = None
+        try:
+            average = scope.mean_voltage()
+        except Exception as e:
+            print("Data read failed: ", e)
+        total.append(average)
+    return total
+
+
+def get_result(
+    result: dict, state: lcd_state, instruments: lcd_instruments
+) -> Status | None:
+    # returns the status to move to, or None if the run was stopped meanwhile
+    parse_result(result, state)
+
+    if state.measurement_status == Status.IDLE:
+        return None
+
+    return advance_step(state, instruments)
+
+
+def get_list_result(
+    results: list[dict], state: lcd_state, instruments: lcd_instruments
+) -> Status | None:
+    # results holds one entry per point of the list sweep, in sweep order. The
+    # steps are advanced through the list without handing control back to the
+    # sequencer, which only sees the status returned by the final step.
+    for i, result in enumerate(results):
+        if state.measurement_status == Status.IDLE:
+            return None
+        parse_result(result, state)
+        if i < len(results) - 1:
+            advance_step(state, instruments)
+
+    if state.measurement_status == Status.IDLE:
+        return None
+
+    return advance_step(state, instruments)
+
+
+def output_type(voltage_list: list, freq_list: list) -> OutputType:
+    if len(voltage_list) == 1 and len(freq_list) == 1:
+        return OutputType.SINGLE_VOLT_FREQ
+    elif len(voltage_list) == 1:
+        return OutputType.SINGLE_VOLT
+    elif len(freq_list) == 1:
+        return OutputType.SINGLE_FREQ
+    return OutputType.MULTI_VOLT_FREQ
+
+
+def write_outputs(state: lcd_state) -> None:
+    write_files(
+        state.results,
+        state.settings.output_file_path,
+        output_type(state.voltage_list, state.freq_list),
+        state.calibration,
+    )
+
+
+def rebuild_outputs(output_file_path: str) -> None:
+    # build the JSON and xlsx from the record log alone, e.g. after a crash
+    header, points = read_records(store_path(output_file_path))
+    if header is None:
+        raise FileNotFoundError(f"No record log for {output_file_path}")
+    calibration = header.get("calibration")
+    write_files(
+        ResultsCube.from_records(header, points),
+        output_file_path,
+        output_type(header["voltage_list"], header["freq_list"]),
+        calibration and EmptyCellCalibration.from_dict(calibration),
+    )
+
+
+def result_columns(state: lcd_state) -> list[str]:
+    return (
+        ["volt", "Cp", "D"]
+        + derived_quantity_names()
+        + [f"Ave. Transmission #{i + 1}" for i in range(state.scope_columns)]
+    )
+
+
+def columnar_row(state: lcd_state, point: dict) -> dict:
+    # one row of the tidy export from a point record
+    return {
+        "T_step": point["T_step"],
+        "freq_step": point["freq_step"],
+        "volt_step": point["volt_step"],
+        "T": state.T_list[point["T_step"]],
+        "freq": state.freq_list[point["freq_step"]],
+        "volt": state.voltage_list[point["volt_step"]],
+        "bias": float(state.settings.bias_level),
+        "time": point.get("time", float("nan")),
+        "T_linkam": point.get("T_linkam", float("nan")),
+        **point["values"],
+    }
+
+
+def advance_step(state: lcd_state, instruments: lcd_instruments) -> Status:
+    if (
+        state.T_position == len(state.T_order) - 1
+        and state.volt_step == len(state.voltage_list) - 1
+        and state.freq_step == len(state.freq_list) - 1
+    ):
+        return Status.FINISHED
+
+    if (
+        state.volt_step == len(state.voltage_list) - 1
+        and state.freq_step == len(state.freq_list) - 1
+    ):
+        state.T_position += 1
+        state.T_step = state.T_order[state.T_position]
+        state.freq_step = 0
+        state.volt_step = 0
+        instruments.agilent.set_voltage(0)
+
+        return Status.SET_TEMPERATURE
+
+    elif state.volt_step == len(state.voltage_list) - 1:
+        state.freq_step += 1
+        state.volt_step = 0
+        return Status.TEMPERATURE_STABILISED
+    else:
+        state.volt_step += 1
+        return Status.TEMPERATURE_STABILISED
+
+
+def parse_result(result: dict, state: lcd_state) -> None:
+    values = {"Cp": float(result["CPD"][0]), "D": float(result["CPD"][1])}
+    for quantity, value in result["derived"].items():
+        values[quantity] = float(value)
+    if state.scope_columns:
+        for i in range(len(result["averages"])):
+            values[f"Ave. Transmission #{i + 1}"] = result["averages"][i]
+
+    point = {
+        "T_step": state.T_step,
+        "freq_step": state.freq_step,
+        "volt_step": state.volt_step,
+        "time": time.time(),
+        "T_linkam": state.linkam_temperature,
+        "values": values,
+    }
+    state.store.append_point(point)
+    state.columnar.append(columnar_row(state, point))
+    state.results.set_point(state.T_step, state.freq_step, state.volt_step, values)
+
+    # the plot data are views of the results, nothing is copied
+    results = state.results
+    t, f, v = state.T_step, state.freq_step, state.volt_step
+    if len(state.voltage_list) == 1 and len(state.freq_list) == 1:
+        # a copy, as the temperatures may not be visited in the listed order
+        index = (results.measured[:, 0, 0], 0, 0)
+        state.xdata = results.T[index[0]]
+        state.results_x_label = "T"
+    elif len(state.voltage_list) == 1:
+        index = (t, slice(0, f + 1), 0)
+        state.xdata = results.freq[: f + 1]
+        state.results_x_label = "freq (Hz)"
+    elif len(state.freq_list) == 1:
+        index = (t, 0, slice(0, v + 1))
+        state.xdata = results.volt[: v + 1]
+        state.results_x_label = "voltage (V)"
+    else:
+        return
+    if state.calibration is None:
+        state.ydata = results["Cp"][index]
+        state.results_y_label = "C_p"
+    else:
+        state.ydata = state.calibration.permittivity(
+            results.freq, results["Cp"][index], results["D"][index], index[1]
+        )[0]
+        state.results_y_label = "eps'"
+    state.plot_updated = True
@@ -0,0 +1,608 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pyvisa
+import pyvisa.util
+from pyvisa import constants
+
+from lcdielectrics.lcd_instruments import (
+    AgilentSpectrometer,
+    LinkamHotstage,
+    Oscilloscope,
+)
+from lcdielectrics.lcd_scpi import ScpiCache
+
+# Addresses that select the simulated instruments. find_instruments offers
+# them when the LCD_SIMULATE environment variable is set.
+SIMULATED_ADDRESSES = {
+    "linkam": "SIM::LINKAM::INSTR",
+    "agilent": "SIM::E4980A::INSTR",
+    "oscilloscope": "SIM::SCOPE::INSTR",
+}
+
+EPSILON_0 = 8.8541878128e-12
+BOLTZMANN_EV = 8.617333262e-5
+
+# Measurement time of one E4980A point: a fixed part plus a number of periods
+# of the test signal, for each aperture mode.
+APERTURE_BASE_TIME = {"SHOR": 5.6e-3, "MED": 88e-3, "LONG": 220e-3}
+APERTURE_CYCLES = {"SHOR": 4, "MED": 8, "LONG": 20}
+
+
+def simulation_enabled() -> bool:
+    return os.environ.get("LCD_SIMULATE", "") not in ("", "0")
+
+
+def is_simulated(address: str) -> bool:
+    return address.startswith("SIM::")
+
+
+class SimulatedResource:
+    # Stands in for a pyvisa message based resource. Every write and read
+    # sleeps for the configured latency (scaled by latency_scale, 0 disables
+    # sleeping) and faults can be injected or raised at random.
+    def __init__(
+        self,
+        write_latency: float = 1e-3,
+        read_latency: float = 1e-3,
+        latency_scale: float = 1.0,
+        fault_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.write_latency = write_latency
+        self.read_latency = read_latency
+        self.latency_scale = latency_scale
+        self.fault_rate = fault_rate
+        self.rng = np.random.default_rng(seed)
+        self.faults: list[str] = []
+        self.reply: bytes = b""
+        # time spent "inside" the instrument, for benchmarks
+        self.busy_time = 0.0
+        self.lock = threading.Lock()
+        self.timeout = 2000
+        self.read_termination = "\n"
+        self.write_termination = "\n"
+        self.baud_rate = 9600
+
+    def inject_fault(self, kind: str, count: int = 1) -> None:
+        # kind is "timeout" (the next read raises VisaIOError) or "garbage"
+        # (the next reply is corrupted).
+        self.faults.extend([kind] * count)
+
+    def _next_fault(self) -> str | None:
+        if self.faults:
+            return self.faults.pop(0)
+        if self.fault_rate and self.rng.random() < self.fault_rate:
+            return self.rng.choice(["timeout", "garbage"])
+        return None
+
+    def _wait(self, duration: float) -> None:
+        self.busy_time += duration
+        if self.latency_scale > 0:
+            time.sleep(duration * self.latency_scale)
+
+    def handle(self, command: str) -> str | bytes | None:
+        raise NotImplementedError
+
+    def write(self, message: str) -> None:
+        with self.lock:
+            self._wait(self.write_latency)
+            for command in message.split(";"):
+                reply = self.handle(command.strip())
+                if reply is not None:
+                    self.reply = reply.encode() if isinstance(reply, str) else reply
+
+    def read_raw(self) -> bytes:
+        with self.lock:
+            self._wait(self.read_latency)
+            reply, self.reply = self.reply, b""
+            fault = self._next_fault()
+            if fault == "timeout":
+                raise pyvisa.errors.VisaIOError(constants.StatusCode.error_timeout)
+            elif fault == "garbage":
+                reply = bytes(self.rng.integers(0, 256, max(len(reply), 4), dtype=np.uint8))
+            return reply
+
+    def read(self) -> str:
+        return self.read_raw().decode(errors="replace").rstrip("\r\n")
+
+    def clear(self) -> None:
+        # device clear drops any reply not read yet
+        with self.lock:
+            self.reply = b""
+
+    def query(self, message: str) -> str:
+        self.write(message)
+        return self.read()
+
+    def read_ascii_values(self, converter="f", separator=",", container=list):
+        return pyvisa.util.from_ascii_block(
+            self.read(), converter=converter, separator=separator, container=container
+        )
+
+    def read_binary_values(
+        self, datatype="f", is_big_endian=False, container=list, **kwargs
+    ):
+        return pyvisa.util.from_ieee_block(
+            self.read_raw(), datatype, is_big_endian, container=container
+        )
+
+    def query_ascii_values(self, message: str, **kwargs):
+        self.write(message)
+        return self.read_ascii_values(**kwargs)
+
+    def query_binary_values(self, message: str, **kwargs):
+        self.write(message)
+        return self.read_binary_values(**kwargs)
+
+    def close(self) -> None:
+        pass
+
+
+class SimulatedLinkamT95(SimulatedResource):
+    # Linkam T95 serial protocol (R1 rate, L1 limit, S start, E stop, T status)
+    # with a ramped reference that the stage follows as an underdamped second
+    # order system, so large steps overshoot and ring before settling.
+    # time_scale speeds up the thermal model relative to wall clock time.
+    def __init__(
+        self,
+        ambient: float = 25.0,
+        natural_frequency: float = 0.08,
+        damping: float = 0.45,
+        ambient_time_constant: float = 600.0,
+        noise: float = 0.01,
+        time_scale: float = 1.0,
+        **kwargs,
+    ) -> None:
+        kwargs.setdefault("write_latency", 5e-3)
+        kwargs.setdefault("read_latency", 10e-3)
+        super().__init__(**kwargs)
+        self.read_termination = "\r"
+        self.write_termination = "\r"
+        self.baud_rate = 19200
+        self.ambient = ambient
+        self.natural_frequency = natural_frequency
+        self.damping = damping
+        self.ambient_time_constant = ambient_time_constant
+        self.noise = noise
+        self.time_scale = time_scale
+        self.rate = 20.0  # C/min
+        self.limit = ambient
+        self.running = False
+        self.temperature = ambient
+        self.velocity = 0.0
+        self.reference = ambient
+        self.sim_time = 0.0
+        self.last_update = time.monotonic()
+
+    def advance(self, dt: float) -> None:
+        # integrate the thermal model forward by dt simulated seconds
+        step = 0.05
+        while dt > 0:
+            h = min(step, dt)
+            dt -= h
+            if self.running:
+                max_change = self.rate / 60 * h
+                self.reference += float(
+                    np.clip(self.limit - self.reference, -max_change, max_change)
+                )
+                w = self.natural_frequency
+                acceleration = w**2 * (self.reference - self.temperature) - (
+                    2 * self.damping * w * self.velocity
+                )
+                self.velocity += acceleration * h
+                self.temperature += self.velocity * h
+            else:
+                self.velocity = 0.0
+                self.reference = self.temperature
+                self.temperature += (
+                    (self.ambient - self.temperature) * h / self.ambient_time_constant
+                )
+            self.sim_time += h
+
+    def _update(self) -> None:
+        now = time.monotonic()
+        self.advance((now - self.last_update) * self.time_scale)
+        self.last_update = now
+
+    def sample_temperature(self) -> float:
+        with self.lock:
+            self._update()
+            return self.temperature
+
+    def status(self) -> int:
+        if not self.running:
+            return 1
+        if self.reference != self.limit:
+            return 16 if self.limit > self.reference else 32
+        return 48
+
+    def handle(self, command: str) -> str | bytes | None:
+        self._update()
+        if command.startswith("R1"):
+            self.rate = int(command[2:]) / 100
+            return ""
+        elif command.startswith("L1"):
+            self.limit = int(command[2:]) / 10
+            return ""
+        elif command == "S":
+            self.running = True
+            self.reference = self.temperature
+            return ""
+        elif command == "E":
+            self.running = False
+            return ""
+        elif command == "T":
+            reading = self.temperature + self.noise * self.rng.standard_normal()
+            hex_T = f"{int(round(reading * 10)) & 0xFFFF:04x}"
+            return bytes([self.status(), 128, 0, 0, 0, 0]) + hex_T.encode() + b"\r"
+        return ""
+
+
+class SimulatedE4980A(SimulatedResource):
+    # E4980A SCPI subset used by AgilentSpectrometer. The sample is a liquid
+    # crystal cell with a Havriliak-Negami relaxation, dc conductivity and a
+    # Freedericksz transition above the threshold voltage, so frequency,
+    # voltage and temperature sweeps all give sensible spectra.
+    def __init__(
+        self,
+        C0: float = 20e-12,
+        stray_capacitance: float = 2e-12,
+        eps_perp: float = 4.5,
+        eps_par: float = 15.0,
+        eps_inf: float = 2.5,
+        relaxation_time: float = 1e-6,
+        activation_energy: float = 0.5,
+        alpha: float = 0.9,
+        beta: float = 0.8,
+        conductivity: float = 1e-8,
+        threshold_voltage: float = 0.9,
+        clearing_point: float = 60.0,
+        noise: float = 1e-4,
+        series_resistance: float = 0.0,
+        series_inductance: float = 0.0,
+        load_capacitance: float = 100e-12,
+        sample_temperature=None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.C0 = C0
+        self.stray_capacitance = stray_capacitance
+        self.eps_perp = eps_perp
+        self.eps_par = eps_par
+        self.eps_inf = eps_inf
+        self.relaxation_time = relaxation_time
+        self.activation_energy = activation_energy
+        self.alpha = alpha
+        self.beta = beta
+        self.conductivity = conductivity
+        self.threshold_voltage = threshold_voltage
+        self.clearing_point = clearing_point
+        self.noise = noise
+        # leads in series with everything, and what's in the fixture: "cell",
+        # or the "open", "short" or "load" (load_capacitance) standard
+        self.series_resistance = series_resistance
+        self.series_inductance = series_inductance
+        self.load_capacitance = load_capacitance
+        self.fixture = "cell"
+        self.sample_temperature = sample_temperature or (lambda: 25.0)
+        self.reset()
+
+    def reset(self) -> None:
+        self.freq = 1000.0
+        self.volt = 1.0
+        self.func = "CPD"
+        self.aperture = ("MED", 1)
+        self.page = "MEAS"
+        self.list_freq: list[float] = []
+        self.list_volt: list[float] = []
+        self.step_delay = 0.0
+        self.data_format = "ASC"
+        self.bias = 0.0
+        self.bias_on = False
+        self.last_result = np.zeros((1, 3))
+        self.last_was_list = False
+
+    def permittivity(self, freq, volt, T) -> np.ndarray:
+        freq = np.asarray(freq, dtype=float)
+        volt = np.abs(np.asarray(volt, dtype=float))
+        if self.bias_on:
+            volt = np.sqrt(volt**2 + self.bias**2)
+        omega = 2 * np.pi * freq
+
+        # nematic order relative to room temperature, falling to zero at the
+        # clearing point
+        clearing_point = self.clearing_point + 273.15
+        order = (
+            max(1 - (T + 273.15) / clearing_point, 0.0)
+            / (1 - 298.15 / clearing_point)
+        ) ** 0.2
+        order = min(order, 1.0)
+        eps_iso = (self.eps_par + 2 * self.eps_perp) / 3
+        eps_perp = eps_iso - (eps_iso - self.eps_perp) * order
+        eps_par = eps_iso + (self.eps_par - eps_iso) * order
+        # director tilts towards the field above the threshold
+        with np.errstate(divide="ignore", invalid="ignore"):
+            tilt = np.where(
+                volt > self.threshold_voltage, 1 - self.threshold_voltage / volt, 0.0
+            )
+        eps_static = eps_perp + (eps_par - eps_perp) * tilt
+
+        tau = self.relaxation_time * np.exp(
+            self.activation_energy
+            / BOLTZMANN_EV
+            * (1 / (T + 273.15) - 1 / (25 + 273.15))
+        )
+        eps = self.eps_inf + (eps_static - self.eps_inf) / (
+            1 + (1j * omega * tau) ** self.alpha
+        ) ** self.beta
+        eps = eps - 1j * self.conductivity / (EPSILON_0 * omega)
+        return eps
+
+    def impedance_values(self, func: str, freq, volt) -> np.ndarray:
+        freq = np.atleast_1d(np.asarray(freq, dtype=float))
+        volt = np.atleast_1d(np.asarray(volt, dtype=float))
+        omega = 2 * np.pi * freq
+        if self.fixture == "cell":
+            C = self.C0 * self.permittivity(freq, volt, self.sample_temperature())
+        elif self.fixture == "load":
+            C = np.full(len(freq), self.load_capacitance)
+        else:
+            C = np.zeros(len(freq))
+        Z_series = self.series_resistance + 1j * omega * self.series_inductance
+        noise = 1 + self.noise * self.rng.standard_normal(len(freq))
+        if self.fixture == "short":
+            Z = Z_series * noise
+        else:
+            Y = 1j * omega * (C + self.stray_capacitance) * noise
+            Z = 1 / Y + Z_series
+        Y = 1 / Z
+        G, B = Y.real, Y.imag
+        values = {
+            "CPD": (B / omega, G / B),
+            "CPG": (B / omega, G),
+            "CPRP": (B / omega, 1 / G),
+            "CSD": (-1 / (omega * Z.imag), G / B),
+            "CSRS": (-1 / (omega * Z.imag), Z.real),
+            "GB": (G, B),
+            "RX": (Z.real, Z.imag),
+            "ZTD": (np.abs(Z), np.degrees(np.angle(Z))),
+            "YTD": (np.abs(Y), np.degrees(np.angle(Y))),
+        }[func]
+        return np.column_stack([values[0], values[1], np.zeros(len(freq))])
+
+    def measurement_time(self, freq: float) -> float:
+        mode, averages = self.aperture
+        return (
+            APERTURE_BASE_TIME[mode] + APERTURE_CYCLES[mode] / max(freq, 1.0)
+        ) * averages
+
+    def trigger(self) -> None:
+        if self.page == "LIST" and (self.list_freq or self.list_volt):
+            if self.list_freq:
+                freqs = np.array(self.list_freq)
+                volts = np.full(len(freqs), self.volt)
+            else:
+                volts = np.array(self.list_volt)
+                freqs = np.full(len(volts), self.freq)
+            for f in freqs:
+                self._wait(self.step_delay + self.measurement_time(f))
+            self.last_result = self.impedance_values(self.func, freqs, volts)
+            self.last_was_list = True
+        else:
+            self._wait(self.measurement_time(self.freq))
+            self.last_result = self.impedance_values(self.func, self.freq, self.volt)
+            self.last_was_list = False
+
+    def fetch(self) -> bytes:
+        data = self.last_result
+        if self.last_was_list:
+            # list sweeps add a comparator result to every point
+            data = np.column_stack([data, np.zeros(len(data))])
+        data = data.ravel()
+        if self.data_format.startswith("REAL"):
+            return pyvisa.util.to_ieee_block(data, "d", True)
+        return (",".join(f"{x:+.6E}" for x in data) + "\n").encode()
+
+    def handle(self, command: str) -> str | bytes | None:
+        if not command:
+            return None
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        if header == "*IDN?":
+            return "Keysight Technologies,E4980A,SIMULATED,A.02.20\n"
+        elif header == "*RST":
+            self.reset()
+        elif header == ":FREQ":
+            self.freq = float(argument)
+        elif header == ":VOLT":
+            self.volt = float(argument)
+        elif header == ":FUNC:IMP":
+            self.func = argument.strip()
+        elif header == ":APER":
+            mode, averages = argument.split(",")
+            self.aperture = (mode.strip(), int(averages))
+        elif header == ":DISP:PAGE":
+            self.page = argument.strip()
+        elif header == ":LIST:FREQ":
+            self.list_freq = [float(x) for x in argument.split(",")]
+            self.list_volt = []
+        elif header == ":LIST:VOLT":
+            self.list_volt = [float(x) for x in argument.split(",")]
+            self.list_freq = []
+        elif header == ":LIST:CLE:ALL":
+            self.list_freq = []
+            self.list_volt = []
+        elif header == ":TRIG:TDEL":
+            self.step_delay = float(argument)
+        elif header == ":FORM:DATA":
+            self.data_format = argument.strip()
+        elif header == ":BIAS:VOLT":
+            self.bias = float(argument)
+        elif header == ":BIAS:STATE":
+            self.bias_on = argument.strip() == "ON"
+        elif header == ":TRIG:IMM":
+            self.trigger()
+        elif header == ":FETC?":
+            return self.fetch()
+        return None
+
+
+class SimulatedScope(SimulatedResource):
+    # InfiniiVision style oscilloscope measuring the transmitted intensity
+    # through the cell, which drops as the director reorients above the
+    # threshold voltage of the E4980A simulator.
+    def __init__(
+        self,
+        points: int = 1000,
+        acquisition_time: float = 20e-3,
+        noise: float = 0.02,
+        applied_voltage=None,
+        threshold_voltage: float = 0.9,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.points = points
+        self.acquisition_time = acquisition_time
+        self.noise = noise
+        self.applied_voltage = applied_voltage or (lambda: 0.0)
+        self.threshold_voltage = threshold_voltage
+        self.waveform_format = "ASCII"
+        self.acquire_type = "NORMal"
+        self.acquire_count = 1
+        self.y_increment = 2.0 / 65536
+        self.y_origin = -1.0
+        self.y_reference = 0.0
+        self.waveform = np.zeros(points)
+
+    def transmission(self) -> float:
+        volt = abs(self.applied_voltage())
+        if volt <= self.threshold_voltage:
+            return 0.8
+        return 0.8 * (self.threshold_voltage / volt) ** 2
+
+    def digitize(self) -> None:
+        averages = self.acquire_count if self.acquire_type.startswith("AVER") else 1
+        self._wait(self.acquisition_time * averages)
+        noise = self.noise / np.sqrt(averages)
+        self.waveform = self.transmission() + noise * self.rng.standard_normal(
+            self.points
+        )
+
+    def waveform_data(self) -> bytes:
+        if self.waveform_format.startswith("ASC"):
+            # like the real scope the first value carries the block header
+            body = ",".join(f"{x:+.6E}" for x in self.waveform)
+            return f"#8{len(body):08d}{body}\n".encode()
+        codes = np.round((self.waveform - self.y_origin) / self.y_increment)
+        if self.waveform_format.startswith("WORD"):
+            codes = np.clip(codes, 0, 65535).astype("<u2")
+        else:
+            codes = np.clip(codes / 256, 0, 255).astype("u1")
+        return pyvisa.util.to_ieee_block(codes.tobytes(), "s", False)
+
+    def preamble(self) -> str:
+        byte_format = self.waveform_format.startswith("BYTE")
+        y_increment = self.y_increment * (256 if byte_format else 1)
+        fmt = {"BYTE": 0, "WORD": 1}.get(self.waveform_format[:4], 4)
+        fields = [
+            fmt,
+            0,
+            self.points,
+            1,
+            1e-6,
+            0.0,
+            0,
+            y_increment,
+            self.y_origin,
+            self.y_reference,
+        ]
+        return ",".join(str(x) for x in fields) + "\n"
+
+    def handle(self, command: str) -> str | bytes | None:
+        if not command:
+            return None
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        if header == "*IDN?":
+            return "KEYSIGHT TECHNOLOGIES,DSOX1204G,SIMULATED,2.12\n"
+        elif header == ":WAVEFORM:FORMAT":
+            self.waveform_format = argument.strip().upper()
+        elif header == ":ACQUIRE:TYPE":
+            self.acquire_type = argument.strip()
+        elif header == ":ACQUIRE:COUNT":
+            self.acquire_count = int(argument)
+        elif header == ":DIGITIZE":
+            self.digitize()
+        elif header in (":WAV:DATA?", ":WAVEFORM:DATA?"):
+            return self.waveform_data()
+        elif header in (":WAV:PRE?", ":WAVEFORM:PREAMBLE?"):
+            return self.preamble()
+        return None
+
+
+class SimulatedRig:
+    # One of each simulated instrument, wired together so the E4980A sees the
+    # hot stage temperature and the scope sees the applied voltage.
+    def __init__(
+        self, time_scale: float = 1.0, latency_scale: float = 1.0, seed: int = 0
+    ) -> None:
+        self.linkam = SimulatedLinkamT95(
+            time_scale=time_scale, latency_scale=latency_scale, seed=seed
+        )
+        self.agilent = SimulatedE4980A(
+            sample_temperature=self.linkam.sample_temperature,
+            latency_scale=latency_scale,
+            seed=seed + 1,
+        )
+        self.scope = SimulatedScope(
+            applied_voltage=lambda: self.agilent.volt,
+            latency_scale=latency_scale,
+            seed=seed + 2,
+        )
+
+    def busy_time(self) -> float:
+        return self.linkam.busy_time + self.agilent.busy_time + self.scope.busy_time
+
+
+_default_rig: SimulatedRig | None = None
+
+
+def get_simulated_rig() -> SimulatedRig:
+    global _default_rig
+    if _default_rig is None:
+        _default_rig = SimulatedRig(
+            time_scale=float(os.environ.get("LCD_SIMULATE_TIME_SCALE", 1.0))
+        )
+    return _default_rig
+
+
+def set_simulated_rig(rig: SimulatedRig) -> None:
+    global _default_rig
+    _default_rig = rig
+
+
+class SimulatedLinkamHotstage(LinkamHotstage):
+    def initialise_linkam(self) -> None:
+        self.link = get_simulated_rig().linkam
+        self.init = False
+        self._read_temperature()
+        print("Linkam Connected! (simulated)")
+
+
+class SimulatedAgilentSpectrometer(AgilentSpectrometer):
+    def initialise(self, address: str) -> None:
+        self.spectrometer = get_simulated_rig().agilent
+        self.scpi = ScpiCache(self.spectrometer)
+        self.spectrometer_id = self.scpi.query("*IDN?")
+        print(self.spectrometer_id)
+        self.reset_and_clear()
+
+
+class SimulatedOscilloscope(Oscilloscope):
+    def initialise(self, address: str) -> None:
+        self.scope = get_simulated_rig().scope
+        self.scpi = ScpiCache(self.scope)
+        self.setup(self.waveform_format, self.hardware_averages)
@@ -0,0 +1,98 @@
+import numpy as np
+
+from lcdielectrics.lcd_dataclasses import measurement_settings
+
+# Deciding when the stage has settled at a setpoint. "Fixed" waits stab_time
+# after the stage comes within tolerance. "Adaptive" judges the live
+# temperature log instead: over the last stability_window seconds of readings
+# the temperature has to be flat (least squares slope under stability_slope,
+# C/min), quiet (standard deviation about that line under stability_std, C)
+# and still at the setpoint (mean within the arrival tolerance). Either way
+# the stage waits at least stability_min_wait and at most stability_max_wait.
+
+STABILITY_MODES = ("Fixed", "Adaptive")
+# the readings judged have to span this fraction of the window
+MIN_COVERAGE = 0.9
+MIN_SAMPLES = 3
+
+
+def window_statistics(
+    times, temperatures, window: float
+) -> tuple[float, float, float, int] | None:
+    # slope (C/min), standard deviation (C) about it and mean of the readings
+    # in the last window seconds, and how many there were. None if they don't
+    # cover the window yet.
+    n = min(len(times), len(temperatures))
+    times = np.asarray(times[:n], dtype=float)
+    temperatures = np.asarray(temperatures[:n], dtype=float)
+    if n < MIN_SAMPLES:
+        return None
+    in_window = times >= times[-1] - window
+    t = times[in_window] - times[-1]
+    T = temperatures[in_window]
+    if len(t) < MIN_SAMPLES or -t[0] < MIN_COVERAGE * window:
+        return None
+    slope, intercept = np.polyfit(t, T, 1)
+    residuals = T - (intercept + slope * t)
+    return float(slope * 60), float(residuals.std()), float(T.mean()), len(t)
+
+
+def check_stability(
+    times,
+    temperatures,
+    waited: float,
+    settings: measurement_settings,
+    setpoint: float,
+    tolerance: float,
+) -> dict | None:
+    # The decision once the stage counts as stable, None to keep waiting.
+    # waited is the time (s) since the stage came within tolerance of the
+    # setpoint.
+    if settings.stability_mode != "Adaptive":
+        if waited < settings.stab_time:
+            return None
+        return {"reason": "fixed", "waited": waited}
+    if waited < settings.stability_min_wait:
+        return None
+    statistics = window_statistics(times, temperatures, settings.stability_window)
+    # None in the record log if the readings don't cover the window
+    slope = std = offset = None
+    samples = 0
+    if statistics is not None:
+        slope, std, mean, samples = statistics
+        offset = mean - setpoint
+    if statistics is not None and (
+        abs(slope) < settings.stability_slope
+        and std < settings.stability_std
+        and abs(offset) < tolerance
+    ):
+        reason = "stable"
+    elif waited >= settings.stability_max_wait:
+        reason = "timeout"
+    else:
+        return None
+    return {
+        "reason": reason,
+        "waited": waited,
+        "slope": slope,
+        "std": std,
+        "offset": offset,
+        "samples": samples,
+    }
+
+
+def stability_deadline(waited: float, settings: measurement_settings) -> float:
+    # when (s after coming within tolerance) to decide again if no new
+    # reading arrives before then
+    if settings.stability_mode != "Adaptive":
+        return settings.stab_time
+    if waited < settings.stability_min_wait:
+        return settings.stability_min_wait
+    return settings.stability_max_wait
+
+
+def expected_wait(settings: measurement_settings) -> float:
+    # the wait assumed when planning the temperature order
+    if settings.stability_mode != "Adaptive":
+        return settings.stab_time
+    return settings.stability_min_wait
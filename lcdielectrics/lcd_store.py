@@ -0,0 +1,100 @@
+import json
+import os
+from pathlib import Path
+
+
+def store_path(output_file_path: str) -> str:
+    # the record log sits next to the JSON and xlsx outputs
+    return str(Path(output_file_path).with_suffix(".jsonl"))
+
+
+def read_records(path: str) -> tuple[dict | None, list[dict]]:
+    # Returns the run header and the point records. A line cut short by a crash
+    # can only be the last one, and is dropped.
+    header = None
+    points = []
+    try:
+        f = open(path, "r")
+    except OSError:
+        return None, []
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            if record["type"] == "run":
+                header = record
+            elif record["type"] == "point":
+                points.append(record)
+    return header, points
+
+
+def next_step(header: dict, points: list[dict]) -> tuple[int, int, int] | None:
+    # (T_position, freq_step, volt_step) to carry on from, None if the run is
+    # complete. T_position indexes the header's T_order, the order the
+    # temperatures are visited in (the listed order in older logs).
+    T_order = header.get("T_order") or list(range(len(header["T_list"])))
+    if not points:
+        return 0, 0, 0
+    last = points[-1]
+    T_position = T_order.index(last["T_step"])
+    freq_step, volt_step = last["freq_step"], last["volt_step"]
+    volt_step += 1
+    if volt_step == len(header["voltage_list"]):
+        volt_step = 0
+        freq_step += 1
+    if freq_step == len(header["freq_list"]):
+        freq_step = 0
+        T_position += 1
+    if T_position == len(T_order):
+        return None
+    return T_position, freq_step, volt_step
+
+
+class ResultsStore:
+    # Append-only log of a run, one JSON record per line. The first record
+    # describes the run, then there is one record per measured point. Every
+    # record is fsync'd before the next measurement, so at most the point
+    # being written is lost in a crash.
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = None
+
+    def create(self, header: dict) -> None:
+        self.close()
+        self.file = open(self.path, "w")
+        self._append({"type": "run", **header})
+
+    def reopen(self) -> None:
+        # append to an existing log, dropping a partly written last line
+        self.close()
+        with open(self.path, "rb+") as f:
+            contents = f.read()
+            end = contents.rfind(b"\n") + 1
+            if end != len(contents):
+                f.truncate(end)
+        self.file = open(self.path, "a")
+
+    def append_point(self, point: dict) -> None:
+        # point holds T_step, freq_step, volt_step and the measured values,
+        # plus the time and Linkam temperature it was measured at.
+        self._append({"type": "point", **point})
+
+    def append_stability(self, decision: dict) -> None:
+        # why and when the stage was taken as stable at a temperature, see
+        # lcd_stability
+        self._append({"type": "stability", **decision})
+
+    def _append(self, record: dict) -> None:
+        if self.file is None:
+            # a point that finished after the run was stopped
+            return
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
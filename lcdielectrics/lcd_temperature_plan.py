@@ -0,0 +1,122 @@
+from lcdielectrics.lcd_dataclasses import measurement_settings
+from lcdielectrics.lcd_stability import expected_wait
+
+# The order in which a run visits its temperatures. The results are always
+# indexed by the temperature list as entered, only the visits are reordered.
+#
+# "Fastest" picks whichever of the listed, ascending and descending orders is
+# predicted to take least time from where the stage is. From a start inside
+# the list, ascending is a cooling leg down to the lowest temperature then a
+# heating leg up through the rest (descending the other way round).
+#
+# An approach constraint ("From above" or "From below") makes the stage pass
+# APPROACH_MARGIN beyond a setpoint before going to it, whenever it would
+# otherwise arrive from the wrong side, e.g. for materials with a hysteretic
+# phase transition.
+
+TEMPERATURE_ORDERS = ("As listed", "Fastest")
+APPROACHES = ("Any", "From above", "From below")
+APPROACH_MARGIN = 2.0  # C
+# expected time (s) to settle into the tolerance window after a ramp, on top
+# of stab_time
+SETTLE_TIME = 30.0
+
+
+def setpoints(settings: measurement_settings) -> list[float]:
+    # the stage is set to whole degrees
+    return [round(float(x), 0) for x in settings.temperature_list]
+
+
+def format_duration(seconds: float) -> str:
+    hours, minutes = divmod(round(seconds / 60), 60)
+    if hours:
+        return f"{hours} h {minutes:02d} min"
+    return f"{minutes} min"
+
+
+def approach_waypoint(T: float, current_T: float, approach: str) -> float | None:
+    # where the stage has to go first to approach T from the required side,
+    # None if it can go straight there
+    if approach == "From above" and current_T <= T:
+        return T + APPROACH_MARGIN
+    if approach == "From below" and current_T >= T:
+        return T - APPROACH_MARGIN
+    return None
+
+
+def predicted_time(
+    T_list: list[float],
+    order: list[int],
+    start_T: float,
+    rate: float,
+    stab_time: float,
+    approach: str = "Any",
+) -> float:
+    # Seconds spent ramping (at rate, C/min) and stabilising over the visits.
+    # Consecutive visits to the same setpoint are only stabilised once.
+    total = 0.0
+    current = start_T
+    stable = None
+    for T_step in order:
+        T = T_list[T_step]
+        if T == stable:
+            continue
+        ramp = 0.0
+        waypoint = approach_waypoint(T, current, approach)
+        if waypoint is not None:
+            ramp += abs(waypoint - current)
+            current = waypoint
+        ramp += abs(T - current)
+        total += ramp / rate * 60 + SETTLE_TIME + stab_time
+        current = stable = T
+    return total
+
+
+def plan_order(
+    T_list: list[float],
+    start_T: float | None,
+    temperature_order: str = "As listed",
+    approach: str = "Any",
+    rate: float = 10.0,
+    stab_time: float = 0.0,
+) -> list[int]:
+    # The visit order as indices into T_list. Without a start temperature the
+    # stage is taken to start at the first listed one.
+    listed = list(range(len(T_list)))
+    if temperature_order != "Fastest" or not T_list:
+        return listed
+    if start_T is None:
+        start_T = T_list[0]
+    # sorted is stable, so repeated temperatures stay in their listed order
+    candidates = [
+        listed,
+        sorted(listed, key=lambda i: T_list[i]),
+        sorted(listed, key=lambda i: -T_list[i]),
+    ]
+    return min(
+        candidates,
+        key=lambda order: predicted_time(
+            T_list, order, start_T, rate, stab_time, approach
+        ),
+    )
+
+
+def plan_run(
+    settings: measurement_settings, start_T: float | None
+) -> tuple[list[int], float, float]:
+    # the visit order of a run and the predicted times (s) of the listed and
+    # planned orders
+    T_list = setpoints(settings)
+    if start_T is None and T_list:
+        start_T = T_list[0]
+    order = settings.T_order or plan_order(
+        T_list,
+        start_T,
+        settings.temperature_order,
+        settings.T_approach,
+        settings.T_rate,
+        expected_wait(settings),
+    )
+    args = (start_T, settings.T_rate, expected_wait(settings), settings.T_approach)
+    listed_time = predicted_time(T_list, list(range(len(T_list))), *args)
+    return order, listed_time, predicted_time(T_list, order, *args)
@@ -4,6 +4,10 @@ from lcdielectrics.lcd_dataclasses import (
     range_selector_window,
     variable_list,
 )
+from lcdielectrics.lcd_approach import APPROACH_MODES
+from lcdielectrics.lcd_fitting import MODELS
+from lcdielectrics.lcd_stability import STABILITY_MODES
+from lcdielectrics.lcd_temperature_plan import APPROACHES, TEMPERATURE_ORDERS
 import tkinter as tk
 from tkinter import filedialog
 import json
@@ -22,23 +26,34 @@ class lcd_ui:
         self.linkam_status = "Not Connected"
         self.agilent_status = "Not Connected"
         self.oscilloscope_status = "Not Connected"
+        # last measurement status shown, so the buttons are only restyled on a change
+        self.displayed_status = None
+        # last queue listing shown
+        self.displayed_queue: list[str] = []
+        # inputs of the temperature plan last shown
+        self.displayed_plan = None
         self._make_control_window()
         self._make_graph_windows()
         self.draw_children(VIEWPORT_WIDTH, DRAW_HEIGHT)
 
-        with dpg.theme() as START_THEME:
+        with dpg.theme() as self.start_theme:
             with dpg.theme_component(dpg.mvAll):
                 dpg.add_theme_color(
                     dpg.mvThemeCol_Button, (0, 100, 0), category=dpg.mvThemeCat_Core
                 )
-        with dpg.theme() as STOP_THEME:
+        with dpg.theme() as self.stop_theme:
             with dpg.theme_component(dpg.mvAll):
                 dpg.add_theme_color(
                     dpg.mvThemeCol_Button, (204, 36, 29), category=dpg.mvThemeCat_Core
                 )
+        with dpg.theme() as self.deactivated_theme:
+            with dpg.theme_component(dpg.mvAll):
+                dpg.add_theme_color(
+                    dpg.mvThemeCol_Button, (100, 100, 100), category=dpg.mvThemeCat_Core
+                )
 
-        dpg.bind_item_theme(self.start_button, START_THEME)
-        dpg.bind_item_theme(self.stop_button, STOP_THEME)
+        dpg.bind_item_theme(self.start_button, self.start_theme)
+        dpg.bind_item_theme(self.stop_button, self.stop_theme)
 
     def draw_children(self, width, height):
 
@@ -200,7 +215,14 @@ class lcd_ui:
 
                 with dpg.table_row():
                     self.num_averages_text = dpg.add_text("N: ", show=False)
-                    self.num_averages = dpg.add_input_int(default_value=5, width=-1, step =0, step_fast=0, show=False)
+                    self.num_averages = dpg.add_input_int(default_value=5, width=-1, step =0, step_fast=0, show=False, tag="num_averages")
+                    with dpg.group(horizontal=True, show=False) as self.scope_settings:
+                        self.scope_waveform_format = dpg.add_combo(
+                            ["ASCII", "BYTE", "WORD"], width=80, default_value="WORD", tag="scope_waveform_format"
+                        )
+                        self.scope_hardware_averaging = dpg.add_checkbox(
+                            label="HW Avg.", default_value=False, tag="scope_hardware_averaging"
+                        )
 
 
             with dpg.window(
@@ -235,6 +257,75 @@ class lcd_ui:
                             [0, 1.5, 2], width=-1, default_value=0, tag = "bias_level"
                         )
 
+                    with dpg.table_row():
+                        dpg.add_text("List sweep: ")
+                        self.list_sweep = dpg.add_checkbox(
+                            default_value=False, tag="list_sweep"
+                        )
+                        dpg.add_text("Empty Cell C0 (pF): ")
+                        self.empty_cell_capacitance = dpg.add_input_double(
+                            default_value=0, width=-1, step=0, step_fast=0, tag="empty_cell_capacitance"
+                        )
+
+                    with dpg.table_row():
+                        dpg.add_text("Stray C (pF): ")
+                        self.stray_capacitance = dpg.add_input_double(
+                            default_value=0, width=-1, step=0, step_fast=0, tag="stray_capacitance"
+                        )
+                        dpg.add_text("Calibration file: ")
+                        self.calibration_file = dpg.add_input_text(
+                            default_value="", width=-1, tag="calibration_file"
+                        )
+
+                    with dpg.table_row():
+                        dpg.add_text("Fit model: ")
+                        self.fit_model = dpg.add_combo(
+                            ["None", *MODELS], width=-1, default_value="None", tag="fit_model"
+                        )
+                        dpg.add_text("Fit conductivity: ")
+                        self.fit_conductivity = dpg.add_checkbox(
+                            default_value=False, tag="fit_conductivity"
+                        )
+
+                    with dpg.table_row():
+                        dpg.add_text("Compensation: ")
+                        self.compensation = dpg.add_combo(
+                            ["Off", "Software", "Instrument"], width=-1, default_value="Off", tag="compensation"
+                        )
+                        dpg.add_text("Fixture: ")
+                        self.fixture = dpg.add_input_text(
+                            default_value="default", width=-1, tag="fixture"
+                        )
+
+                    with dpg.table_row():
+                        dpg.add_text("Load Cp (pF): ")
+                        self.load_Cp = dpg.add_input_double(
+                            default_value=0, width=-1, step=0, step_fast=0, tag="load_Cp"
+                        )
+                        dpg.add_text("Load D: ")
+                        self.load_D = dpg.add_input_double(
+                            default_value=0, width=-1, step=0, step_fast=0, tag="load_D"
+                        )
+
+                    with dpg.table_row():
+                        self.compensation_buttons = {
+                            standard: dpg.add_button(
+                                label=f"Measure {standard.capitalize()}", width=-1
+                            )
+                            for standard in ("open", "short", "load")
+                        }
+                        self.record_empty_cell_button = dpg.add_button(
+                            label="Record Empty Cell", width=-1
+                        )
+
+                    with dpg.table_row():
+                        dpg.add_text("Data Format: ")
+                        self.data_format = dpg.add_combo(
+                            ["ASCII", "REAL"], width=-1, default_value="ASCII", tag="data_format"
+                        )
+                        dpg.add_text("Resume run: ")
+                        self.resume = dpg.add_checkbox(default_value=False, tag="resume")
+
                 with dpg.group(horizontal=True):
                     dpg.add_text("Output file path: ")
                     with dpg.table(header_row=False):
@@ -266,6 +357,23 @@ class lcd_ui:
                             callback=self.load_measurement_settings,
                         )
 
+                # setups run one after another, sharing temperatures
+                with dpg.table(header_row=False):
+                    dpg.add_table_column()
+                    dpg.add_table_column()
+                    dpg.add_table_column()
+                    with dpg.table_row():
+                        self.add_to_queue_button = dpg.add_button(
+                            label="Add to Queue", width=-1
+                        )
+                        self.remove_from_queue_button = dpg.add_button(
+                            label="Remove from Queue", width=-1
+                        )
+                        self.run_queue_button = dpg.add_button(
+                            label="Run Queue", width=-1
+                        )
+                self.queue_list = dpg.add_listbox(items=[], num_items=3, width=-1)
+
             with dpg.window(
                 label="Frequency List",
                 no_collapse=True,
@@ -308,13 +416,65 @@ class lcd_ui:
                             with dpg.table_row():
                                 dpg.add_text("Rate (°C/min): ")
                                 self.T_rate = dpg.add_input_double(
-                                    default_value=10, width=100, step=0, step_fast=0
+                                    default_value=10, width=100, step=0, step_fast=0, tag="T_rate"
                                 )
                             with dpg.table_row():
                                 dpg.add_text("Stab. Time (s)")
                                 self.stab_time = dpg.add_input_double(
-                                    default_value=1, width=100, step=0, step_fast=0
+                                    default_value=1, width=100, step=0, step_fast=0, tag="stab_time"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Ramp: ")
+                                self.approach_mode = dpg.add_combo(
+                                    APPROACH_MODES, default_value="Direct", width=100, tag="approach_mode"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Final rate (°C/min)")
+                                self.approach_rate = dpg.add_input_double(
+                                    default_value=2, width=100, step=0, step_fast=0, tag="approach_rate"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Stability: ")
+                                self.stability_mode = dpg.add_combo(
+                                    STABILITY_MODES, default_value="Fixed", width=100, tag="stability_mode"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Window (s)")
+                                self.stability_window = dpg.add_input_double(
+                                    default_value=30, width=100, step=0, step_fast=0, tag="stability_window"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Max slope (°C/min)")
+                                self.stability_slope = dpg.add_input_double(
+                                    default_value=0.05, width=100, step=0, step_fast=0, tag="stability_slope"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Max std (°C)")
+                                self.stability_std = dpg.add_input_double(
+                                    default_value=0.05, width=100, step=0, step_fast=0, tag="stability_std"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Min wait (s)")
+                                self.stability_min_wait = dpg.add_input_double(
+                                    default_value=10, width=100, step=0, step_fast=0, tag="stability_min_wait"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Max wait (s)")
+                                self.stability_max_wait = dpg.add_input_double(
+                                    default_value=600, width=100, step=0, step_fast=0, tag="stability_max_wait"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Order: ")
+                                self.temperature_order = dpg.add_combo(
+                                    TEMPERATURE_ORDERS, default_value="As listed", width=100, tag="temperature_order"
+                                )
+                            with dpg.table_row():
+                                dpg.add_text("Approach: ")
+                                self.T_approach = dpg.add_combo(
+                                    APPROACHES, default_value="Any", width=100, tag="T_approach"
                                 )
+                        # predicted time of the run's temperature steps
+                        self.T_plan_text = dpg.add_text("")
 
             with dpg.window(
                 no_title_bar=True,
@@ -355,6 +515,33 @@ class lcd_ui:
             self.averaging_factor: dpg.get_value(self.averaging_factor),
             self.bias_level: dpg.get_value(self.bias_level),
             self.output_file_path: dpg.get_value(self.output_file_path),
+            self.list_sweep: dpg.get_value(self.list_sweep),
+            self.empty_cell_capacitance: dpg.get_value(self.empty_cell_capacitance),
+            self.stray_capacitance: dpg.get_value(self.stray_capacitance),
+            self.calibration_file: dpg.get_value(self.calibration_file),
+            self.fit_model: dpg.get_value(self.fit_model),
+            self.fit_conductivity: dpg.get_value(self.fit_conductivity),
+            self.compensation: dpg.get_value(self.compensation),
+            self.fixture: dpg.get_value(self.fixture),
+            self.load_Cp: dpg.get_value(self.load_Cp),
+            self.load_D: dpg.get_value(self.load_D),
+            self.data_format: dpg.get_value(self.data_format),
+            self.T_rate: dpg.get_value(self.T_rate),
+            self.stab_time: dpg.get_value(self.stab_time),
+            self.approach_mode: dpg.get_value(self.approach_mode),
+            self.approach_rate: dpg.get_value(self.approach_rate),
+            self.stability_mode: dpg.get_value(self.stability_mode),
+            self.stability_window: dpg.get_value(self.stability_window),
+            self.stability_slope: dpg.get_value(self.stability_slope),
+            self.stability_std: dpg.get_value(self.stability_std),
+            self.stability_min_wait: dpg.get_value(self.stability_min_wait),
+            self.stability_max_wait: dpg.get_value(self.stability_max_wait),
+            self.temperature_order: dpg.get_value(self.temperature_order),
+            self.T_approach: dpg.get_value(self.T_approach),
+            self.num_averages: dpg.get_value(self.num_averages),
+            self.scope_waveform_format: dpg.get_value(self.scope_waveform_format),
+            self.scope_hardware_averaging: dpg.get_value(self.scope_hardware_averaging),
+            self.resume: dpg.get_value(self.resume),
             "freq_list": dpg.get_item_configuration(
                 self.freq_list.list_handle
             )["items"],
@@ -1,87 +1,184 @@
-import json
 import threading
-import time
 
 import dearpygui.dearpygui as dpg
+import numpy as np
 import pyvisa
 
-from lcdielectrics.lcd_dataclasses import OutputType, Status, lcd_instruments, lcd_state
-from lcdielectrics.lcd_excel_writer import make_excel
-from lcdielectrics.lcd_instruments import AgilentSpectrometer, LinkamHotstage
+from lcdielectrics import lcd_calibration, lcd_compensation
+from lcdielectrics.lcd_batch import list_item_values
+from lcdielectrics.lcd_dataclasses import (
+    Status,
+    lcd_instruments,
+    lcd_state,
+    measurement_settings,
+)
+from lcdielectrics.lcd_discovery import (
+    discover_instruments,
+    reconnect_known,
+    remember_address,
+)
+from lcdielectrics.lcd_simulators import (
+    SIMULATED_ADDRESSES,
+    SimulatedAgilentSpectrometer,
+    SimulatedLinkamHotstage,
+    SimulatedOscilloscope,
+    is_simulated,
+)
+from lcdielectrics.lcd_instruments import (
+    AgilentSpectrometer,
+    LinkamHotstage,
+    Oscilloscope,
+)
+from lcdielectrics.lcd_queue import MeasurementQueue
+from lcdielectrics.lcd_sequencer import MeasurementSequencer, describe_status
+from lcdielectrics.lcd_temperature_plan import format_duration, plan_run
 from lcdielectrics.lcd_ui import lcd_ui
 
-# TODO: find a way to handle exceptions in instrument threads?
+# The measurement itself runs on the MeasurementSequencer thread. These
+# functions only read the settings from the GUI and show the sequencer's state.
+
+
+def list_values(list_handle) -> list[float]:
+    return list_item_values(dpg.get_item_configuration(list_handle)["items"])
+
+
+def read_settings(frontend: lcd_ui) -> measurement_settings:
+    return measurement_settings(
+        freq_list=list_values(frontend.freq_list.list_handle),
+        volt_list=list_values(frontend.volt_list.list_handle),
+        temperature_list=list_values(frontend.temperature_list.list_handle),
+        delay_time=dpg.get_value(frontend.delay_time),
+        meas_time_mode=dpg.get_value(frontend.meas_time_mode_selector),
+        averaging_factor=dpg.get_value(frontend.averaging_factor),
+        bias_level=float(dpg.get_value(frontend.bias_level)),
+        output_file_path=dpg.get_value(frontend.output_file_path),
+        list_sweep=dpg.get_value(frontend.list_sweep),
+        empty_cell_capacitance=dpg.get_value(frontend.empty_cell_capacitance),
+        stray_capacitance=dpg.get_value(frontend.stray_capacitance),
+        calibration_file=dpg.get_value(frontend.calibration_file),
+        fit_model=dpg.get_value(frontend.fit_model),
+        fit_conductivity=dpg.get_value(frontend.fit_conductivity),
+        compensation=dpg.get_value(frontend.compensation),
+        fixture=dpg.get_value(frontend.fixture),
+        load_Cp=dpg.get_value(frontend.load_Cp),
+        load_D=dpg.get_value(frontend.load_D),
+        data_format=dpg.get_value(frontend.data_format),
+        T_rate=dpg.get_value(frontend.T_rate),
+        stab_time=dpg.get_value(frontend.stab_time),
+        approach_mode=dpg.get_value(frontend.approach_mode),
+        approach_rate=dpg.get_value(frontend.approach_rate),
+        stability_mode=dpg.get_value(frontend.stability_mode),
+        stability_window=dpg.get_value(frontend.stability_window),
+        stability_slope=dpg.get_value(frontend.stability_slope),
+        stability_std=dpg.get_value(frontend.stability_std),
+        stability_min_wait=dpg.get_value(frontend.stability_min_wait),
+        stability_max_wait=dpg.get_value(frontend.stability_max_wait),
+        temperature_order=dpg.get_value(frontend.temperature_order),
+        T_approach=dpg.get_value(frontend.T_approach),
+        num_averages=dpg.get_value(frontend.num_averages),
+        scope_waveform_format=dpg.get_value(frontend.scope_waveform_format),
+        scope_hardware_averaging=dpg.get_value(frontend.scope_hardware_averaging),
+        resume=dpg.get_value(frontend.resume),
+    )
 
 
 def start_measurement(
-    state: lcd_state, frontend: lcd_ui, instruments: lcd_instruments
+    state: lcd_state,
+    frontend: lcd_ui,
+    instruments: lcd_instruments,
+    sequencer: MeasurementSequencer,
+    measurement_queue: MeasurementQueue,
 ) -> None:
+    if measurement_queue.running:
+        return
     dpg.configure_item(frontend.start_button, enabled=False)
-    with dpg.theme() as DEACTIVATED_THEME:
-        with dpg.theme_component(dpg.mvAll):
-            dpg.add_theme_color(
-                dpg.mvThemeCol_Button, (100, 100, 100), category=dpg.mvThemeCat_Core
-            )
-    dpg.bind_item_theme(frontend.start_button, DEACTIVATED_THEME)
-    state.freq_list = [
-        float(x.split("\t")[-1])
-        for x in dpg.get_item_configuration(frontend.freq_list.list_handle)["items"]
-    ]
-    state.voltage_list = [
-        float(x.split("\t")[-1])
-        for x in dpg.get_item_configuration(frontend.volt_list.list_handle)["items"]
-    ]
-    state.T_list = [
-        float(x.split("\t")[-1])
-        for x in dpg.get_item_configuration(frontend.temperature_list.list_handle)[
-            "items"
-        ]
-    ]
+    dpg.bind_item_theme(frontend.start_button, frontend.deactivated_theme)
+    sequencer.start(read_settings(frontend))
 
-    state.T_list = [round(x, 0) for x in state.T_list]
 
-    instruments.agilent.set_aperture_mode(
-        dpg.get_value(frontend.meas_time_mode_selector),
-        dpg.get_value(frontend.averaging_factor),
-    )
+def stop_measurement(
+    sequencer: MeasurementSequencer, measurement_queue: MeasurementQueue
+) -> None:
+    if measurement_queue.running:
+        measurement_queue.stop()
+    else:
+        sequencer.stop()
 
-    bias = dpg.get_value(frontend.bias_level)
-    if bias == 1.5 or 2:
-        instruments.agilent.set_DC_bias(float(bias))
 
-    state.T_step = 0
-    state.freq_step = 0
-    state.volt_step = 0
+def add_to_queue(frontend: lcd_ui, measurement_queue: MeasurementQueue) -> None:
+    # the queue can be added to while it runs
+    measurement_queue.add(read_settings(frontend))
 
-    T = state.T_list[state.T_step]
-    freq = state.freq_list[state.freq_step]
 
-    T_str = f"{state.T_step + 1}: {state.T_list[state.T_step]}"
-    freq_str = f"{state.freq_step + 1}: {freq}"
+def remove_from_queue(frontend: lcd_ui, measurement_queue: MeasurementQueue) -> None:
+    # queue list items look like "3: results.json (Queued, 0/5)"
+    selected = dpg.get_value(frontend.queue_list)
+    if selected:
+        measurement_queue.remove(int(selected.split(":")[0]))
 
-    state.resultsDict[T_str] = dict()
-    state.resultsDict[T_str][freq_str] = dict()
-    state.resultsDict[T_str][freq_str]["volt"] = []
-    state.resultsDict[T_str][freq_str]["Cp"] = []
-    state.resultsDict[T_str][freq_str]["D"] = []
-    state.resultsDict[T_str][freq_str]["G"] = []
-    state.resultsDict[T_str][freq_str]["B"] = []
 
-    if instruments.oscilloscope:
-        for i in range(dpg.get_value(frontend.num_averages)):
-            state.resultsDict[T_str][freq_str][f"Ave. Transmission #{i + 1}"] = []
+def run_queue(state: lcd_state, measurement_queue: MeasurementQueue) -> None:
+    if state.measurement_status == Status.IDLE:
+        measurement_queue.run()
 
-    state.measurement_status = Status.SET_TEMPERATURE
-    state.xdata = []
-    state.ydata = []
 
+def record_empty_cell(
+    state: lcd_state, frontend: lcd_ui, instruments: lcd_instruments
+) -> None:
+    # Sweep the empty cell over the frequency list at the first voltage and
+    # save it as the calibration file for the following runs.
+    if state.measurement_status != Status.IDLE or not instruments.agilent:
+        return
+    freq_list = list_values(frontend.freq_list.list_handle)
+    voltage = list_values(frontend.volt_list.list_handle)[0]
+    path = dpg.get_value(frontend.calibration_file) or "empty_cell.cal.json"
+    dpg.configure_item(frontend.record_empty_cell_button, enabled=False)
+    try:
+        calibration = lcd_calibration.record_empty_cell(
+            instruments.agilent,
+            freq_list,
+            voltage,
+            dpg.get_value(frontend.stray_capacitance) * 1e-12,
+        )
+        calibration.save(path)
+        dpg.set_value(frontend.calibration_file, path)
+    finally:
+        dpg.configure_item(frontend.record_empty_cell_button, enabled=True)
 
-def stop_measurement(
-    instruments: lcd_instruments, state: lcd_state, frontend: lcd_ui
+
+def record_compensation(
+    state: lcd_state, frontend: lcd_ui, instruments: lcd_instruments, standard: str
 ) -> None:
-    instruments.linkam.stop()
-    instruments.agilent.reset_and_clear()
-    state.measurement_status = Status.IDLE
+    # Measure the open, short or load standard in the fixture over the
+    # frequency list, on the E4980A itself in "Instrument" mode or into the
+    # fixture's cached table otherwise.
+    if state.measurement_status != Status.IDLE or not instruments.agilent:
+        return
+    freq_list = list_values(frontend.freq_list.list_handle)
+    voltage = list_values(frontend.volt_list.list_handle)[0]
+    load_Cp = dpg.get_value(frontend.load_Cp) * 1e-12
+    load_D = dpg.get_value(frontend.load_D)
+    buttons = frontend.compensation_buttons
+    for button in buttons.values():
+        dpg.configure_item(button, enabled=False)
+    try:
+        if dpg.get_value(frontend.compensation) == "Instrument":
+            instruments.agilent.measure_spot_correction(
+                standard, freq_list, load_Cp, load_D
+            )
+        else:
+            lcd_compensation.measure_standard(
+                instruments.agilent,
+                standard,
+                dpg.get_value(frontend.fixture),
+                freq_list,
+                voltage,
+                load_Cp,
+                load_D,
+            )
+    finally:
+        for button in buttons.values():
+            dpg.configure_item(button, enabled=True)
 
 
 def init_agilent(
@@ -89,11 +186,16 @@ def init_agilent(
 ) -> None:
     if instruments.agilent:
         instruments.agilent.close()
-    agilent = AgilentSpectrometer(dpg.get_value(frontend.agilent_com_selector))
+    address = dpg.get_value(frontend.agilent_com_selector)
+    if is_simulated(address):
+        agilent = SimulatedAgilentSpectrometer(address)
+    else:
+        agilent = AgilentSpectrometer(address)
     dpg.set_value(frontend.agilent_status, "Connected")
     dpg.configure_item(frontend.agilent_initialise, label="Reconnect")
     instruments.agilent = agilent
     state.agilent_connection_status = "Connected"
+    remember_address("agilent", address)
 
 
 def init_oscilloscope(
@@ -101,32 +203,38 @@ def init_oscilloscope(
 ) -> None:
     if instruments.oscilloscope:
         instruments.oscilloscope.close()
-    rm = pyvisa.ResourceManager()
-    instruments.oscilloscope = rm.open_resource(
-        dpg.get_value(frontend.oscilloscope_com_selector)
+    address = dpg.get_value(frontend.oscilloscope_com_selector)
+    if is_simulated(address):
+        scope_class = SimulatedOscilloscope
+    else:
+        scope_class = Oscilloscope
+    instruments.oscilloscope = scope_class(
+        address, dpg.get_value(frontend.scope_waveform_format)
     )
     dpg.set_value(frontend.oscilloscope_status, "Connected")
     dpg.configure_item(frontend.oscilloscope_initialise, label="Reconnect")
     dpg.show_item(frontend.num_averages)
     dpg.show_item(frontend.num_averages_text)
+    dpg.show_item(frontend.scope_settings)
     state.oscilloscope_connection_status = "Connected"
-    instruments.oscilloscope.write(":WAVeform:FORMat ASCII")
-    instruments.oscilloscope.write(":ACQuire:TYPE NORMal")
-    instruments.oscilloscope.write(":TIMebase:DELay 0")
+    remember_address("oscilloscope", address)
 
 
 def init_linkam(
     frontend: lcd_ui, instruments: lcd_instruments, state: lcd_state
 ) -> None:
-    linkam = LinkamHotstage(dpg.get_value(frontend.linkam_com_selector))
+    address = dpg.get_value(frontend.linkam_com_selector)
+    if is_simulated(address):
+        linkam = SimulatedLinkamHotstage(address)
+    else:
+        linkam = LinkamHotstage(address)
     try:
         linkam.current_temperature()
         dpg.set_value(frontend.linkam_status, "Connected")
         dpg.hide_item(frontend.linkam_initialise)
         instruments.linkam = linkam
         state.linkam_connection_status = "Connected"
-        with open("address.dat", "w") as f:
-            f.write(dpg.get_value(frontend.linkam_com_selector))
+        remember_address("linkam", address)
 
     except pyvisa.errors.VisaIOError:
         dpg.set_value(frontend.linkam_status, "Couldn't connect")
@@ -154,331 +262,144 @@ def connect_to_instrument_callback(sender, app_data, user_data):
     thread.start()
 
 
-def handle_measurement_status(
-    state: lcd_state, frontend: lcd_ui, instruments: lcd_instruments
-):
-    current_wait = 0
-    if state.measurement_status == Status.IDLE:
-        dpg.set_value(frontend.measurement_status, "Idle")
-        dpg.configure_item(frontend.start_button, enabled=True)
-
-        with dpg.theme() as START_THEME:
-            with dpg.theme_component(dpg.mvAll):
-                dpg.add_theme_color(
-                    dpg.mvThemeCol_Button, (0, 100, 0), category=dpg.mvThemeCat_Core
-                )
-        dpg.bind_item_theme(frontend.start_button, START_THEME)
-    elif state.measurement_status == Status.SET_TEMPERATURE and (
-        state.linkam_action == "Stopped" or state.linkam_action == "Holding"
-    ):
-        instruments.linkam.set_temperature(
-            state.T_list[state.T_step], dpg.get_value(frontend.T_rate)
-        )
-        state.measurement_status = Status.GOING_TO_TEMPERATURE
-        dpg.set_value(
-            frontend.measurement_status, f"Going to {state.T_list[state.T_step]} C"
-        )
-    elif state.measurement_status == Status.GOING_TO_TEMPERATURE and (
-        state.linkam_temperature > state.T_list[state.T_step] - 0.1
-        and state.linkam_temperature < state.T_list[state.T_step] + 0.1
-    ):
-        state.t_stable_start = time.time()
-        state.measurement_status = Status.STABILISING_TEMPERATURE
-
-    elif state.measurement_status == Status.STABILISING_TEMPERATURE:
-        current_wait = time.time() - state.t_stable_start
-        dpg.set_value(
-            frontend.measurement_status,
-            f"Stabilising temperature for {current_wait:.2f}/{dpg.get_value(frontend.stab_time)}s",
-        )
-        if current_wait >= dpg.get_value(frontend.stab_time):
-            state.measurement_status = Status.TEMPERATURE_STABILISED
-
-    elif state.measurement_status == Status.TEMPERATURE_STABILISED:
-        state.measurement_status = Status.COLLECTING_DATA
-        instruments.agilent.set_frequency(state.freq_list[state.freq_step])
-
-        instruments.agilent.set_voltage(state.voltage_list[state.volt_step])
-
-        run_spectrometer(frontend, instruments, state)
-
-    elif state.measurement_status == Status.COLLECTING_DATA:
-        if state.spectrometer_running:
-            dpg.set_value(
-                frontend.measurement_status,
-                f"Spectrometer: f = {state.freq_list[state.freq_step]:.2f}, V = {state.voltage_list[state.volt_step]}",
-            )
-
-        else:
-            dpg.set_value(
-                frontend.measurement_status,
-                f"Oscilloscope: f = {state.freq_list[state.freq_step]:.2f}, V = {state.voltage_list[state.volt_step]}",
-            )
-
-    elif state.measurement_status == Status.FINISHED:
-        instruments.linkam.stop()
-
-        instruments.agilent.reset_and_clear()
-
-        state.measurement_status = Status.IDLE
-        dpg.set_value(frontend.measurement_status, "Idle")
-
-
-def find_instruments(frontend: lcd_ui):
-    # com_selector = [x.__str__() for x  in list_ports.comports()]
-
-    dpg.set_value(frontend.measurement_status, "Finding Instruments...")
-    rm = pyvisa.ResourceManager()
-    visa_resources = rm.list_resources()
-
-    com_selector = [x for x in visa_resources if x.split("::")[0][0:4] == "ASRL"]
-    usb_selector = [x for x in visa_resources if x.split("::")[0][0:3] == "USB"]
-
-    dpg.configure_item(frontend.linkam_com_selector, items=com_selector)
-    dpg.configure_item(frontend.agilent_com_selector, items=usb_selector)
-    dpg.configure_item(frontend.oscilloscope_com_selector, items=usb_selector)
-
-    dpg.set_value(frontend.measurement_status, "Found instruments!")
-    dpg.set_value(frontend.measurement_status, "Idle")
+def queue_items(measurement_queue: MeasurementQueue) -> list[str]:
+    return [
+        f"{job.id}: {job.settings.output_file_path} ({job.status.value}, "
+        f"{job.next_position}/{len(job.order)})"
+        for job in measurement_queue.jobs()
+    ]
 
 
-def run_spectrometer(
-    frontend: lcd_ui, instruments: lcd_instruments, state: lcd_state
-) -> None:
-    thread = threading.Thread(
-        target=run_experiment, args=(frontend, instruments, state)
+def show_temperature_plan(state: lcd_state, frontend: lcd_ui) -> None:
+    # the predicted time of the temperature steps from where the stage is,
+    # and what the chosen order saves over the listed one
+    settings = read_settings(frontend)
+    inputs = (
+        settings.temperature_list,
+        settings.temperature_order,
+        settings.T_approach,
+        settings.T_rate,
+        settings.stab_time,
+        settings.stability_mode,
+        settings.stability_min_wait,
+        round(state.linkam_temperature),
     )
-    thread.daemon = True
-    thread.start()
+    if inputs == frontend.displayed_plan:
+        return
+    frontend.displayed_plan = inputs
+    if not settings.temperature_list or settings.T_rate <= 0:
+        dpg.set_value(frontend.T_plan_text, "")
+        return
+    _, listed_time, planned_time = plan_run(settings, state.linkam_temperature)
+    text = f"Predicted: {format_duration(planned_time)}"
+    if listed_time - planned_time >= 60:
+        text += f" (saves {format_duration(listed_time - planned_time)})"
+    dpg.set_value(frontend.T_plan_text, text)
 
 
-def run_experiment(frontend: lcd_ui, instruments: lcd_state, state: lcd_state):
-    result = dict()
-    time.sleep(dpg.get_value(frontend.delay_time))
-    result["CPD"] = instruments.agilent.measure("CPD")
-
-    time.sleep(0.5)
-    result["GB"] = instruments.agilent.measure("GB")
-
-    time.sleep(0.5)
-    get_result(result, state, frontend, instruments)
-
-
-def run_oscilloscope(
-    result, frontend: lcd_ui, instruments: lcd_state, state: lcd_state
+def handle_measurement_status(
+    state: lcd_state,
+    frontend: lcd_ui,
+    instruments: lcd_instruments,
+    measurement_queue: MeasurementQueue,
 ):
-    result = dict()
-    if state.oscilloscope_connection_status == "Connected":
-        state.spectrometer_running = False
-        result["averages"] = get_data_from_scope(frontend, instruments, state)
-        state.spectrometer_running = True
-        T_str = f"{state.T_step + 1}: {state.T_list[state.T_step]}"
-        freq_str = f"{state.freq_step + 1}: {state.freq_list[state.freq_step]}"
-        for i in range(len(result["averages"])):
-            state.resultsDict[T_str][freq_str][f"Ave. Transmission #{i + 1}"].append(
-                result["averages"][i]
+    # called once per frame, only reads the state the sequencer keeps
+    items = queue_items(measurement_queue)
+    if items != frontend.displayed_queue:
+        dpg.configure_item(frontend.queue_list, items=items)
+        frontend.displayed_queue = items
+    status = state.measurement_status
+    changed = status != frontend.displayed_status
+    if changed:
+        if status == Status.IDLE:
+            dpg.configure_item(frontend.start_button, enabled=True)
+            dpg.bind_item_theme(frontend.start_button, frontend.start_theme)
+        elif frontend.displayed_status in (None, Status.IDLE):
+            dpg.configure_item(frontend.start_button, enabled=False)
+            dpg.bind_item_theme(frontend.start_button, frontend.deactivated_theme)
+        frontend.displayed_status = status
+    # while idle the status text is left alone, e.g. for the instrument search
+    if changed or status != Status.IDLE:
+        dpg.set_value(frontend.measurement_status, describe_status(state))
+    if status == Status.IDLE:
+        show_temperature_plan(state, frontend)
+
+    if state.plot_updated:
+        state.plot_updated = False
+        xdata = np.asarray(state.xdata).tolist()
+        ydata = np.asarray(state.ydata).tolist()
+        dpg.configure_item(frontend.results_V_axis, label=state.results_x_label)
+        dpg.configure_item(frontend.results_Cp_axis, label=state.results_y_label)
+        dpg.set_value(frontend.results_plot, [xdata, ydata])
+
+        if len(ydata) > 0 and len(xdata) > 0:
+            dpg.set_axis_limits(
+                frontend.results_Cp_axis,
+                min(ydata) - 0.1 * min(ydata),
+                max(ydata) + 0.1 * max(ydata),
+            )
+            dpg.set_axis_limits(
+                frontend.results_V_axis,
+                min(xdata) - 0.1,
+                max(xdata) + 0.1,
             )
 
-
-def get_data_from_scope(
-    frontend: lcd_ui, instruments: lcd_instruments, state: lcd_state
-):
-    n = dpg.get_value(frontend.num_averages)
-    total = []
-    for i in range(n):
-        print(
-            f"Measuring {i + 1}/{dpg.get_value(frontend.num_averages)} f = {state.freq_list[state.freq_step]:.2f}, V = {state.voltage_list[state.volt_step]} "
-        )
-        instruments.oscilloscope.write(":DIGitize CHANnel1")
-        data = "1"
-        try:
-            data = instruments.oscilloscope.query(":WAV:DATA?")
-        except Exception as e:
-            print("Data read failed: ", e)
-        data = data.strip().split(",")
-        data = [float(x) for x in data[1:]]
-        average = sum(data) / len(data)
-        total.append(average)
-    instruments.oscilloscope.write(":WAVeform:FORMat ASCII")
-    instruments.oscilloscope.write(":ACQuire:TYPE NORMal")
-    instruments.oscilloscope.write(":TIMebase:DELay 0")
-    return total
-
-
-def read_temperature(frontend: lcd_ui, instruments: lcd_instruments, state: lcd_state):
-    log_time = 0
-    time_step = 0.05
-    while True:
-        temperature, status = instruments.linkam.current_temperature()
-        if temperature == 0.0:
-            continue
-        state.linkam_temperature = temperature
+    if state.linkam_connection_status == "Reading" and state.T_log_T:
+        # the sequencer may be appending to the log, so take equal length copies
+        n = min(len(state.T_log_time), len(state.T_log_T))
+        T_log_time = state.T_log_time[:n]
+        T_log_T = state.T_log_T[:n]
         dpg.set_value(
-            frontend.linkam_status, f"T: {str(temperature)}, Status: {status}"
+            frontend.linkam_status,
+            f"T: {str(state.linkam_temperature)}, Status: {state.linkam_action}",
         )
-        state.T_log_time.append(log_time)
-        state.T_log_T.append(temperature)
-
-        if len(state.T_log_T) == 1000:
-            state.T_log_T = state.T_log_T[1:]
-            state.T_log_time = state.T_log_time[1:]
-
-        dpg.set_value(frontend.temperature_log, [state.T_log_time, state.T_log_T])
+        dpg.set_value(frontend.temperature_log, [T_log_time, T_log_T])
         dpg.set_axis_limits(
             frontend.temperature_log_T_axis,
-            min(state.T_log_T) - 0.2,
-            max(state.T_log_T) + 0.2,
+            min(T_log_T) - 0.2,
+            max(T_log_T) + 0.2,
         )
         dpg.fit_axis_data(frontend.temperature_log_time_axis)
+    elif state.linkam_connection_status == "Lost":
+        # the temperature watcher lost the Linkam, it has to be initialised again
+        dpg.set_value(frontend.linkam_status, "Connection lost")
+        dpg.show_item(frontend.linkam_initialise)
 
-        state.linkam_action = status
-        time.sleep(time_step)
-        log_time += time_step
 
+def find_instruments(frontend: lcd_ui) -> None:
+    dpg.set_value(frontend.measurement_status, "Finding Instruments...")
+    selectors = {
+        "linkam": frontend.linkam_com_selector,
+        "agilent": frontend.agilent_com_selector,
+        "oscilloscope": frontend.oscilloscope_com_selector,
+    }
+
+    # Instruments that answer at their cached addresses are selected straight
+    # away, before the slower full search. Nothing is connected here (that
+    # resets an E4980A), the Initialise buttons do that.
+    known = reconnect_known()
+    for role, address in known.items():
+        dpg.configure_item(selectors[role], items=[address])
+        dpg.set_value(selectors[role], address)
+
+    resources, roles = discover_instruments(exclude=tuple(known.values()))
+    resources += [x for x in known.values() if x not in resources]
+
+    com_selector = [
+        x
+        for x in resources
+        if x.startswith("ASRL") or x == SIMULATED_ADDRESSES["linkam"]
+    ]
+    usb_selector = [x for x in resources if x not in com_selector]
 
-def get_result(
-    result: dict, state: lcd_state, frontend: lcd_ui, instruments: lcd_instruments
-) -> None:
-    parse_result(result, state, frontend)
-
-    if state.measurement_status == Status.IDLE:
-        pass
-
-    else:
-        if len(state.voltage_list) == 1 and len(state.freq_list) == 1:
-            make_excel(
-                state.resultsDict,
-                dpg.get_value(frontend.output_file_path),
-                OutputType.SINGLE_VOLT_FREQ,
-            )
-        elif len(state.voltage_list) == 1:
-            make_excel(
-                state.resultsDict,
-                dpg.get_value(frontend.output_file_path),
-                OutputType.SINGLE_VOLT,
-            )
-        elif len(state.freq_list) == 1:
-            make_excel(
-                state.resultsDict,
-                dpg.get_value(frontend.output_file_path),
-                OutputType.SINGLE_FREQ,
-            )
-        else:
-            make_excel(
-                state.resultsDict,
-                dpg.get_value(frontend.output_file_path),
-                OutputType.MULTI_VOLT_FREQ,
-            )
-
-        with open(dpg.get_value(frontend.output_file_path), "w") as write_file:
-            json.dump(state.resultsDict, write_file, indent=4)
-        if (
-            state.T_step == len(state.T_list) - 1
-            and state.volt_step == len(state.voltage_list) - 1
-            and state.freq_step == len(state.freq_list) - 1
-        ):
-            state.measurement_status = Status.FINISHED
+    dpg.configure_item(frontend.linkam_com_selector, items=com_selector)
+    dpg.configure_item(frontend.agilent_com_selector, items=usb_selector)
+    dpg.configure_item(frontend.oscilloscope_com_selector, items=usb_selector)
+    # pick the identified address for each instrument, the cached one if it
+    # answered
+    for role, address in (roles | known).items():
+        dpg.set_value(selectors[role], address)
 
-        else:
-            if (
-                state.volt_step == len(state.voltage_list) - 1
-                and state.freq_step == len(state.freq_list) - 1
-            ):
-                state.T_step += 1
-                state.freq_step = 0
-                state.volt_step = 0
-
-                T = state.T_list[state.T_step]
-                freq = state.freq_list[state.freq_step]
-                T_str = f"{state.T_step + 1}: {state.T_list[state.T_step]}"
-                state.resultsDict[
-                    f"{state.T_step + 1}: {state.T_list[state.T_step]}"
-                ] = dict()
-                freq_str = f"{state.freq_step + 1}: {freq}"
-                state.resultsDict[T_str] = dict()
-                state.resultsDict[T_str][freq_str] = dict()
-                state.resultsDict[T_str][freq_str]["volt"] = []
-                state.resultsDict[T_str][freq_str]["Cp"] = []
-                state.resultsDict[T_str][freq_str]["D"] = []
-                state.resultsDict[T_str][freq_str]["G"] = []
-                state.resultsDict[T_str][freq_str]["B"] = []
-                if instruments.oscilloscope:
-                    for i in range(dpg.get_value(frontend.num_averages)):
-                        state.resultsDict[T_str][freq_str][
-                            f"Ave. Transmission #{i + 1}"
-                        ] = []
-                instruments.agilent.set_voltage(0)
-
-                state.measurement_status = Status.SET_TEMPERATURE
-
-            elif state.volt_step == len(state.voltage_list) - 1:
-                state.freq_step += 1
-                state.volt_step = 0
-
-                T = state.T_list[state.T_step]
-                freq = state.freq_list[state.freq_step]
-
-                T_str = f"{state.T_step + 1}: {state.T_list[state.T_step]}"
-                freq_str = f"{state.freq_step + 1}: {freq}"
-
-                state.resultsDict[T_str][freq_str] = dict()
-                state.resultsDict[T_str][freq_str]["volt"] = []
-                state.resultsDict[T_str][freq_str]["Cp"] = []
-                state.resultsDict[T_str][freq_str]["D"] = []
-                state.resultsDict[T_str][freq_str]["G"] = []
-                state.resultsDict[T_str][freq_str]["B"] = []
-                if instruments.oscilloscope:
-                    for i in range(dpg.get_value(frontend.num_averages)):
-                        state.resultsDict[T_str][freq_str][
-                            f"Ave. Transmission #{i + 1}"
-                        ] = []
-                state.measurement_status = Status.TEMPERATURE_STABILISED
-            else:
-                state.volt_step += 1
-                state.measurement_status = Status.TEMPERATURE_STABILISED
-
-
-def parse_result(result: dict, state: lcd_state, frontend: lcd_ui) -> None:
-    T = state.T_list[state.T_step]
-    freq = state.freq_list[state.freq_step]
-
-    T_str = f"{state.T_step + 1}: {state.T_list[state.T_step]}"
-    freq_str = f"{state.freq_step + 1}: {freq}"
-
-    volt = state.voltage_list[state.volt_step]
-    state.resultsDict[T_str][freq_str]["volt"].append(volt)
-    state.resultsDict[T_str][freq_str]["Cp"].append(result["CPD"][0])
-    state.resultsDict[T_str][freq_str]["D"].append(result["CPD"][1])
-    state.resultsDict[T_str][freq_str]["G"].append(result["GB"][0])
-    state.resultsDict[T_str][freq_str]["B"].append(result["GB"][1])
-    if state.oscilloscope_connection_status == "Connected":
-        for i in range(len(result["averages"])):
-            state.resultsDict[T_str][freq_str][f"Ave. Transmission #{i + 1}"].append(
-                result["averages"][i]
-            )
+    dpg.set_value(frontend.measurement_status, "Found instruments!")
+    dpg.set_value(frontend.measurement_status, "Idle")
 
-    if len(state.voltage_list) == 1 and len(state.freq_list) == 1:
-        state.xdata.append(T)
-        state.ydata.append(state.resultsDict[T_str][freq_str]["Cp"][0])
-        dpg.configure_item(frontend.results_V_axis, label="T")
-    elif len(state.voltage_list) == 1:
-        state.xdata.append(freq)
-        state.ydata.append(state.resultsDict[T_str][freq_str]["Cp"][0])
-        dpg.configure_item(frontend.results_V_axis, label="freq (Hz)")
-    elif len(state.freq_list) == 1:
-        state.xdata = state.resultsDict[T_str][freq_str]["volt"]
-        state.ydata = state.resultsDict[T_str][freq_str]["Cp"]
-        dpg.configure_item(frontend.results_V_axis, label="voltage (V)")
-    dpg.set_value(frontend.results_plot, [state.xdata, state.ydata])
-
-    if len(state.ydata) > 0 and len(state.xdata) > 0:
-        dpg.set_axis_limits(
-            frontend.results_Cp_axis,
-            min(state.ydata) - 0.1 * min(state.ydata),
-            max(state.ydata) + 0.1 * max(state.ydata),
-        )
-        dpg.set_axis_limits(
-            frontend.results_V_axis,
-            min(state.xdata) - 0.1,
-            max(state.xdata) + 0.1,
-        )
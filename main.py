@@ -2,12 +2,18 @@ from lcdielectrics.lcd_utils import (
     find_instruments,
     lcd_instruments,
     lcd_state,
-    read_temperature,
     handle_measurement_status,
     connect_to_instrument_callback,
     start_measurement,
-    stop_measurement
+    stop_measurement,
+    record_empty_cell,
+    record_compensation,
+    add_to_queue,
+    remove_from_queue,
+    run_queue,
 )
+from lcdielectrics.lcd_queue import MeasurementQueue
+from lcdielectrics.lcd_sequencer import MeasurementSequencer
 from lcdielectrics.lcd_themes import generate_global_theme
 import dearpygui.dearpygui as dpg
 from lcdielectrics.lcd_ui import lcd_ui, VIEWPORT_WIDTH, DRAW_HEIGHT
@@ -50,6 +56,8 @@ def main():
     state = lcd_state()
     frontend = lcd_ui()
     instruments = lcd_instruments()
+    sequencer = MeasurementSequencer(state, instruments)
+    measurement_queue = MeasurementQueue(sequencer)
 
     dpg.bind_item_font(frontend.measurement_status, status_font)
     dpg.bind_item_font(frontend.status_label, status_font)
@@ -91,14 +99,47 @@ def main():
     )
     dpg.configure_item(
         frontend.start_button,
-        callback=lambda: start_measurement(state, frontend, instruments),
+        callback=lambda: start_measurement(
+            state, frontend, instruments, sequencer, measurement_queue
+        ),
     )
 
     dpg.configure_item(
         frontend.stop_button,
-        callback=lambda: stop_measurement(instruments, state, frontend),
+        callback=lambda: stop_measurement(sequencer, measurement_queue),
     )
 
+    dpg.configure_item(
+        frontend.add_to_queue_button,
+        callback=lambda: add_to_queue(frontend, measurement_queue),
+    )
+    dpg.configure_item(
+        frontend.remove_from_queue_button,
+        callback=lambda: remove_from_queue(frontend, measurement_queue),
+    )
+    dpg.configure_item(
+        frontend.run_queue_button,
+        callback=lambda: run_queue(state, measurement_queue),
+    )
+
+    dpg.configure_item(
+        frontend.record_empty_cell_button,
+        callback=lambda: threading.Thread(
+            target=record_empty_cell, args=(state, frontend, instruments), daemon=True
+        ).start(),
+    )
+
+    for standard, button in frontend.compensation_buttons.items():
+        dpg.configure_item(
+            button,
+            callback=lambda sender, app_data, standard: threading.Thread(
+                target=record_compensation,
+                args=(state, frontend, instruments, standard),
+                daemon=True,
+            ).start(),
+            user_data=standard,
+        )
+
     dpg.configure_item(
         frontend.go_to_temp_button,
         callback=lambda: instruments.linkam.set_temperature(
@@ -110,21 +151,12 @@ def main():
     dpg.bind_theme(generate_global_theme())
 
     # Search for instruments using a thread so GUI isn't blocked.
-    thread = threading.Thread(target=find_instruments, args=(frontend,))
-    thread.daemon = True
-    thread.start()
-
     find_instruments_thread(frontend)
 
-    linkam_thread = threading.Thread(
-        target=read_temperature, args=(frontend, instruments, state)
-    )
-    linkam_thread.daemon = True
     viewport_width = dpg.get_viewport_client_width()
     viewport_height = dpg.get_viewport_client_height()
 
     while dpg.is_dearpygui_running():
-        # check if linkam is connected. If it is, start thread to poll temperature.
         if (
             viewport_width != dpg.get_viewport_client_width()
             or viewport_height != dpg.get_viewport_client_height()
@@ -134,16 +166,18 @@ def main():
             viewport_height = dpg.get_viewport_client_height()
             frontend.draw_children(viewport_width, viewport_height)
 
+        # check if linkam is connected. If it is, start logging its temperature.
         if state.linkam_connection_status == "Connected":
-            linkam_thread.start()
+            sequencer.watch_temperature()
             state.linkam_connection_status = "Reading"
 
-        handle_measurement_status(state, frontend, instruments)
+        handle_measurement_status(state, frontend, instruments, measurement_queue)
 
         dpg.render_dearpygui_frame()
 
     dpg.destroy_context()
 
+    sequencer.shutdown()
     if instruments.linkam:
         instruments.linkam.stop()
         instruments.linkam.close()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from lcdielectrics import lcd_simulators
+from lcdielectrics.lcd_calibration import EmptyCellCalibration, record_empty_cell
+from lcdielectrics.lcd_results import ResultsCube
+from lcdielectrics.lcd_simulators import SimulatedAgilentSpectrometer, SimulatedRig
+
+C0 = 20e-12
+C_STRAY = 2e-12
+
+
+def test_permittivity():
+    calibration = EmptyCellCalibration.constant(C0, C_STRAY)
+    eps_real, eps_imag = calibration.permittivity(
+        [1e3, 1e4], [5 * C0 + C_STRAY, 3 * C0 + C_STRAY], [0.1, 0.2]
+    )
+    np.testing.assert_allclose(eps_real, [5.0, 3.0])
+    # the stray capacitance has no loss
+    np.testing.assert_allclose(
+        eps_imag, [0.1 * (5 + C_STRAY / C0), 0.2 * (3 + C_STRAY / C0)]
+    )
+
+
+def test_C0_interpolated_in_log_frequency():
+    calibration = EmptyCellCalibration([1e4, 1e2], [3e-11, 2e-11], 1e-11)
+    C0 = calibration.C0([1e2, 1e3, 1e4, 1e6, 1.0])
+    np.testing.assert_allclose(C0, [1e-11, 1.5e-11, 2e-11, 2e-11, 1e-11])
+
+
+def test_apply():
+    calibration = EmptyCellCalibration(
+        [1e2, 1e4], [C0 + C_STRAY, 2 * C0 + C_STRAY], C_STRAY
+    )
+    cube = ResultsCube([25.0], [1e2, 1e4], [1.0], ["Cp", "D"])
+    cube.set_point(0, 0, 0, {"Cp": 4 * C0 + C_STRAY, "D": 0.5})
+    cube.set_point(0, 1, 0, {"Cp": 4 * C0 + C_STRAY, "D": 0.5})
+    calibrated = calibration.apply(cube)
+    np.testing.assert_allclose(calibrated["eps'"][0, :, 0], [4.0, 2.0])
+    eps_imag = 0.5 * (4 * C0 + C_STRAY) / np.array([C0, 2 * C0])
+    np.testing.assert_allclose(calibrated["eps''"][0, :, 0], eps_imag)
+    # the original arrays are shared
+    assert calibrated["Cp"] is cube["Cp"]
+    assert "eps'" not in cube.quantities
+
+
+def test_round_trip(tmp_path):
+    calibration = EmptyCellCalibration([1e4, 1e2], [3e-11, 2e-11], 1e-11)
+    path = str(tmp_path / "results.cal.json")
+    calibration.save(path)
+    loaded = EmptyCellCalibration.load(path)
+    assert loaded.to_dict() == calibration.to_dict()
+    assert loaded.freq.tolist() == [1e2, 1e4]
+
+
+# the simulator also works out 1 / G, which is infinite for a lossless load
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_record_empty_cell(monkeypatch):
+    rig = SimulatedRig(latency_scale=0.0)
+    rig.agilent.fixture = "load"
+    rig.agilent.load_capacitance = C0
+    rig.agilent.stray_capacitance = C_STRAY
+    rig.agilent.noise = 0.0
+    monkeypatch.setattr(lcd_simulators, "_default_rig", rig)
+    agilent = SimulatedAgilentSpectrometer("SIM::E4980A::INSTR")
+    freq_list = [100.0, 1000.0, 10000.0]
+    calibration = record_empty_cell(agilent, freq_list, 1.0, C_STRAY)
+    assert calibration.freq.tolist() == freq_list
+    np.testing.assert_allclose(calibration.C0(freq_list), C0, rtol=1e-5)
+    assert calibration.C0([500.0])[0] == pytest.approx(C0, rel=1e-5)
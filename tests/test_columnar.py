@@ -0,0 +1,40 @@
+import numpy as np
+
+from lcdielectrics.lcd_columnar import ColumnarWriter, load_columns, parts_dir
+
+
+def row(i: int) -> dict:
+    return {"T_step": 0, "freq_step": i, "volt_step": 0, "freq": 100.0 * i, "Cp": i}
+
+
+def test_chunks_readable_during_run_and_joined_on_close(tmp_path):
+    path = str(tmp_path / "results.npz")
+    writer = ColumnarWriter(path, ["Cp"])
+    writer.chunk_rows = 2
+    writer.create()
+    for i in range(5):
+        writer.append(row(i))
+    # two complete chunks, the fifth row is still buffered
+    assert load_columns(path)["Cp"].tolist() == [0, 1, 2, 3]
+    assert load_columns(path)["freq_step"].dtype == np.int32
+    # a chunk left half written by a crash is never read
+    (parts_dir(path) / "00002.npz.tmp").write_bytes(b"PK")
+    assert load_columns(path)["Cp"].tolist() == [0, 1, 2, 3]
+
+    writer.close()
+    assert not parts_dir(path).exists()
+    columns = load_columns(path)
+    assert columns["Cp"].tolist() == [0, 1, 2, 3, 4]
+    assert np.isnan(columns["bias"]).all()
+
+
+def test_create_starts_a_new_file(tmp_path):
+    path = str(tmp_path / "results.npz")
+    writer = ColumnarWriter(path, ["Cp"])
+    writer.create()
+    writer.append(row(0))
+    writer.close()
+    writer.create()
+    writer.append(row(1))
+    writer.close()
+    assert load_columns(path)["Cp"].tolist() == [1]
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from lcdielectrics import lcd_simulators
+from lcdielectrics.lcd_compensation import (
+    CompensationTable,
+    compensation_path,
+    cpd_to_impedance,
+    impedance_to_cpd,
+    measure_standard,
+)
+from lcdielectrics.lcd_simulators import SimulatedAgilentSpectrometer, SimulatedRig
+
+FREQ = np.logspace(2, 6, 9)
+OMEGA = 2 * np.pi * FREQ
+
+
+def capacitor(C, D=0.0) -> np.ndarray:
+    return cpd_to_impedance(FREQ, C, D)
+
+
+def test_cpd_round_trip():
+    Cp, D = impedance_to_cpd(FREQ, capacitor(1e-10, 0.05))
+    np.testing.assert_allclose(Cp, 1e-10)
+    np.testing.assert_allclose(D, 0.05)
+    # a lossless capacitor is -j / (w C)
+    np.testing.assert_allclose(capacitor(1e-10), -1j / (OMEGA * 1e-10))
+
+
+def test_no_tables_leaves_impedance_unchanged():
+    table = CompensationTable(FREQ)
+    Z = capacitor(1e-10, 0.01)
+    np.testing.assert_array_equal(table.correct(Z), Z)
+    table.open = capacitor(1e-13)
+    np.testing.assert_array_equal(table.correct(Z), Z)
+
+
+def test_open_short():
+    # leads in series with the device and stray capacitance across it
+    Z_leads = 0.5 + 1j * OMEGA * 1e-7
+    Y_stray = 1j * OMEGA * 2e-12
+    Z = capacitor(1e-10, 0.02)
+    table = CompensationTable(FREQ)
+    table.open = Z_leads + 1 / Y_stray
+    table.short = Z_leads
+    measured = Z_leads + 1 / (Y_stray + 1 / Z)
+    np.testing.assert_allclose(table.correct(measured), Z, rtol=1e-6)
+    Cp, D = table.correct_cpd(*impedance_to_cpd(FREQ, measured))
+    np.testing.assert_allclose(Cp, 1e-10, rtol=1e-6)
+    np.testing.assert_allclose(D, 0.02, rtol=1e-4)
+
+
+def test_open_short_load_is_exact_for_any_fixture():
+    # the fixture as a general two port, Zm = (a Z + b) / (c Z + d)
+    rng = np.random.default_rng(0)
+    a, b, c, d = rng.normal(size=4) + 1j * rng.normal(size=4)
+
+    def fixture(Z):
+        return (a * Z + b) / (c * Z + d)
+
+    load = capacitor(1e-10)
+    table = CompensationTable(FREQ)
+    table.open = np.full(len(FREQ), a / c)
+    table.short = np.full(len(FREQ), b / d)
+    table.load = fixture(load)
+    table.load_standard = load
+    Z = capacitor(4.7e-10, 0.1)
+    np.testing.assert_allclose(table.correct(fixture(Z)), Z, rtol=1e-6)
+    # a subset of the frequencies
+    index = np.array([1, 4])
+    np.testing.assert_allclose(
+        table.correct(fixture(Z)[index], index), Z[index], rtol=1e-6
+    )
+
+
+def test_save_and_cached(tmp_path):
+    directory = str(tmp_path / "compensation")
+    assert CompensationTable.cached("fixture 1", list(FREQ), directory) is None
+    table = CompensationTable(FREQ)
+    table.open = capacitor(1e-13)
+    table.save(compensation_path("fixture 1", list(FREQ), directory))
+    cached = CompensationTable.cached("fixture 1", list(FREQ), directory)
+    np.testing.assert_array_equal(cached.open, table.open)
+    assert cached.has("open")
+    assert not cached.has("short")
+    # a different frequency list is a different table
+    assert CompensationTable.cached("fixture 1", list(FREQ[1:]), directory) is None
+
+
+# the simulator also works out 1 / G, which is infinite for lossless standards
+@pytest.mark.filterwarnings("ignore:divide by zero")
+def test_measured_standards_correct_the_simulated_fixture(tmp_path, monkeypatch):
+    rig = SimulatedRig(latency_scale=0.0)
+    simulator = rig.agilent
+    simulator.noise = 0.0
+    simulator.series_resistance = 2.0
+    simulator.series_inductance = 1e-6
+    simulator.stray_capacitance = 5e-12
+    monkeypatch.setattr(lcd_simulators, "_default_rig", rig)
+    agilent = SimulatedAgilentSpectrometer("SIM::E4980A::INSTR")
+    directory = str(tmp_path)
+    load_Cp = simulator.load_capacitance
+    for standard in ("open", "short", "load"):
+        simulator.fixture = standard
+        table = measure_standard(
+            agilent, standard, "cell", list(FREQ), 1.0, load_Cp, 0.0, directory
+        )
+    assert all(table.has(standard) for standard in ("open", "short", "load"))
+
+    simulator.fixture = "cell"
+    agilent.set_voltage(1.0)
+    cpd = agilent.sweep_freq_list("CPD", list(FREQ))
+    agilent.finish_list_sweep()
+    Cp, D = table.correct_cpd(cpd[:, 0], cpd[:, 1])
+    eps = simulator.permittivity(FREQ, 1.0, 25.0)
+    np.testing.assert_allclose(Cp, simulator.C0 * eps.real, rtol=1e-6)
+    np.testing.assert_allclose(D, -eps.imag / eps.real, rtol=1e-6)
@@ -0,0 +1,62 @@
+import re
+import zipfile
+
+import numpy as np
+import pytest
+
+from lcdielectrics import lcd_excel_writer
+from lcdielectrics.lcd_dataclasses import OutputType
+from lcdielectrics.lcd_excel_writer import make_excel
+from lcdielectrics.lcd_results import ResultsCube
+
+
+def sheet_rows(path: str) -> dict[str, int]:
+    # {sheet name: number of rows} in workbook order
+    with zipfile.ZipFile(path) as archive:
+        workbook = archive.read("xl/workbook.xml").decode()
+        names = re.findall(r'<sheet name="([^"]+)"', workbook)
+        rows = {}
+        for i, name in enumerate(names):
+            sheet = archive.read(f"xl/worksheets/sheet{i + 1}.xml").decode()
+            rows[name] = sheet.count("<row ")
+        return rows
+
+
+def filled_cube(nT: int, nf: int, nV: int) -> ResultsCube:
+    T = np.arange(nT) + 25.0
+    freq = 100.0 * (np.arange(nf) + 1)
+    cube = ResultsCube(T, freq, np.arange(nV) + 1.0, ["Cp"])
+    for index in np.ndindex(cube.shape):
+        cube.set_point(*index, {"Cp": float(sum(index))})
+    return cube
+
+
+def test_rows_spill_onto_new_sheets(tmp_path, monkeypatch):
+    monkeypatch.setattr(lcd_excel_writer, "MAX_ROWS", 5)
+    output = str(tmp_path / "results.json")
+    make_excel(filled_cube(12, 1, 1), output, OutputType.SINGLE_VOLT_FREQ)
+    # a heading and 12 temperatures
+    assert sheet_rows(str(tmp_path / "results.xlsx")) == {
+        "Multi T": 5,
+        "Multi T (2)": 5,
+        "Multi T (3)": 3,
+    }
+
+
+def test_voltage_blocks_are_not_split(tmp_path, monkeypatch):
+    # each frequency is a 4 row block and a blank row, two fit on a sheet
+    monkeypatch.setattr(lcd_excel_writer, "MAX_ROWS", 10)
+    output = str(tmp_path / "results.json")
+    make_excel(filled_cube(1, 3, 2), output, OutputType.MULTI_VOLT_FREQ)
+    assert sheet_rows(str(tmp_path / "results.xlsx")) == {
+        "1 - 25.0": 8,
+        "1 - 25.0 (2)": 4,
+    }
+
+
+def test_too_many_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(lcd_excel_writer, "MAX_COLUMNS", 3)
+    cube = ResultsCube([25.0], [100.0], [1.0], ["Cp", "D", "G", "B"])
+    cube.set_point(0, 0, 0, {"Cp": 1.0, "D": 2.0, "G": 3.0, "B": 4.0})
+    with pytest.raises(ValueError):
+        make_excel(cube, str(tmp_path / "results.json"), OutputType.SINGLE_VOLT)
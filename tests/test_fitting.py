@@ -0,0 +1,151 @@
+import json
+
+import numpy as np
+import pytest
+
+from lcdielectrics.lcd_fitting import (
+    EPS0,
+    FitWorker,
+    fit_cube,
+    fit_path,
+    fit_spectrum,
+    relaxation,
+)
+from lcdielectrics.lcd_results import ResultsCube
+
+FREQ = np.logspace(0, 7, 71)
+OMEGA = 2 * np.pi * FREQ
+# model: (eps_inf, delta_eps, tau, alpha, beta)
+TRUE = {
+    "Debye": (3.0, 10.0, 1e-4, 1.0, 1.0),
+    "Cole-Cole": (3.0, 10.0, 1e-4, 0.75, 1.0),
+    "HN": (3.0, 10.0, 1e-4, 0.8, 0.6),
+}
+
+
+def model_spectrum(eps_inf, delta_eps, tau, alpha, beta, kappa=0.0, omega=OMEGA):
+    # kappa is sigma / eps0
+    p = np.array([eps_inf, np.log10(delta_eps), np.log10(tau), alpha, beta, 0.0])
+    return relaxation(p, omega, False) - 1j * kappa / omega
+
+
+def assert_recovered(fit: dict, eps_inf, delta_eps, tau, alpha, beta) -> None:
+    assert fit["converged"]
+    assert fit["eps_inf"] == pytest.approx(eps_inf, rel=1e-4)
+    assert fit["delta_eps"] == pytest.approx(delta_eps, rel=1e-4)
+    assert fit["tau"] == pytest.approx(tau, rel=1e-4)
+    assert fit["alpha"] == pytest.approx(alpha, rel=1e-4)
+    assert fit["beta"] == pytest.approx(beta, rel=1e-4)
+
+
+def test_debye_closed_form():
+    eps_inf, delta_eps, tau = 3.0, 10.0, 1e-4
+    expected = eps_inf + delta_eps / (1 + 1j * OMEGA * tau)
+    np.testing.assert_allclose(
+        model_spectrum(eps_inf, delta_eps, tau, 1.0, 1.0), expected
+    )
+
+
+@pytest.mark.parametrize("model", list(TRUE))
+def test_fit_recovers_parameters(model):
+    fit = fit_spectrum(FREQ, model_spectrum(*TRUE[model]), model)
+    assert_recovered(fit, *TRUE[model])
+    assert fit["chi2"] < 1e-12
+    assert fit["sigma"] == 0.0
+
+
+def test_fit_with_conductivity():
+    kappa = 50.0
+    eps = model_spectrum(*TRUE["HN"], kappa=kappa)
+    fit = fit_spectrum(FREQ, eps, "HN", conductivity=True)
+    assert_recovered(fit, *TRUE["HN"])
+    assert fit["sigma"] == pytest.approx(kappa, rel=1e-4)
+
+
+def test_fit_from_guess():
+    fit = fit_spectrum(FREQ, model_spectrum(*TRUE["HN"]), "HN")
+    fit["permittivity"] = True
+    shifted = (3.0, 10.0, 2e-4, 0.8, 0.6)
+    refit = fit_spectrum(FREQ, model_spectrum(*shifted), "HN", guess=fit)
+    assert_recovered(refit, *shifted)
+
+
+def test_too_few_points():
+    eps = model_spectrum(*TRUE["HN"])
+    assert fit_spectrum(FREQ[:2], eps[:2], "HN") is None
+    # NaN points (not measured) are left out
+    eps[2:] = np.nan
+    assert fit_spectrum(FREQ, eps, "HN") is None
+
+
+C0 = 20e-12
+T_LIST = [30.0, 35.0, 40.0, 45.0, 50.0]
+VOLT_LIST = [0.5, 1.0]
+
+
+def tau_at(t: int, v: int) -> float:
+    return 1e-4 * 0.7**t * (1 + v)
+
+
+def capacitance_cube() -> ResultsCube:
+    # Cp and D of an empty cell C0 filled with an HN dielectric, whose tau
+    # falls with temperature and depends on the voltage
+    cube = ResultsCube(T_LIST, FREQ, VOLT_LIST, ["Cp", "D"])
+    for t in range(len(T_LIST)):
+        for v in range(len(VOLT_LIST)):
+            C = C0 * model_spectrum(3.0, 10.0, tau_at(t, v), 0.8, 0.6)
+            for f in range(len(FREQ)):
+                Cp = C[f].real
+                cube.set_point(t, f, v, {"Cp": Cp, "D": -C[f].imag / Cp})
+    return cube
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_fit_cube(workers):
+    # workers=2 fits in a ProcessPoolExecutor
+    fits = fit_cube(capacitance_cube(), "HN", workers=workers)
+    assert [(fit["T_step"], fit["volt_step"]) for fit in fits] == [
+        (t, v) for t in range(len(T_LIST)) for v in range(len(VOLT_LIST))
+    ]
+    for fit in fits:
+        assert fit["T"] == T_LIST[fit["T_step"]]
+        assert fit["volt"] == VOLT_LIST[fit["volt_step"]]
+        # capacitances, so eps_inf and delta_eps come out in F
+        assert not fit["permittivity"]
+        assert_recovered(
+            fit, 3.0 * C0, 10.0 * C0, tau_at(fit["T_step"], fit["volt_step"]), 0.8, 0.6
+        )
+    json.dumps(fits)
+
+
+def test_fit_cube_permittivity_sigma_in_S_per_m():
+    kappa = 50.0
+    cube = ResultsCube([30.0], FREQ, [1.0], ["Cp", "D", "eps'", "eps''"])
+    eps = model_spectrum(*TRUE["HN"], kappa=kappa)
+    for f in range(len(FREQ)):
+        values = {"Cp": 1.0, "D": 0.0, "eps'": eps[f].real, "eps''": -eps[f].imag}
+        cube.set_point(0, f, 0, values)
+    (fit,) = fit_cube(cube, "HN", conductivity=True, workers=1)
+    assert fit["permittivity"]
+    assert_recovered(fit, *TRUE["HN"])
+    assert fit["sigma"] == pytest.approx(kappa * EPS0, rel=1e-4)
+
+
+def test_fit_worker(tmp_path):
+    output = str(tmp_path / "results.json")
+    cube = capacitance_cube()
+    worker = FitWorker()
+    try:
+        worker.begin(output, "HN", False, None)
+        for t in range(len(T_LIST)):
+            worker.submit(cube, t)
+        worker.flush()
+    finally:
+        worker.stop()
+    with open(fit_path(output)) as f:
+        fits = json.load(f)
+    assert len(fits) == len(T_LIST) * len(VOLT_LIST)
+    for fit in fits:
+        assert_recovered(
+            fit, 3.0 * C0, 10.0 * C0, tau_at(fit["T_step"], fit["volt_step"]), 0.8, 0.6
+        )
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from lcdielectrics.lcd_freedericksz import EPS0, cv_analysis, freedericksz
+from lcdielectrics.lcd_results import ResultsCube
+
+EPS_PERP = 5.0
+EPS_PAR = 15.0
+VTH = 1.0
+K_RATIO = 1.5
+VOLT = np.array([0.2, 0.4, 0.6, 0.8, 0.9, 1.1, 1.2, 1.3, 1.4, 2.0, 3.0, 5.0, 10.0])
+
+
+def cv_curve(scale: float = 1.0) -> np.ndarray:
+    # the linear rise just above Vth, eps_par - a / V from 3 Vth, and a line
+    # between them, which the analysis shouldn't use
+    gamma = EPS_PAR / EPS_PERP - 1
+    rise = 1 + 2 * gamma * (VOLT / VTH - 1) / (1 + (K_RATIO - 1) + gamma)
+    eps = np.where(VOLT <= VTH, EPS_PERP, EPS_PERP * rise)
+    eps = np.where(VOLT >= 3 * VTH, EPS_PAR - 6.0 / VOLT, eps)
+    eps[VOLT == 2.0] = 11.0
+    return scale * eps
+
+
+def test_recovers_known_curve():
+    curves = np.stack([cv_curve(), cv_curve(2.0)])
+    # a point that wasn't measured
+    curves[1, 1] = np.nan
+    analysis = freedericksz(VOLT, curves)
+    np.testing.assert_allclose(analysis["Vth"], VTH)
+    np.testing.assert_allclose(analysis["eps_perp"], [EPS_PERP, 2 * EPS_PERP])
+    np.testing.assert_allclose(analysis["eps_par"], [EPS_PAR, 2 * EPS_PAR])
+    np.testing.assert_allclose(analysis["K33/K11"], K_RATIO)
+    K11 = EPS0 * (EPS_PAR - EPS_PERP) * VTH**2 / np.pi**2
+    np.testing.assert_allclose(analysis["K11"], [K11, 2 * K11])
+    np.testing.assert_allclose(analysis["K33"], [K_RATIO * K11, 2 * K_RATIO * K11])
+
+
+def test_capacitance_has_no_elastic_constants():
+    analysis = freedericksz(VOLT, cv_curve(1e-12), permittivity=False)
+    assert analysis["Vth"] == pytest.approx(VTH)
+    assert analysis["K33/K11"] == pytest.approx(K_RATIO)
+    assert np.isnan(analysis["K11"])
+    assert np.isnan(analysis["K33"])
+
+
+def test_cv_analysis():
+    # voltages out of order, as a list sweep might have them
+    order = np.arange(len(VOLT))[::-1]
+    cube = ResultsCube([25.0, 30.0], [1000.0], VOLT[order], ["Cp", "D"])
+    for t in range(2):
+        for v, value in enumerate(cv_curve(1e-12 * (1 + t))[order]):
+            cube.set_point(t, 0, v, {"Cp": value, "D": 0.0})
+    analysis = cv_analysis(cube)
+    assert analysis["T"].tolist() == [[25.0], [30.0]]
+    assert analysis["freq"].tolist() == [[1000.0], [1000.0]]
+    np.testing.assert_allclose(analysis["Vth"], VTH)
+    np.testing.assert_allclose(analysis["eps_perp"], [[5e-12], [10e-12]])
+    assert np.isnan(analysis["K11"]).all()
+
+
+def test_too_few_voltages():
+    cube = ResultsCube([25.0], [1000.0], [0.5, 1.0, 2.0], ["Cp", "D"])
+    assert cv_analysis(cube) is None
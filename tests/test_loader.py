@@ -0,0 +1,156 @@
+import json
+
+import numpy as np
+import pytest
+
+from lcdielectrics import lcd_excel_writer, lcd_loader
+from lcdielectrics.lcd_columnar import ColumnarWriter
+from lcdielectrics.lcd_dataclasses import OutputType
+from lcdielectrics.lcd_excel_writer import make_excel
+from lcdielectrics.lcd_loader import cache_dir, load_results
+from lcdielectrics.lcd_results import ResultsCube
+from lcdielectrics.lcd_store import ResultsStore
+
+
+def filled_cube(nf: int = 2, nV: int = 3) -> ResultsCube:
+    cube = ResultsCube(
+        [25.0, 30.0, 35.0],
+        100.0 * (np.arange(nf) + 1),
+        np.arange(nV) + 1.0,
+        ["Cp", "D"],
+    )
+    for t, f, v in np.ndindex(cube.shape):
+        cube.set_point(t, f, v, {"Cp": t + f / 10 + v / 100, "D": 0.01 * v})
+    # a failed read is measured but NaN
+    cube.data["D"][1, 0, 0] = np.nan
+    return cube
+
+
+def write_json(cube: ResultsCube, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(cube.to_dict(), f)
+
+
+def write_jsonl(cube: ResultsCube, path: str) -> None:
+    store = ResultsStore(path)
+    store.create(
+        {
+            "T_list": cube.T.tolist(),
+            "freq_list": cube.freq.tolist(),
+            "voltage_list": cube.volt.tolist(),
+            "columns": ["volt"] + cube.quantities,
+        }
+    )
+    for t, f, v in zip(*np.nonzero(cube.measured)):
+        point = {"T_step": int(t), "freq_step": int(f), "volt_step": int(v)}
+        point["values"] = {q: float(cube[q][t, f, v]) for q in cube.quantities}
+        store.append_point(point)
+    store.close()
+
+
+def write_npz(cube: ResultsCube, path: str) -> None:
+    writer = ColumnarWriter(path, cube.quantities)
+    writer.chunk_rows = 5
+    writer.create()
+    for t, f, v in zip(*np.nonzero(cube.measured)):
+        row = {"T_step": t, "freq_step": f, "volt_step": v}
+        row.update(T=cube.T[t], freq=cube.freq[f], volt=cube.volt[v])
+        row.update({q: cube[q][t, f, v] for q in cube.quantities})
+        writer.append(row)
+    writer.close()
+
+
+def write_xlsx(cube: ResultsCube, path: str) -> None:
+    make_excel(cube, path.replace(".xlsx", ".json"), output_type(cube))
+
+
+def output_type(cube: ResultsCube) -> OutputType:
+    if len(cube.volt) == 1:
+        if len(cube.freq) == 1:
+            return OutputType.SINGLE_VOLT_FREQ
+        return OutputType.SINGLE_VOLT
+    return OutputType.MULTI_VOLT_FREQ
+
+
+WRITERS = {
+    ".json": write_json,
+    ".jsonl": write_jsonl,
+    ".npz": write_npz,
+    ".xlsx": write_xlsx,
+}
+
+
+def assert_same(loaded: ResultsCube, cube: ResultsCube) -> None:
+    np.testing.assert_array_equal(loaded.T, cube.T)
+    np.testing.assert_array_equal(loaded.freq, cube.freq)
+    np.testing.assert_array_equal(loaded.volt, cube.volt)
+    np.testing.assert_array_equal(loaded.measured, cube.measured)
+    for quantity in cube.quantities:
+        # workbooks keep 15 significant figures
+        np.testing.assert_allclose(loaded[quantity], cube[quantity], rtol=1e-14)
+
+
+@pytest.mark.parametrize("suffix", list(WRITERS))
+@pytest.mark.parametrize("shape", [(2, 3), (2, 1), (1, 1)])
+def test_round_trip(tmp_path, suffix, shape):
+    cube = filled_cube(*shape)
+    path = str(tmp_path / f"results{suffix}")
+    WRITERS[suffix](cube, path)
+    assert_same(load_results(path), cube)
+    # again from the cache
+    assert cache_dir(path).is_dir()
+    assert_same(load_results(path), cube)
+
+
+@pytest.mark.parametrize("shape", [(2, 3), (2, 1), (1, 1)])
+@pytest.mark.parametrize("max_rows", [2, 3])
+def test_round_trip_spilled_sheets(tmp_path, monkeypatch, shape, max_rows):
+    # small enough to split blocks and headings across sheets
+    monkeypatch.setattr(lcd_excel_writer, "MAX_ROWS", max_rows)
+    cube = filled_cube(*shape)
+    path = str(tmp_path / "results.xlsx")
+    write_xlsx(cube, path)
+    names = [name for name, _ in lcd_loader.read_sheets(path)]
+    assert any(name.endswith(" (2)") for name in names)
+    assert_same(load_results(path, use_cache=False), cube)
+
+
+def test_select(tmp_path):
+    cube = filled_cube()
+    path = str(tmp_path / "results.json")
+    write_json(cube, path)
+    selected = load_results(path, T=slice(28, 40), freq=[200.0])
+    assert selected.T.tolist() == [30.0, 35.0]
+    assert selected.freq.tolist() == [200.0]
+    np.testing.assert_array_equal(selected["Cp"], cube["Cp"][1:, 1:])
+
+
+def test_cache_not_written(tmp_path, monkeypatch):
+    # e.g. a read only folder
+    monkeypatch.setattr(lcd_loader, "write_cache", lambda path, cube: None)
+    cube = filled_cube()
+    path = str(tmp_path / "results.json")
+    write_json(cube, path)
+    assert_same(load_results(path), cube)
+
+
+def test_cache_not_replaced(tmp_path, monkeypatch):
+    # Windows refuses to replace a cache another load has memory mapped
+    def replace(source, destination):
+        raise PermissionError("in use")
+
+    monkeypatch.setattr(lcd_loader.os, "replace", replace)
+    cube = filled_cube()
+    path = str(tmp_path / "results.json")
+    write_json(cube, path)
+    assert_same(load_results(path), cube)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_stale_cache(tmp_path):
+    path = str(tmp_path / "results.json")
+    write_json(filled_cube(), path)
+    load_results(path)
+    cube = filled_cube(nV=2)
+    write_json(cube, path)
+    assert_same(load_results(path), cube)
@@ -0,0 +1,92 @@
+from lcdielectrics.lcd_dataclasses import measurement_settings
+from lcdielectrics.lcd_queue import (
+    JobStatus,
+    measurement_job,
+    next_segment,
+    plan_visits,
+)
+
+
+def make_job(job_id: int, temperatures: list[float], done: int = 0):
+    # a job visiting its temperatures as listed, the first done measured
+    settings = measurement_settings(temperature_list=temperatures)
+    order = list(range(len(temperatures)))
+    return measurement_job(settings, job_id, order, next_position=done)
+
+
+def summary(visits) -> list[tuple[float, list[tuple[int, int]]]]:
+    return [
+        (visit.T, [(job.id, step) for job, step in visit.steps]) for visit in visits
+    ]
+
+
+def test_shared_temperatures_are_visited_once():
+    a = make_job(0, [30, 40, 50])
+    b = make_job(1, [40, 50, 60])
+    assert summary(plan_visits([a, b])) == [
+        (30, [(0, 0)]),
+        (40, [(0, 1), (1, 0)]),
+        (50, [(0, 2), (1, 1)]),
+        (60, [(1, 2)]),
+    ]
+
+
+def test_each_job_keeps_its_own_order():
+    a = make_job(0, [50, 30])
+    b = make_job(1, [30, 50])
+    assert summary(plan_visits([a, b])) == [
+        (50, [(0, 0)]),
+        (30, [(0, 1), (1, 0)]),
+        (50, [(1, 1)]),
+    ]
+
+
+def test_job_waiting_at_the_current_temperature_goes_first():
+    a = make_job(0, [30, 40])
+    b = make_job(1, [40, 50])
+    visits = plan_visits([a, b], current_T=40)
+    assert summary(visits) == [
+        (40, [(1, 0)]),
+        (30, [(0, 0)]),
+        (40, [(0, 1)]),
+        (50, [(1, 1)]),
+    ]
+    assert next_segment(visits) == (b, 0)
+
+
+def test_measured_and_finished_jobs_are_left_out():
+    a = make_job(0, [30, 40, 50], done=2)
+    b = make_job(1, [30, 40])
+    b.status = JobStatus.DONE
+    c = make_job(2, [30])
+    c.status = JobStatus.FAILED
+    assert summary(plan_visits([a, b, c])) == [(50, [(0, 2)])]
+    assert plan_visits([b, c]) == []
+    assert next_segment([]) is None
+
+
+def test_next_segment():
+    a = make_job(0, [30, 35, 40, 50])
+    b = make_job(1, [40, 50, 60])
+    # a runs alone up to 35, then stops holding at 40 for b
+    assert next_segment(plan_visits([a, b])) == (a, 1)
+    a.next_position = 2
+    # a shared temperature is its own segment
+    assert next_segment(plan_visits([a, b])) == (a, 2)
+    a.next_position = 3
+    assert next_segment(plan_visits([a, b], current_T=40)) == (b, 0)
+    b.next_position = 1
+    assert next_segment(plan_visits([a, b])) == (a, 3)
+    a.status = JobStatus.DONE
+    assert next_segment(plan_visits([a, b])) == (b, 2)
+
+
+def test_planned_order_is_followed():
+    settings = measurement_settings(temperature_list=[30, 50, 40])
+    a = measurement_job(settings, 0, [0, 2, 1])
+    b = make_job(1, [40])
+    assert summary(plan_visits([a, b])) == [
+        (30, [(0, 0)]),
+        (40, [(0, 1), (1, 0)]),
+        (50, [(0, 2)]),
+    ]
@@ -0,0 +1,72 @@
+import json
+
+import numpy as np
+
+from lcdielectrics.lcd_results import ResultsCube
+
+
+def make_cube() -> ResultsCube:
+    return ResultsCube(
+        [25.0, 30.0], [100.0, 1000.0, 10000.0], [0.5, 1.0], ["Cp", "D"]
+    )
+
+
+def test_new_cube_is_unmeasured_nan():
+    cube = make_cube()
+    assert cube.shape == (2, 3, 2)
+    assert np.isnan(cube["Cp"]).all()
+    assert not cube.measured.any()
+    assert cube.to_dict() == {}
+
+
+def test_set_point_marks_measured():
+    cube = make_cube()
+    cube.set_point(1, 2, 0, {"Cp": 1e-9, "D": 0.01})
+    assert cube["Cp"][1, 2, 0] == 1e-9
+    assert cube.measured.sum() == 1
+    assert cube.measured[1, 2, 0]
+
+
+def test_to_dict_layout():
+    cube = make_cube()
+    cube.set_point(0, 1, 0, {"Cp": 1.0, "D": 2.0})
+    cube.set_point(0, 1, 1, {"Cp": 3.0, "D": 4.0})
+    assert cube.to_dict() == {
+        "1: 25.0": {
+            "2: 1000.0": {"volt": [0.5, 1.0], "Cp": [1.0, 3.0], "D": [2.0, 4.0]}
+        }
+    }
+
+
+def test_to_dict_writes_nan_as_null():
+    cube = make_cube()
+    cube.set_point(0, 0, 0, {"Cp": np.nan, "D": 1.0})
+    results = cube.to_dict()
+    assert results["1: 25.0"]["1: 100.0"]["Cp"] == [None]
+    # strict JSON, no NaN
+    json.dumps(results, allow_nan=False)
+
+
+def test_from_records():
+    header = {
+        "T_list": [25.0],
+        "freq_list": [100.0, 1000.0],
+        "voltage_list": [1.0],
+        "columns": ["volt", "Cp"],
+    }
+    points = [{"T_step": 0, "freq_step": 1, "volt_step": 0, "values": {"Cp": 5.0}}]
+    cube = ResultsCube.from_records(header, points)
+    assert cube.quantities == ["Cp"]
+    assert cube["Cp"][0, 1, 0] == 5.0
+    assert cube.measured.sum() == 1
+
+
+def test_select():
+    cube = make_cube()
+    cube.set_point(1, 2, 1, {"Cp": 7.0, "D": 8.0})
+    selected = cube.select([1], [2])
+    assert selected.shape == (1, 1, 2)
+    assert selected.T.tolist() == [30.0]
+    assert selected.freq.tolist() == [10000.0]
+    assert selected["Cp"][0, 0, 1] == 7.0
+    assert selected.measured[0, 0].tolist() == [False, True]
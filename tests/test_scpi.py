@@ -0,0 +1,65 @@
+import pytest
+
+from lcdielectrics.lcd_scpi import ScpiCache
+
+
+class FakeResource:
+    def __init__(self) -> None:
+        self.written: list[str] = []
+        self.fail = False
+
+    def write(self, command: str) -> None:
+        if self.fail:
+            raise OSError("VI_ERROR_TMO")
+        self.written.append(command)
+
+    def read(self) -> str:
+        return "1"
+
+
+def test_repeated_setting_is_skipped():
+    resource = FakeResource()
+    cache = ScpiCache(resource)
+    cache.set(":VOLT", 1.0)
+    cache.set(":VOLT", 1.0)
+    cache.set(":VOLT", 2.0)
+    assert resource.written == [":VOLT 1.0", ":VOLT 2.0"]
+    assert cache.writes_skipped == 1
+
+
+def test_batch_joins_commands():
+    resource = FakeResource()
+    cache = ScpiCache(resource)
+    with cache.batch():
+        cache.set(":FREQ", 1000)
+        cache.set(":FREQ", 1000)
+        cache.write(":TRIG")
+    assert resource.written == [":FREQ 1000;:TRIG"]
+    assert cache.stats()["writes_saved"] == 2
+
+
+def test_failed_write_is_not_cached():
+    resource = FakeResource()
+    cache = ScpiCache(resource)
+    cache.set(":VOLT", 1.0)
+    resource.fail = True
+    with pytest.raises(OSError):
+        cache.set(":VOLT", 2.0)
+    # the instrument may still be at 1.0 (or 2.0), so 1.0 is sent again
+    resource.fail = False
+    cache.set(":VOLT", 1.0)
+    assert resource.written == [":VOLT 1.0", ":VOLT 1.0"]
+
+
+def test_failed_batch_forgets_its_settings():
+    resource = FakeResource()
+    cache = ScpiCache(resource)
+    resource.fail = True
+    with pytest.raises(OSError):
+        with cache.batch():
+            cache.set(":FREQ", 1000)
+            cache.set(":VOLT", 1.0)
+    resource.fail = False
+    cache.set(":FREQ", 1000)
+    assert resource.written == [":FREQ 1000"]
+    assert not cache.pending
@@ -0,0 +1,84 @@
+import numpy as np
+
+from lcdielectrics.lcd_dataclasses import measurement_settings
+from lcdielectrics.lcd_stability import check_stability, window_statistics
+
+SETPOINT = 50.0
+TOLERANCE = 0.1
+
+
+def adaptive() -> measurement_settings:
+    return measurement_settings(
+        stability_mode="Adaptive",
+        stability_window=30.0,
+        stability_slope=0.05,
+        stability_std=0.05,
+        stability_min_wait=10.0,
+        stability_max_wait=600.0,
+    )
+
+
+def log(duration: float, temperature, interval: float = 0.5):
+    times = np.arange(0.0, duration + interval / 2, interval)
+    return times.tolist(), np.broadcast_to(temperature(times), times.shape).tolist()
+
+
+def test_window_statistics_of_a_line():
+    times, temps = log(60.0, lambda t: 20.0 + 0.01 * t)
+    slope, std, mean, n = window_statistics(times, temps, 30.0)
+    assert np.isclose(slope, 0.6)
+    assert std < 1e-9
+    assert np.isclose(mean, 20.0 + 0.01 * 45.0)
+    assert n == 61
+
+
+def test_fixed_waits_stab_time():
+    settings = measurement_settings(stability_mode="Fixed", stab_time=5.0)
+    assert check_stability([], [], 4.0, settings, SETPOINT, TOLERANCE) is None
+    decision = check_stability([], [], 5.0, settings, SETPOINT, TOLERANCE)
+    assert decision == {"reason": "fixed", "waited": 5.0}
+
+
+def test_stable():
+    times, temps = log(40.0, lambda t: SETPOINT + 0.001 * np.sin(t))
+    decision = check_stability(times, temps, 40.0, adaptive(), SETPOINT, TOLERANCE)
+    assert decision["reason"] == "stable"
+    assert abs(decision["offset"]) < 0.01
+    assert decision["samples"] == 61
+
+
+def test_not_before_min_wait():
+    times, temps = log(40.0, lambda t: SETPOINT)
+    assert check_stability(times, temps, 5.0, adaptive(), SETPOINT, TOLERANCE) is None
+
+
+def test_flat_but_overshot_is_not_stable():
+    # settled 0.3 C past the setpoint, e.g. after an overshoot
+    times, temps = log(40.0, lambda t: SETPOINT + 0.3)
+    assert check_stability(times, temps, 40.0, adaptive(), SETPOINT, TOLERANCE) is None
+    decision = check_stability(times, temps, 600.0, adaptive(), SETPOINT, TOLERANCE)
+    assert decision["reason"] == "timeout"
+    assert np.isclose(decision["offset"], 0.3)
+
+
+def test_insufficient_coverage_waits():
+    # readings only span 20 s of the 30 s window
+    times, temps = log(20.0, lambda t: SETPOINT)
+    assert window_statistics(times, temps, 30.0) is None
+    assert check_stability(times, temps, 40.0, adaptive(), SETPOINT, TOLERANCE) is None
+
+
+def test_timeout_without_coverage():
+    times, temps = log(20.0, lambda t: SETPOINT)
+    decision = check_stability(times, temps, 600.0, adaptive(), SETPOINT, TOLERANCE)
+    assert decision["reason"] == "timeout"
+    assert decision["slope"] is None
+    assert decision["samples"] == 0
+
+
+def test_drifting_times_out():
+    times, temps = log(40.0, lambda t: SETPOINT - 0.05 + 0.2 * t / 60)
+    assert check_stability(times, temps, 40.0, adaptive(), SETPOINT, TOLERANCE) is None
+    decision = check_stability(times, temps, 600.0, adaptive(), SETPOINT, TOLERANCE)
+    assert decision["reason"] == "timeout"
+    assert np.isclose(decision["slope"], 0.2)
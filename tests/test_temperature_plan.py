@@ -0,0 +1,85 @@
+import pytest
+
+from lcdielectrics.lcd_dataclasses import measurement_settings
+from lcdielectrics.lcd_temperature_plan import (
+    SETTLE_TIME,
+    approach_waypoint,
+    format_duration,
+    plan_order,
+    plan_run,
+    predicted_time,
+)
+
+
+def visit_time(ramp: float, rate: float = 10.0, stab_time: float = 5.0) -> float:
+    return ramp / rate * 60 + SETTLE_TIME + stab_time
+
+
+def test_predicted_time():
+    time = predicted_time([30, 40], [0, 1], 20, 10.0, 5.0)
+    assert time == pytest.approx(visit_time(10) + visit_time(10))
+
+
+def test_repeated_setpoint_is_stabilised_once():
+    time = predicted_time([30, 30, 40], [0, 1, 2], 20, 10.0, 5.0)
+    assert time == pytest.approx(visit_time(10) + visit_time(10))
+
+
+def test_predicted_time_with_approach():
+    # 20 -> 32 -> 30, then 30 -> 42 -> 40
+    time = predicted_time([30, 40], [0, 1], 20, 10.0, 5.0, "From above")
+    assert time == pytest.approx(2 * visit_time(14))
+
+
+def test_approach_waypoint():
+    assert approach_waypoint(30, 20, "Any") is None
+    assert approach_waypoint(30, 20, "From above") == 32
+    assert approach_waypoint(30, 40, "From above") is None
+    assert approach_waypoint(30, 40, "From below") == 28
+    assert approach_waypoint(30, 30, "From below") == 28
+
+
+def test_as_listed():
+    assert plan_order([50, 30, 40], 60, "As listed") == [0, 1, 2]
+    assert plan_order([], 60, "Fastest") == []
+
+
+@pytest.mark.parametrize(
+    "start_T, approach, order",
+    [
+        (20, "Any", [0, 1, 2]),
+        (60, "Any", [2, 1, 0]),
+        (41, "Any", [2, 1, 0]),
+        # from below, coming back down to 40 and 30 costs a detour each
+        (41, "From below", [0, 1, 2]),
+    ],
+)
+def test_fastest(start_T, approach, order):
+    assert plan_order([30, 40, 50], start_T, "Fastest", approach) == order
+
+
+def test_fastest_keeps_repeats_in_listed_order():
+    assert plan_order([40, 30, 40, 50], 60, "Fastest") == [3, 0, 2, 1]
+
+
+def test_plan_run():
+    settings = measurement_settings(
+        temperature_list=[30, 40, 50.2],
+        temperature_order="Fastest",
+        T_rate=10.0,
+        stab_time=0.0,
+    )
+    order, listed_time, planned_time = plan_run(settings, 55)
+    assert order == [2, 1, 0]
+    # 55 -> 30 -> 40 -> 50 against 55 -> 50 -> 40 -> 30
+    step = visit_time(10, stab_time=0)
+    assert listed_time == pytest.approx(visit_time(25, stab_time=0) + 2 * step)
+    assert planned_time == pytest.approx(visit_time(5, stab_time=0) + 2 * step)
+    # an order saved with the settings is kept
+    settings.T_order = [1, 0, 2]
+    assert plan_run(settings, 55)[0] == [1, 0, 2]
+
+
+def test_format_duration():
+    assert format_duration(600) == "10 min"
+    assert format_duration(3660) == "1 h 01 min"